@@ -24,6 +24,10 @@ export function activate(context: vscode.ExtensionContext) {
 
   const clientOptions: LanguageClientOptions = {
     documentSelector: [{ scheme: "file", language: "scl" }],
+    synchronize: {
+      // Keeps the server's workspace symbol index up to date
+      fileEvents: vscode.workspace.createFileSystemWatcher("**/*.scl"),
+    },
     outputChannel: vscode.window.createOutputChannel("SCL Language Server"),
   };
 
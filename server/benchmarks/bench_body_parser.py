@@ -0,0 +1,206 @@
+"""Cost of building the statement tree and checking it on growing synthetic sources.
+
+    python server/benchmarks/bench_body_parser.py [--lines 50000] [--baseline OLD/server/scl_server]
+
+For each size this prints the per-line cost of a full parse, of the
+statement checks running on the tree, and of re-parsing after a one-line
+edit in the middle of the body. The per-line cost of the full path should
+stay flat as the file grows, including the pathological case of many
+multi-line calls whose closing line is missing. Garbage collection is
+paused while timing, as timeit does. It also checks that the parser
+recovers from those calls: one missing ')' error per call, and every
+statement after one parsed on its own, as in the well-formed source.
+
+With --baseline the statement checks are timed on the same sources against
+the server sources of another checkout, for a before/after comparison:
+building the tree and walking it, or the line-scanning checks of
+checkouts from before the syntax tree.
+"""
+import argparse
+import gc
+import inspect
+import json
+import os
+import subprocess
+import sys
+import time
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+SERVER = os.path.join(BENCHMARKS, "..", "scl_server")
+
+
+def best_of(repeat: int, function, *args) -> float:
+    best = float("inf")
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function(*args)
+            best = min(best, time.perf_counter() - start)
+    finally:
+        gc.enable()
+    return best
+
+
+def parsed_source(lines: int, unclosed_calls: bool):
+    from lexer import LexedDocument
+    from parser_structured import StructuredSCLParser
+    from synthetic import generate_source
+
+    lexed = LexedDocument.from_text(generate_source(lines, unclosed_calls=unclosed_calls))
+    parser = StructuredSCLParser()
+    parser.parse_lexed(lexed)
+    return lexed, parser
+
+
+def run_checks(tree, lexed, parser):
+    from diagnostics import check_blocks, check_statements
+
+    check_statements(tree, parser.variables, parser.all_nodes, frozenset())
+    check_blocks(tree, lexed)
+
+
+def measure(lines: int, unclosed_calls: bool, repeat: int) -> tuple[int, float, float, float]:
+    import diagnostics  # noqa: F401, imported here so run_checks() doesn't time it
+    from parser_body import SyntaxTree
+
+    lexed, parser = parsed_source(lines, unclosed_calls)
+    tree = SyntaxTree.from_lexed(lexed)
+
+    parse = best_of(repeat, SyntaxTree.from_lexed, lexed)
+    checks = best_of(repeat, run_checks, tree, lexed, parser)
+
+    # Insert a statement after a top-level statement in the middle of the body
+    middle = tree.lines[len(tree.lines) // 2]
+    edited_lines = lexed.lines[:middle] + ["    qVar00000 := 1;\n"] + lexed.lines[middle:]
+    edited, window = lexed.edited(edited_lines, middle, middle, middle + 1)
+    incremental = best_of(repeat, tree.edited, edited, *window)
+    return len(lexed.lines), parse, checks, incremental
+
+
+def recovery_errors(lines: int) -> list[str]:
+    """What differs from the expected recovery from the unclosed calls of a source."""
+    from diagnostics import check_statements
+    from parser_body import SyntaxTree
+
+    counts = []
+    for unclosed in (False, True):
+        lexed, parser = parsed_source(lines, unclosed)
+        tree = SyntaxTree.from_lexed(lexed)
+        statements = sum(node.kind == "ASSIGN" for node, _ in tree.walk())
+        diagnostics = check_statements(tree, parser.variables, parser.all_nodes, frozenset())
+        counts.append((statements, [d for d in diagnostics if d.message.startswith("Missing closing parenthesis")]))
+    errors = []
+    (statements, _), (unclosed_statements, missing) = counts
+    if unclosed_statements != statements:
+        errors.append(f"{statements - unclosed_statements} assignments swallowed by unclosed calls")
+    calls = sum(line.lstrip().startswith("//  PT :=") for line in lexed.lines)
+    if len(missing) != calls:
+        errors.append(f"{len(missing)} missing ')' errors for {calls} unclosed calls")
+    return errors
+
+
+def statement_checks():
+    """(parse, check) functions of the imported server: parse(lexed) builds the
+    syntax tree, None before it existed, and check(tree, lexed, parser) runs
+    all statement checks."""
+    import diagnostics
+    try:
+        from parser_body import SyntaxTree
+    except ImportError:
+        def scan(tree, lexed, parser):
+            diagnostics.check_assignments(lexed, set(parser.variables), parser)
+            diagnostics.check_if_blocks(lexed)
+        return lambda lexed: None, scan
+
+    if "nodes" in inspect.signature(diagnostics.check_statements).parameters:
+        return SyntaxTree.from_lexed, run_checks
+
+    def walk(tree, lexed, parser):
+        diagnostics.check_statements(tree, parser)
+        diagnostics.check_blocks(tree, lexed)
+    return SyntaxTree.from_lexed, walk
+
+
+def measure_checks(sizes: list[int], repeat: int) -> dict:
+    """Label -> [[lines, parse seconds, check seconds], ...] of statement_checks()
+    on the sources of every size."""
+    parse, check = statement_checks()
+    results = {}
+    for unclosed in (False, True):
+        label = "unclosed calls" if unclosed else "well-formed"
+        results[label] = []
+        for size in sizes:
+            lexed, parser = parsed_source(size, unclosed)
+            tree = parse(lexed)
+            results[label].append([
+                len(lexed.lines), best_of(repeat, parse, lexed), best_of(repeat, check, tree, lexed, parser),
+            ])
+    return results
+
+
+def compare(args, sizes: list[int]) -> int:
+    results = []
+    for server in (args.baseline, args.server):
+        # A fresh interpreter per tree, so neither sees the other's modules
+        output = subprocess.run(
+            [sys.executable, __file__, "--json", "--server", server, "--repeat", str(args.repeat),
+             "--sizes", ",".join(map(str, sizes))],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        results.append(json.loads(output))
+    for label, baseline in results[0].items():
+        for before, after in zip(baseline, results[1][label]):
+            count = before[0]
+            print(
+                f"{label:15} {count:7d} lines  baseline parse {before[1] * 1000:7.1f} ms  checks {before[2] * 1000:7.1f} ms"
+                f"  current parse {after[1] * 1000:7.1f} ms  checks {after[2] * 1000:7.1f} ms"
+                f"  checks x{before[2] / after[2]:.2f}, with parse x{sum(before[1:]) / sum(after[1:]):.2f}"
+            )
+    return 0
+
+
+def main(argv=None) -> int:
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--lines", type=int, default=50000, help="size of the largest file")
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    arg_parser.add_argument("--max-growth", type=float, default=2.0,
+                            help="fail if the per-line cost of parse + checks grows more than this factor")
+    arg_parser.add_argument("--server", default=SERVER, help="scl_server directory to measure")
+    arg_parser.add_argument("--baseline", help="scl_server directory of another checkout to compare against")
+    arg_parser.add_argument("--json", action="store_true", help=argparse.SUPPRESS)
+    arg_parser.add_argument("--sizes", help=argparse.SUPPRESS)
+    args = arg_parser.parse_args(argv)
+
+    sizes = [args.lines // 8, args.lines // 4, args.lines // 2, args.lines]
+    if args.baseline:
+        return compare(args, sizes)
+    sys.path[:0] = [args.server, BENCHMARKS]
+    if args.json:
+        print(json.dumps(measure_checks([int(size) for size in args.sizes.split(",")], args.repeat)))
+        return 0
+
+    ok = True
+    for unclosed in (False, True):
+        label = "unclosed calls" if unclosed else "well-formed"
+        costs = []
+        for size in sizes:
+            count, parse, checks, incremental = measure(size, unclosed, args.repeat)
+            per_line = (parse + checks) / count * 1e6
+            costs.append(per_line)
+            print(
+                f"{label:15} {count:7d} lines  parse {parse * 1000:8.1f} ms  checks {checks * 1000:8.1f} ms"
+                f"  ({per_line:5.2f} us/line)  one-line edit {incremental * 1000:6.2f} ms"
+            )
+        growth = costs[-1] / costs[0]
+        print(f"{label:15} per-line growth x{growth:.2f}")
+        ok = ok and growth <= args.max_growth
+    for error in recovery_errors(args.lines // 8):
+        print(f"unclosed calls  {error}")
+        ok = False
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
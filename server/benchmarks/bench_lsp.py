@@ -0,0 +1,236 @@
+"""Latency and peak memory of the server features on synthetic sources, with regression checks.
+
+    python server/benchmarks/bench_lsp.py [--lines 2000 20000] [--output results.json]
+    python server/benchmarks/bench_lsp.py --compare baseline.json [--threshold 0.25]
+
+For each source size this measures the declaration parser, building the
+document model, a diagnostics pass (without and with the check results
+cached), semantic tokens of the whole document and hover, completion and
+highlight requests in the middle of the body. Each measurement reports the median
+and minimum of --repeat timed runs (with garbage collection paused, as
+timeit does) and the peak memory allocated by one more run under
+tracemalloc.
+
+Results can be written as JSON. --compare runs the benchmark and exits
+with status 1 when a median or peak memory grew by more than --threshold
+against a previous result file; timings below --min-ms are too noisy to
+compare and are skipped.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scl_server"))
+
+from lsprotocol.types import (  # noqa: E402
+    ClientCapabilities,
+    CompletionParams,
+    DocumentHighlightParams,
+    HoverParams,
+    Position,
+    SemanticTokensParams,
+    TextDocumentIdentifier,
+    TextDocumentItem,
+)
+from pygls.workspace import Workspace  # noqa: E402
+
+from diagnostics import check_cache, run_diagnostics  # noqa: E402
+from document_store import store  # noqa: E402
+from handlers import handle_completion, handle_highlight, handle_hover, handle_semantic_tokens  # noqa: E402
+from parser_structured import StructuredSCLParser  # noqa: E402
+from synthetic import generate_source  # noqa: E402
+
+RESULT_VERSION = 1
+URI = "file:///bench/FB_Synthetic.scl"
+
+
+class BenchServer:
+    """The parts of a LanguageServer the handlers use: a workspace, the client
+    capabilities and publish_diagnostics."""
+
+    def __init__(self):
+        self.workspace = Workspace(None)
+        self.client_capabilities = ClientCapabilities()
+        self.published = 0
+
+    def publish_diagnostics(self, uri, diagnostics, *args, **kwargs):
+        self.published += len(diagnostics)
+
+
+def find_positions(source: str) -> dict[str, Position]:
+    """Positions for the requests, taken from the middle of the body."""
+    lines = source.splitlines()
+    body = next(i for i, line in enumerate(lines) if line.strip() == "BEGIN")
+    middle = (body + len(lines)) // 2
+    positions = {}
+    for i in list(range(middle, len(lines))) + list(range(body, middle)):
+        line = lines[i]
+        stripped = line.lstrip()
+        indent = len(line) - len(stripped)
+        if "hover" not in positions and stripped.startswith("st") and "." in stripped:
+            member = line.index(".") + 1
+            positions["hover"] = Position(line=i, character=member + 1)
+            positions["completion"] = Position(line=i, character=member + 1)
+        if "highlight_bracket" not in positions and stripped.startswith("fb") and "(" in stripped:
+            positions["highlight_bracket"] = Position(line=i, character=line.index("("))
+        if "highlight_keyword" not in positions and stripped.startswith("IF "):
+            positions["highlight_keyword"] = Position(line=i, character=indent)
+    return positions
+
+
+def time_runs(repeat: int, function) -> list[float]:
+    times = []
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function()
+            times.append(time.perf_counter() - start)
+    finally:
+        gc.enable()
+    return times
+
+
+def peak_memory(function) -> int:
+    gc.collect()
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def benchmarks(lines: int) -> dict:
+    """name -> function measuring one feature on a source of about `lines` lines."""
+    source = generate_source(lines)
+    ls = BenchServer()
+    ls.workspace.put_text_document(TextDocumentItem(uri=URI, language_id="scl", version=1, text=source))
+    doc = ls.workspace.get_text_document(URI)
+    document = TextDocumentIdentifier(uri=URI)
+    positions = find_positions(source)
+
+    def build_model():
+        store.remove(URI)
+        store.get(doc)
+
+    def diagnostics():
+        check_cache.clear()
+        run_diagnostics(ls, doc)
+
+    def semantic_tokens():
+        store.get(doc).semantic_tokens.clear()
+        handle_semantic_tokens(ls, SemanticTokensParams(text_document=document))
+
+    store.get(doc)
+    return {
+        "lines": len(source.splitlines()),
+        "functions": {
+            "parse": lambda: StructuredSCLParser().parse(source),
+            "model": build_model,
+            "diagnostics": diagnostics,
+            "diagnostics_cached": lambda: run_diagnostics(ls, doc),
+            "semantic_tokens": semantic_tokens,
+            "hover": lambda: handle_hover(ls, HoverParams(text_document=document, position=positions["hover"])),
+            "completion": lambda: handle_completion(
+                ls, CompletionParams(text_document=document, position=positions["completion"])
+            ),
+            "highlight_bracket": lambda: handle_highlight(
+                ls, DocumentHighlightParams(text_document=document, position=positions["highlight_bracket"])
+            ),
+            "highlight_keyword": lambda: handle_highlight(
+                ls, DocumentHighlightParams(text_document=document, position=positions["highlight_keyword"])
+            ),
+        },
+    }
+
+
+def run(sizes: list[int], repeat: int) -> dict:
+    results = {}
+    for size in sizes:
+        setup = benchmarks(size)
+        for name, function in setup["functions"].items():
+            function()  # warm up caches of the document version, as a live server would have
+            times = time_runs(repeat, function)
+            results[f"{size}/{name}"] = {
+                "lines": setup["lines"],
+                "median_ms": statistics.median(times) * 1000,
+                "min_ms": min(times) * 1000,
+                "peak_kib": peak_memory(function) / 1024,
+            }
+        store.remove(URI)
+    return {
+        "version": RESULT_VERSION,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def compare(baseline: dict, current: dict, threshold: float, min_ms: float) -> list[str]:
+    """Descriptions of the measurements that regressed by more than `threshold`."""
+    regressions = []
+    for key, new in current["results"].items():
+        old = baseline.get("results", {}).get(key)
+        if old is None:
+            continue
+        if max(old["median_ms"], new["median_ms"]) >= min_ms and new["median_ms"] > old["median_ms"] * (1 + threshold):
+            regressions.append(f"{key}: median {old['median_ms']:.2f} ms -> {new['median_ms']:.2f} ms")
+        if new["peak_kib"] > old["peak_kib"] * (1 + threshold) and new["peak_kib"] - old["peak_kib"] > 64:
+            regressions.append(f"{key}: peak memory {old['peak_kib']:.0f} KiB -> {new['peak_kib']:.0f} KiB")
+    return regressions
+
+
+def report(result: dict, baseline: dict | None):
+    for key, value in result["results"].items():
+        line = (
+            f"{key:28} {value['lines']:7d} lines  median {value['median_ms']:9.3f} ms"
+            f"  min {value['min_ms']:9.3f} ms  peak {value['peak_kib']:9.0f} KiB"
+        )
+        old = (baseline or {}).get("results", {}).get(key)
+        if old is not None and old["median_ms"]:
+            line += f"  x{value['median_ms'] / old['median_ms']:.2f}"
+        print(line)
+
+
+def main(argv=None) -> int:
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--lines", type=int, nargs="+", default=[2000, 20000], help="source sizes")
+    arg_parser.add_argument("--repeat", type=int, default=5)
+    arg_parser.add_argument("--output", help="write the results to this JSON file")
+    arg_parser.add_argument("--compare", help="JSON results of a previous run to check for regressions")
+    arg_parser.add_argument("--threshold", type=float, default=0.25,
+                            help="allowed relative growth of a median or peak memory")
+    arg_parser.add_argument("--min-ms", type=float, default=0.1,
+                            help="medians below this are not compared")
+    args = arg_parser.parse_args(argv)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    result = run(args.lines, args.repeat)
+    report(result, baseline)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+    if baseline is not None:
+        regressions = compare(baseline, result, args.threshold, args.min_ms)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""Cost of the 24-character name check on the declarations of huge DBs.
+
+    python server/benchmarks/bench_prefix_collisions.py [--members 50000] [--baseline OLD/server/scl_server]
+
+Times check_variable_prefix_collisions on two synthetic global DBs: an
+alarm DB of small STRUCTs (many scopes, no hits) and a flat tag DB whose
+long names are all reported (one scope, a hit on every member). Each
+timing is the best of --repeat runs with garbage collection paused. With
+--baseline the same measurement is run against the server sources of
+another checkout, and the diagnostics of both are checked to be the same.
+"""
+import argparse
+import gc
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+SERVER = os.path.join(BENCHMARKS, "..", "scl_server")
+
+
+def measure(server: str, members: int, repeat: int) -> dict:
+    sys.path[:0] = [server, BENCHMARKS]
+    from diagnostics import check_variable_prefix_collisions
+    from lexer import LexedDocument
+    from synthetic import generate_data_block, generate_tag_block
+
+    results = {}
+    for label, source in (("alarms", generate_data_block(members)), ("tags", generate_tag_block(members))):
+        lexed = LexedDocument.from_text(source)
+        best = float("inf")
+        gc.collect()
+        gc.disable()
+        try:
+            for _ in range(repeat):
+                start = time.perf_counter()
+                diagnostics = check_variable_prefix_collisions(lexed)
+                best = min(best, time.perf_counter() - start)
+        finally:
+            gc.enable()
+        digest = hashlib.sha1()
+        for diagnostic in diagnostics:
+            start = diagnostic.range.start
+            digest.update(f"{start.line}:{start.character}:{diagnostic.severity}:{diagnostic.message}\n".encode())
+        results[label] = {
+            "lines": len(lexed.lines), "seconds": best, "diagnostics": len(diagnostics), "digest": digest.hexdigest(),
+        }
+    return results
+
+
+def main(argv=None) -> int:
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--members", type=int, default=50000, help="members of each DB")
+    arg_parser.add_argument("--repeat", type=int, default=5, help="timed runs per DB")
+    arg_parser.add_argument("--server", default=SERVER, help="scl_server directory to measure")
+    arg_parser.add_argument("--baseline", help="scl_server directory of another checkout to compare against")
+    arg_parser.add_argument("--json", action="store_true", help=argparse.SUPPRESS)
+    args = arg_parser.parse_args(argv)
+
+    if args.json:
+        print(json.dumps(measure(args.server, args.members, args.repeat)))
+        return 0
+
+    results = []
+    for label, server in (("baseline", args.baseline), ("current", args.server)):
+        if server is None:
+            continue
+        # A fresh interpreter per tree, so neither sees the other's modules
+        output = subprocess.run(
+            [sys.executable, __file__, "--json", "--server", server,
+             "--members", str(args.members), "--repeat", str(args.repeat)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        results.append(json.loads(output))
+        for db, result in results[-1].items():
+            print(f"{label:9} {db:7} {result['lines']:7d} lines  {result['seconds'] * 1000:9.1f} ms"
+                  f"  {result['diagnostics']:6d} diagnostics")
+    status = 0
+    if len(results) == 2:
+        for db in results[1]:
+            baseline, current = results[0][db], results[1][db]
+            same = baseline["digest"] == current["digest"]
+            print(f"{db:7} x{baseline['seconds'] / current['seconds']:.2f} faster, "
+                  f"diagnostics {'identical' if same else 'DIFFERENT'}")
+            status |= not same
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""Cold-start time of the server process, checked against a target.
+
+    python server/benchmarks/bench_startup.py [--max-seconds 2.0]
+    python server/benchmarks/bench_startup.py --command dist/SCLserver/server.exe
+
+Starts the server (main.py with this interpreter, or the --command given,
+e.g. the PyInstaller bundle built from scl_server.spec) --repeat times and
+measures the time from spawning the process to the initialize response
+and to the first hover on an opened document. Exits with status 1 when the
+median time to the first hover exceeds --max-seconds.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+MAIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scl_server", "main.py")
+URI = "file:///bench/startup.scl"
+SOURCE = """FUNCTION_BLOCK "FB_Startup"
+VAR
+    iStart : BOOL; // start request
+END_VAR
+BEGIN
+    iStart := TRUE;
+END_FUNCTION_BLOCK
+"""
+
+
+def send(process, message: dict):
+    body = json.dumps(message).encode("utf-8")
+    process.stdin.write(b"Content-Length: %d\r\n\r\n" % len(body) + body)
+    process.stdin.flush()
+
+
+def receive(process, request_id) -> dict:
+    """Read messages until the response to `request_id`."""
+    while True:
+        length = None
+        while True:
+            header = process.stdout.readline()
+            if not header:
+                raise RuntimeError("server exited before responding")
+            if header.lower().startswith(b"content-length:"):
+                length = int(header.split(b":")[1])
+            elif header == b"\r\n" and length is not None:
+                break
+        message = json.loads(process.stdout.read(length))
+        if message.get("id") == request_id and "method" not in message:
+            return message
+
+
+def start_once(command: list[str]) -> tuple[float, float]:
+    """Seconds from spawning the server to the initialize response and to the first hover."""
+    start = time.perf_counter()
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    try:
+        send(process, {"jsonrpc": "2.0", "id": 1, "method": "initialize", "params": {
+            "processId": os.getpid(), "rootUri": None, "capabilities": {},
+            "initializationOptions": {"indexWorkspace": False},
+        }})
+        receive(process, 1)
+        initialized = time.perf_counter() - start
+        send(process, {"jsonrpc": "2.0", "method": "initialized", "params": {}})
+        send(process, {"jsonrpc": "2.0", "method": "textDocument/didOpen", "params": {
+            "textDocument": {"uri": URI, "languageId": "scl", "version": 1, "text": SOURCE},
+        }})
+        send(process, {"jsonrpc": "2.0", "id": 2, "method": "textDocument/hover", "params": {
+            "textDocument": {"uri": URI}, "position": {"line": 5, "character": 6},
+        }})
+        receive(process, 2)
+        hover = time.perf_counter() - start
+        send(process, {"jsonrpc": "2.0", "id": 3, "method": "shutdown"})
+        receive(process, 3)
+        send(process, {"jsonrpc": "2.0", "method": "exit"})
+        process.wait(10)
+    finally:
+        if process.poll() is None:
+            process.kill()
+    return initialized, hover
+
+
+def main(argv=None) -> int:
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--command", nargs="+", help="server command (default: main.py with this Python)")
+    arg_parser.add_argument("--repeat", type=int, default=5)
+    arg_parser.add_argument("--max-seconds", type=float, default=2.0,
+                            help="fail if the median time to the first hover is longer")
+    args = arg_parser.parse_args(argv)
+
+    command = args.command or [sys.executable, MAIN]
+    runs = [start_once(command) for _ in range(args.repeat)]
+    initialize = statistics.median(run[0] for run in runs)
+    hover = statistics.median(run[1] for run in runs)
+    print(f"{' '.join(command)}")
+    print(f"initialize response {initialize * 1000:7.0f} ms  first hover {hover * 1000:7.0f} ms"
+          f"  (median of {args.repeat}, target {args.max_seconds * 1000:.0f} ms)")
+    return 0 if hover <= args.max_seconds else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
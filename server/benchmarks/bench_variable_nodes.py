@@ -0,0 +1,82 @@
+"""Memory held by the declaration parser for a global DB with many struct members.
+
+    python server/benchmarks/bench_variable_nodes.py [--members 100000] [--baseline OLD/server/scl_server]
+
+Prints the bytes retained by a StructuredSCLParser after parsing a synthetic
+alarm DB: in total (declaration records, scan checkpoints and nodes) and by
+the VariableNode tree alone. With --baseline the same measurement is run
+against the server sources of another checkout, for a before/after
+comparison.
+"""
+import argparse
+import gc
+import json
+import os
+import subprocess
+import sys
+import tracemalloc
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+SERVER = os.path.join(BENCHMARKS, "..", "scl_server")
+
+
+def measure(server: str, members: int) -> dict:
+    sys.path[:0] = [server, BENCHMARKS]
+    from lexer import LexedDocument
+    from parser_structured import StructuredSCLParser
+    from synthetic import generate_data_block
+
+    lexed = LexedDocument.from_text(generate_data_block(members))
+    gc.collect()
+    tracemalloc.start()
+    parser = StructuredSCLParser()
+    parser.parse_lexed(lexed)
+    gc.collect()
+    total = tracemalloc.get_traced_memory()[0]
+    count = len(parser.all_nodes)
+    parser.variables = parser.all_nodes = None
+    gc.collect()
+    nodes = total - tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return {"nodes": count, "total_bytes": total, "node_bytes": nodes}
+
+
+def report(label: str, result: dict):
+    count = result["nodes"]
+    print(
+        f"{label:9} {count:7d} nodes  parser {result['total_bytes'] / 2**20:7.1f} MiB"
+        f"  nodes {result['node_bytes'] / 2**20:7.1f} MiB ({result['node_bytes'] / count:5.0f} B/node)"
+    )
+
+
+def main(argv=None) -> int:
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--members", type=int, default=100000, help="struct members of the DB")
+    arg_parser.add_argument("--server", default=SERVER, help="scl_server directory to measure")
+    arg_parser.add_argument("--baseline", help="scl_server directory of another checkout to compare against")
+    arg_parser.add_argument("--json", action="store_true", help=argparse.SUPPRESS)
+    args = arg_parser.parse_args(argv)
+
+    if args.json:
+        print(json.dumps(measure(args.server, args.members)))
+        return 0
+
+    results = []
+    for label, server in (("baseline", args.baseline), ("current", args.server)):
+        if server is None:
+            continue
+        # A fresh interpreter per tree, so neither sees the other's modules or interned strings
+        output = subprocess.run(
+            [sys.executable, __file__, "--json", "--server", server, "--members", str(args.members)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        results.append(json.loads(output))
+        report(label, results[-1])
+    if len(results) == 2:
+        print(f"retained by the parser x{results[1]['total_bytes'] / results[0]['total_bytes']:.2f}, "
+              f"by the nodes x{results[1]['node_bytes'] / results[0]['node_bytes']:.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
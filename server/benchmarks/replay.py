@@ -0,0 +1,224 @@
+"""Replay a recorded editor session against the server in this process and report latencies.
+
+    python server/benchmarks/replay.py TRACE [--speed max|recorded] [--scale 1.0] [--output results.json]
+
+TRACE is a JSON lines file as written by `main.py --record TRACE` (or the
+SCL_LS_RECORD environment variable): one {"time", "from", "message"} object
+per line. The client messages are sent to the LanguageServer of main.py
+over an in-memory pipe, either as fast as possible or at the recorded pace
+(stretched by --scale), and server requests (progress tokens, ...) are
+answered with null.
+
+Prints the p50/p95/p99 latency of every request method, of diagnostics
+(from the didOpen/didChange of the version a publishDiagnostics covers to
+its arrival) and the overall request throughput.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scl_server"))
+
+DIAGNOSTICS = "textDocument/publishDiagnostics"
+
+
+def load_trace(path: str) -> list[tuple[float, dict]]:
+    """(time, message) of the client requests and notifications of a trace.
+
+    The client's responses to server requests are left out: the replay
+    client answers the requests of this run itself.
+    """
+    messages = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if entry.get("from", "client") == "client" and "method" in entry["message"]:
+                messages.append((float(entry.get("time", 0.0)), entry["message"]))
+    return messages
+
+
+def percentile(values: list[float], percent: float) -> float:
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(percent / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+class ReplayClient:
+    """Client end of the in-memory pipes to the server: sends messages and times the answers."""
+
+    def __init__(self, to_server, from_server):
+        self._to_server = to_server
+        self._from_server = from_server
+        self._lock = threading.Lock()
+        self._pending = {}  # request id -> (method, send time)
+        self._changed = {}  # uri -> {version: time of the didOpen/didChange} without diagnostics yet
+        self.latencies = {}  # method -> [seconds]
+        self.errors = {}  # method -> count
+        self.idle = threading.Event()
+        self.idle.set()
+        self._reader = threading.Thread(target=self._read, name="replay-reader", daemon=True)
+        self._reader.start()
+
+    def send(self, message: dict):
+        now = time.perf_counter()
+        method = message.get("method")
+        with self._lock:
+            if "id" in message and method is not None:
+                self._pending[message["id"]] = (method, now)
+                self.idle.clear()
+            elif method in ("textDocument/didOpen", "textDocument/didChange"):
+                document = message["params"]["textDocument"]
+                self._changed.setdefault(document["uri"], {})[document.get("version")] = now
+        self._write(message)
+
+    def _write(self, message: dict):
+        body = json.dumps(message).encode("utf-8")
+        with self._lock:
+            self._to_server.write(b"Content-Length: %d\r\n\r\n" % len(body) + body)
+            self._to_server.flush()
+
+    def _read(self):
+        while True:
+            length = None
+            while True:
+                header = self._from_server.readline()
+                if not header:
+                    return
+                if header.lower().startswith(b"content-length:"):
+                    length = int(header.split(b":")[1])
+                elif header == b"\r\n" and length is not None:
+                    break
+            self._received(json.loads(self._from_server.read(length)), time.perf_counter())
+
+    def _received(self, message: dict, now: float):
+        method = message.get("method")
+        if method is not None and "id" in message:
+            # A server request, e.g. window/workDoneProgress/create
+            self._write({"jsonrpc": "2.0", "id": message["id"], "result": None})
+            return
+        with self._lock:
+            if method == DIAGNOSTICS:
+                self._diagnosed(message["params"], now)
+                return
+            if method is not None or message.get("id") not in self._pending:
+                return
+            method, sent = self._pending.pop(message["id"])
+            self.latencies.setdefault(method, []).append(now - sent)
+            if "error" in message:
+                self.errors[method] = self.errors.get(method, 0) + 1
+            if not self._pending:
+                self.idle.set()
+
+    def _diagnosed(self, params: dict, now: float):
+        # Diagnostics cover every change up to their version (or all without one)
+        changes = self._changed.get(params["uri"])
+        if not changes:
+            return
+        version = params.get("version")
+        covered = [v for v in changes if version is None or v is None or v <= version]
+        if covered:
+            self.latencies.setdefault(DIAGNOSTICS, []).append(now - changes[covered[-1]])
+        for v in covered:
+            del changes[v]
+
+    def settle(self, timeout: float):
+        """Wait until every change got its diagnostics, or `timeout` seconds."""
+        end = time.perf_counter() + timeout
+        while time.perf_counter() < end:
+            with self._lock:
+                if not any(self._changed.values()):
+                    return
+            time.sleep(0.01)
+
+
+def replay(messages: list[tuple[float, dict]], speed: str, scale: float, timeout: float) -> dict:
+    import main
+
+    client_read, server_write = os.pipe()
+    server_read, client_write = os.pipe()
+    server_thread = threading.Thread(
+        target=main.server.start_io,
+        args=(os.fdopen(server_read, "rb"), os.fdopen(server_write, "wb")),
+        name="replay-server",
+        daemon=True,
+    )
+    server_thread.start()
+    client = ReplayClient(os.fdopen(client_write, "wb"), os.fdopen(client_read, "rb"))
+
+    start = time.perf_counter()
+    first = messages[0][0] if messages else 0.0
+    requests = 0
+    for recorded, message in messages:
+        if message.get("method") in ("shutdown", "exit"):
+            continue
+        if speed == "recorded":
+            delay = (recorded - first) * scale - (time.perf_counter() - start)
+            if delay > 0:
+                time.sleep(delay)
+        client.send(message)
+        requests += "id" in message
+    client.idle.wait(timeout)
+    elapsed = time.perf_counter() - start
+    client.settle(timeout)
+
+    client.send({"jsonrpc": "2.0", "id": "replay-shutdown", "method": "shutdown"})
+    client.idle.wait(timeout)
+    client.send({"jsonrpc": "2.0", "method": "exit"})
+    server_thread.join(timeout)
+
+    methods = {}
+    for method, latencies in sorted(client.latencies.items()):
+        if method == "shutdown":
+            continue
+        methods[method] = {
+            "count": len(latencies),
+            "errors": client.errors.get(method, 0),
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p95_ms": percentile(latencies, 95) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "max_ms": max(latencies) * 1000,
+        }
+    return {
+        "messages": len(messages),
+        "requests": requests,
+        "seconds": elapsed,
+        "requests_per_second": requests / elapsed if elapsed else 0.0,
+        "methods": methods,
+    }
+
+
+def main(argv=None) -> int:
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("trace", help="JSON lines trace recorded with main.py --record")
+    arg_parser.add_argument("--speed", choices=("max", "recorded"), default="max")
+    arg_parser.add_argument("--scale", type=float, default=1.0,
+                            help="multiply the recorded delays between messages (with --speed recorded)")
+    arg_parser.add_argument("--timeout", type=float, default=60.0,
+                            help="seconds to wait for outstanding responses at the end")
+    arg_parser.add_argument("--output", help="write the results to this JSON file")
+    args = arg_parser.parse_args(argv)
+
+    result = replay(load_trace(args.trace), args.speed, args.scale, args.timeout)
+    for method, stats in result["methods"].items():
+        print(
+            f"{method:36} {stats['count']:6d}  p50 {stats['p50_ms']:8.2f} ms  p95 {stats['p95_ms']:8.2f} ms"
+            f"  p99 {stats['p99_ms']:8.2f} ms  max {stats['max_ms']:8.2f} ms"
+            + (f"  errors {stats['errors']}" if stats["errors"] else "")
+        )
+    print(
+        f"{result['requests']} requests of {result['messages']} messages in {result['seconds']:.2f} s"
+        f" ({result['requests_per_second']:.1f} requests/s)"
+    )
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,146 @@
+"""Synthetic SCL sources for the benchmarks.
+
+The generated blocks look like TIA exports: interface sections with nested
+STRUCTs and CONST blocks followed by a long BEGIN body of FB calls,
+assignments and nested IF statements.
+"""
+import random
+
+
+def generate_block(
+    name: str = "FB_Synthetic",
+    variables: int = 200,
+    structs: int = 10,
+    struct_members: int = 10,
+    struct_depth: int = 2,
+    constants: int = 20,
+    statements: int = 1000,
+    fb_instances: int = 20,
+    if_depth: int = 3,
+    unclosed_calls: bool = False,
+    seed: int = 0,
+) -> str:
+    """Return the source of a single FUNCTION_BLOCK.
+
+    With `unclosed_calls` the closing line of every multi-line FB call is
+    commented out, which is what half-edited code looks like while typing.
+    """
+    rnd = random.Random(seed)
+    out = [f'FUNCTION_BLOCK "{name}"']
+    per_section = max(1, variables // 4)
+
+    out.append("VAR_INPUT")
+    out += [f"    i{_ident(k)} : BOOL; // input {k}" for k in range(per_section)]
+    out.append("END_VAR")
+    out.append("VAR_OUTPUT")
+    out += [f"    q{_ident(k)} : INT := 0; // output {k}" for k in range(per_section)]
+    out.append("END_VAR")
+
+    out.append("VAR")
+    out += [f"    fb{_ident(k)} : TON; // timer {k}" for k in range(fb_instances)]
+    out += [f"    s{_ident(k)} : REAL := 1.5;" for k in range(per_section)]
+    for k in range(structs):
+        _emit_struct(out, f"st{_ident(k)}", struct_members, struct_depth, 1)
+    out.append("END_VAR")
+
+    out.append("VAR_TEMP")
+    out += [f"    t{_ident(k)} : DINT;" for k in range(variables - 3 * per_section)]
+    out.append("END_VAR")
+
+    out.append("CONST")
+    out += [f"    C_{_ident(k).upper()} := INT#{k};" for k in range(constants)]
+    out.append("END_CONST")
+
+    out.append("BEGIN")
+    depth = 0
+    for k in range(statements):
+        kind = rnd.random()
+        indent = "    " * (depth + 1)
+        if kind < 0.15 and fb_instances:
+            fb = f"fb{_ident(rnd.randrange(fb_instances))}"
+            out.append(f"{indent}{fb}(IN := i{_ident(rnd.randrange(per_section))},")
+            out.append(f"{indent}    PT := T#5s);" if not unclosed_calls else f"{indent}//  PT := T#5s);")
+        elif kind < 0.25 and depth < if_depth:
+            out.append(f"{indent}IF i{_ident(rnd.randrange(per_section))} AND NOT i{_ident(rnd.randrange(per_section))} THEN")
+            depth += 1
+        elif kind < 0.35 and depth:
+            depth -= 1
+            out.append(f"{'    ' * (depth + 1)}END_IF;")
+        elif kind < 0.45 and structs:
+            out.append(f"{indent}st{_ident(rnd.randrange(structs))}.m{_ident(0)} := q{_ident(rnd.randrange(per_section))} + 1;")
+        else:
+            out.append(f"{indent}q{_ident(rnd.randrange(per_section))} := q{_ident(rnd.randrange(per_section))} + C_{_ident(rnd.randrange(max(1, constants))).upper()};")
+    while depth:
+        depth -= 1
+        out.append(f"{'    ' * (depth + 1)}END_IF;")
+    out.append("END_FUNCTION_BLOCK")
+    return "\n".join(out) + "\n"
+
+
+def generate_source(lines: int, unclosed_calls: bool = False, seed: int = 0) -> str:
+    """Return a source of roughly `lines` lines, split evenly between interface and body."""
+    statements = max(1, lines // 2)
+    variables = max(4, lines // 4)
+    structs = max(1, lines // 400)
+    return generate_block(
+        variables=variables,
+        structs=structs,
+        struct_members=10,
+        struct_depth=2,
+        constants=max(1, lines // 100),
+        statements=statements,
+        fb_instances=max(1, lines // 200),
+        unclosed_calls=unclosed_calls,
+        seed=seed,
+    )
+
+
+def generate_data_block(members: int, name: str = "DB_Alarms") -> str:
+    """Return a global DB of alarm STRUCTs with about `members` members in total.
+
+    The element STRUCTs all have the same member names and types, as in the
+    alarm and recipe DBs generated by TIA.
+    """
+    out = [f'DATA_BLOCK "{name}"', "VAR"]
+    for k in range(max(1, members // 10)):
+        out.append(f"    Alarm{k:06d} : STRUCT // alarm {k}")
+        out.append("        Active : BOOL; // alarm is active")
+        out.append("        Acknowledged : BOOL;")
+        out.append("        Priority : INT := 1;")
+        out.append("        Delay : TIME := T#2s;")
+        out.append(f"        Text : STRING := 'Alarm {k}';")
+        out.append("        Count : DINT;")
+        out.append("        Limits : STRUCT")
+        out.append("            Low : REAL := 0.0;")
+        out.append("            High : REAL := 100.0;")
+        out.append("        END_STRUCT;")
+        out.append("    END_STRUCT;")
+    out += ["END_VAR", "BEGIN", "END_DATA_BLOCK"]
+    return "\n".join(out) + "\n"
+
+
+def generate_tag_block(members: int, name: str = "DB_Tags") -> str:
+    """Return a global DB of about `members` flat members with long generated names.
+
+    The names run past 24 characters and every pair of a section shares its
+    first 24 characters, as in tag DBs exported from a plant model.
+    """
+    out = [f'DATA_BLOCK "{name}"', "VAR"]
+    for k in range(max(1, members // 2)):
+        out.append(f"    Conveyor_Section_{k:06d}_Motor_Running : BOOL; // section {k}")
+        out.append(f"    Conveyor_Section_{k:06d}_Motor_Fault : BOOL;")
+    out += ["END_VAR", "BEGIN", "END_DATA_BLOCK"]
+    return "\n".join(out) + "\n"
+
+
+def _emit_struct(out: list[str], name: str, members: int, depth: int, level: int):
+    indent = "    " * level
+    out.append(f"{indent}{name} : STRUCT // struct {name}")
+    out += [f"{indent}    m{_ident(k)} : INT; // member {k}" for k in range(members)]
+    if depth > 1:
+        _emit_struct(out, f"sub{name}", members, depth - 1, level + 1)
+    out.append(f"{indent}END_STRUCT;")
+
+
+def _ident(k: int) -> str:
+    return f"Var{k:05d}"
@@ -0,0 +1,13 @@
+"""`python -m scl_server` starts the server; `python -m scl_server lint PATH...` checks files (see lint.py)."""
+import os
+import runpy
+import sys
+
+# The modules import each other as top-level modules
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["lint"]:
+        from lint import main
+        sys.exit(main(sys.argv[2:]))
+    runpy.run_path(os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py"), run_name="__main__")
@@ -0,0 +1,137 @@
+import re
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from functools import lru_cache
+
+from telemetry import telemetry
+
+# Match ranks, best first
+EXACT_PREFIX = 0
+PREFIX = 1  # prefix ignoring case
+CAMEL_HUMP = 2  # "sR" or "sr" matches "startRequest"
+
+
+class CompletionIndex:
+    """Names of one completion scope, sorted with and without case.
+
+    Prefix matches are bisects into the sorted names. Camel-hump matches are
+    found by one regular expression search over the names sharing the first
+    character of the query, with each hump start marked.
+    """
+
+    def __init__(self, names):
+        self.names = sorted(names)  # exact case
+        entries = sorted((name.lower(), name) for name in self.names)
+        self.keys = [key for key, _ in entries]
+        self.folded = [name for _, name in entries]  # in order of `keys`
+        self._humps = None  # "\n".join of the names with humps marked, built on first use
+        self._offsets = None  # start of each name in _humps
+
+    def __len__(self):
+        return len(self.names)
+
+    def match(self, query: str, limit: int) -> tuple[list[tuple[int, str]], bool]:
+        """Return up to `limit` (rank, name) matches, best first, and whether more matched."""
+        start = bisect_left(self.names, query)
+        end = bisect_left(self.names, query + "\uffff", start)
+        matches = [(EXACT_PREFIX, name) for name in self.names[start:min(end, start + limit)]]
+        if end - start > limit:
+            return matches, True
+
+        lower = query.lower()
+        start = bisect_left(self.keys, lower)
+        end = bisect_left(self.keys, lower + "\uffff", start)
+        for name in self.folded[start:end]:
+            if name.startswith(query):
+                continue
+            if len(matches) == limit:
+                return matches, True
+            matches.append((PREFIX, name))
+        if len(query) < 2:
+            return matches, False
+
+        if self._humps is None:
+            self._mark_humps()
+        pattern = _camel_pattern(lower)
+        first = bisect_left(self.keys, lower[0])
+        last = bisect_left(self.keys, lower[0] + "\uffff", first)
+        text_end = self._offsets[last] if last < len(self._offsets) else len(self._humps)
+        for found in pattern.finditer(self._humps, self._offsets[first] if first < last else text_end, text_end):
+            index = bisect_right(self._offsets, found.start()) - 1
+            if start <= index < end:
+                continue
+            if len(matches) == limit:
+                return matches, True
+            matches.append((CAMEL_HUMP, self.folded[index]))
+        return matches, False
+
+    def _mark_humps(self):
+        offsets = []
+        position = 0
+        marked = []
+        for name in self.folded:
+            offsets.append(position)
+            text = mark_humps(name)
+            marked.append(text)
+            position += len(text) + 1
+        self._offsets = offsets
+        self._humps = "\n".join(marked)
+
+
+HUMP = "\x01"
+
+
+def mark_humps(name: str) -> str:
+    """Lower case `name` with HUMP before each word: after "_" or at a lower-to-upper or letter-to-digit change."""
+    out = [HUMP]
+    for i, char in enumerate(name):
+        if i and char != "_":
+            previous = name[i - 1]
+            if (
+                previous == "_"
+                or (char.isupper() and not previous.isupper())
+                or (char.isdigit() and not previous.isdigit())
+            ):
+                out.append(HUMP)
+        out.append(char.lower())
+    return "".join(out)
+
+
+@lru_cache(maxsize=256)
+def _camel_pattern(query: str) -> re.Pattern:
+    # Each character continues the current hump or starts a later one
+    parts = [f"^{HUMP}{re.escape(query[0])}"]
+    for char in query[1:]:
+        char = re.escape(char)
+        parts.append(f"(?:{char}|.*?{HUMP}{char})")
+    return re.compile("".join(parts), re.MULTILINE)
+
+
+class CompletionIndexCache:
+    """CompletionIndex per scope mapping (a `variables` or `children` dict).
+
+    The parsers build new dicts when declarations change, so an index stays
+    valid as long as its mapping is the same object. The mapping is kept with
+    its index so the id can't be reused while it's cached.
+    """
+
+    def __init__(self, maxsize: int = 128):
+        self.maxsize = maxsize
+        self._indexes = OrderedDict()  # id(scope) -> (scope, CompletionIndex)
+
+    def get(self, scope) -> CompletionIndex:
+        key = id(scope)
+        entry = self._indexes.get(key)
+        if entry is not None and entry[0] is scope:
+            telemetry.count("completion_index.hit")
+            self._indexes.move_to_end(key)
+            return entry[1]
+        telemetry.count("completion_index.miss")
+        index = CompletionIndex(scope)
+        self._indexes[key] = (scope, index)
+        if len(self._indexes) > self.maxsize:
+            self._indexes.popitem(last=False)
+        return index
+
+
+completion_indexes = CompletionIndexCache()
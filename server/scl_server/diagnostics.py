@@ -1,354 +1,386 @@
 import re
+import threading
+from collections import OrderedDict
+from functools import lru_cache
 from lsprotocol.types import Diagnostic, DiagnosticSeverity, Range, Position
 from pygls.workspace import Document
 from pygls.server import LanguageServer
-from parser_structured import StructuredSCLParser
+from lexer import IDENT, TYPED_LITERAL, LexedDocument, dotted_end, find_operator, token_text
+from parser_body import (
+    BLOCK_KEYWORDS, END_KEYWORDS, MISSING_END, MISSING_KEYWORD, MISSING_PAREN, MISSING_SEMICOLON, SyntaxTree,
+)
+from parser_structured import NodePaths, StructuredSCLParser
 from syntax_keywords import SCL_KEYWORDS
+from document_store import get_model
+from telemetry import telemetry
+from workspace_index import workspace_index
 
-# Initialize parser instance
-parser = StructuredSCLParser()
 
-
-def update_parser(doc):
-    parser.parse(doc.source)
+class DiagnosticsCancelled(Exception):
+    """Raised inside a diagnostics pass that was superseded by a newer version."""
 
 
 def run_diagnostics(ls: LanguageServer, doc: Document):
-    update_parser(doc)
+    model = get_model(doc)
+    ls.publish_diagnostics(doc.uri, compute_diagnostics(model.lexed, model.parser, model.tree))
+
+
+def compute_diagnostics(lexed: LexedDocument, parser: StructuredSCLParser, tree: SyntaxTree, is_cancelled=None) -> list[Diagnostic]:
+    """Run all checks. `is_cancelled` is polled between (and inside long) checks
+    so a pass running in a worker thread can be abandoned early.
+
+    Each check's result is reused from `check_cache` while the lines it
+    depends on are unchanged: the statement checks depend on the code
+    sections (and the declared names), the name check on the declarations.
+    The declared names are read once, and results are only stored while
+    they are still those of the parser and the workspace index.
+    """
+    if is_cancelled is None:
+        is_cancelled = _never_cancelled
+    variables, nodes, symbols_key = parser.variables, parser.all_nodes, parser.symbols_key
+    global_names = workspace_index.global_names
+
+    def current() -> bool:
+        return not is_cancelled() and parser.variables is variables and workspace_index.global_names is global_names
+
     diagnostics = []
+    size = len(lexed.lines)
+    body = body_start(tree, size)
+    body_key = region_key(lexed, body, size, tree.roots[0].start if tree.roots else 0)
+
+    statements_key = (body_key, symbols_key, global_names)
+    diagnostics += check_cache.cached(
+        "check_statements", statements_key, body, size,
+        lambda: check_statements(tree, variables, nodes, global_names, is_cancelled), current,
+    )
+    if is_cancelled():
+        raise DiagnosticsCancelled()
+    diagnostics += check_cache.cached("check_blocks", body_key, body, size, lambda: check_blocks(tree, lexed), current)
+    if is_cancelled():
+        raise DiagnosticsCancelled()
+    declarations_end = declaration_end(lexed, tree, body)
+    diagnostics += check_cache.cached(
+        "check_variable_prefix_collisions", region_key(lexed, 0, declarations_end), 0, size,
+        lambda: check_variable_prefix_collisions(lexed), current,
+    )
+    return diagnostics
+
+
+def _never_cancelled() -> bool:
+    return False
+
+
+def body_start(tree: SyntaxTree, line_count: int) -> int:
+    """First line of the code sections: the line of the first BEGIN, or the line count."""
+    if tree.roots and tree.roots[0].kind == "BEGIN":
+        return tree.lines[0]
+    return line_count
 
-    lines = doc.lines
-    declared_vars = set(parser.variables.keys())
-    diagnostics += check_assignments(lines, declared_vars)
-    diagnostics += check_if_blocks(lines)
-    diagnostics += check_variable_prefix_collisions(lines)
 
-    ls.publish_diagnostics(doc.uri, diagnostics)
+def declaration_end(lexed: LexedDocument, tree: SyntaxTree, body: int) -> int:
+    """End of the lines check_variable_prefix_collisions reads: up to the first
+    line starting with BEGIN."""
+    if body < len(lexed.lines):
+        code = lexed.code_tokens(body)
+        if code and code[0][1] == tree.roots[0].start:
+            return body + 1
+    # BEGIN isn't the first token of its line: the check may read further
+    return len(lexed.lines)
 
 
+def region_key(lexed: LexedDocument, start: int, end: int, character: int = 0) -> tuple:
+    """Key of the text of lines [start, end) from `character` on, including
+    whether they start inside a block comment."""
+    in_comment = lexed._states[start] if start < len(lexed.lines) else lexed._end_state
+    return (end - start, character, in_comment, hash(tuple(lexed.lines[start:end])))
+
+
+class CheckCache:
+    """Results of the checks by the key of the lines they depend on, least recently used first.
+
+    Diagnostics are kept relative to the first line of their region, so a
+    region that only moved (lines inserted above it) is reused with its
+    diagnostics shifted. Hits and misses are counted per check. A result
+    is only stored if `current()` (when given) still holds once it is
+    computed, so a superseded pass doesn't store it under the wrong key.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # (check, key) -> (region start, diagnostics)
+        self._lock = threading.Lock()
+
+    def cached(self, check: str, key, start: int, size: int, compute, current=None) -> list[Diagnostic]:
+        entry_key = (check, key)
+        with self._lock:
+            entry = self._entries.get(entry_key)
+            if entry is not None:
+                self._entries.move_to_end(entry_key)
+        if entry is not None:
+            telemetry.count(f"diagnostics.{check}.hit")
+            return shifted(entry[1], start - entry[0]) if entry[0] != start else list(entry[1])
+        telemetry.count(f"diagnostics.{check}.miss")
+        with telemetry.timer(f"diagnostics.{check}", size):
+            diagnostics = compute()
+        if current is not None and not current():
+            return list(diagnostics)
+        with self._lock:
+            self._entries[entry_key] = (start, diagnostics)
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return list(diagnostics)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def shifted(diagnostics: list[Diagnostic], delta: int) -> list[Diagnostic]:
+    return [
+        Diagnostic(
+            range=Range(
+                start=Position(line=d.range.start.line + delta, character=d.range.start.character),
+                end=Position(line=d.range.end.line + delta, character=d.range.end.character),
+            ),
+            message=d.message,
+            severity=d.severity,
+            source=d.source,
+        )
+        for d in diagnostics
+    ]
+
+
+check_cache = CheckCache()
+
+
+NUMBER_PATTERN = re.compile(r"^\d+(\.\d+)?$")
+
+
+@lru_cache(maxsize=65536)
 def is_literal(value: str) -> bool:
     # Exclude time constants starting with T# and SCL keywords
-    return (
-        re.match(r"^\d+(\.\d+)?$", value)
-        or value.upper() in SCL_KEYWORDS
-        or value.upper().startswith("T#")
+    upper = value.upper()
+    return bool(
+        NUMBER_PATTERN.match(value)
+        or upper in SCL_KEYWORDS
+        or upper.startswith("T#")
     )
 
 
-def is_var_defined(varname: str) -> bool:
+def is_var_defined(varname: str, parser: StructuredSCLParser) -> bool:
     # Use parser.all_nodes for variable existence
     return varname in parser.all_nodes
 
 
-def preprocess_function_block_info(lines: list[str]):
-    """Precompute function block names and all function call argument names."""
-    fb_names = set()
-    in_var_block = False
-    var_decl_pattern = re.compile(r"^\s*([\w.]+)\s*:\s*([\w.]+)\s*;")
-    const_decl_pattern = re.compile(r"^\s*([\w.]+)\s*:=\s*([\w]+)#([^;]+)\s*;")
-    call_pattern = re.compile(r"\b([\w.]+)\s*\(([^)]*)\)")
-    fb_arg_names = set()
-    for line in lines:
-        upper = line.strip().upper()
-        if upper.startswith("VAR") or upper.startswith("CONST"):
-            in_var_block = True
-            continue
-        if upper.startswith("END_VAR") or upper.startswith("END_CONST"):
-            in_var_block = False
-            continue
-        if in_var_block:
-            match = var_decl_pattern.match(line.split("//")[0])
-            if match:
-                var_name, var_type = match.groups()
-                if var_type.upper() not in SCL_KEYWORDS:
-                    fb_names.add(var_name)
-            # Also match constant definitions
-            const_match = const_decl_pattern.match(line.split("//")[0])
-            if const_match:
-                const_name, const_type, const_value = const_match.groups()
-                fb_names.add(const_name)
-        # Function call argument names (IN, PT, etc.)
-        for call_match in call_pattern.finditer(line):
-            arglist = call_match.group(2)
-            for arg in arglist.split(","):
-                arg = arg.strip()
-                if ":=" in arg:
-                    arg_name = arg.split(":=")[0].strip()
-                    fb_arg_names.add(arg_name)
-    return fb_names, fb_arg_names
-
-
-def extract_variables(text: str) -> list[str]:
-    # Remove T# time literals and numbers
-    text = re.sub(r"\bT#\w+\b", "", text, flags=re.IGNORECASE)
-    text = re.sub(r"\b\d+(\.\d+)?\b", "", text)
-    # Extract variable-like tokens, skip time literals and numbers
-    return re.findall(r"[\w.]+", text)
-
-
-def check_variable_length_and_prefix(var: str, i: int, line: str, prefix_map: dict, scope: tuple) -> list[Diagnostic]:
-    """Return diagnostics for variable name length and prefix collisions in the given scope."""
-    diagnostics = []
-    if len(var) > 24:
-        diagnostics.append(Diagnostic(
-            range=Range(
-                start=Position(line=i, character=line.find(var)),
-                end=Position(line=i, character=line.find(var) + len(var))
-            ),
-            message=f"Variable '{var}' is longer than 24 characters.",
-            severity=DiagnosticSeverity.Information,
-            source="scl-ls"
-        ))
-    prefix = var[:24]
-    if scope not in prefix_map:
-        prefix_map[scope] = {}
-    if prefix in prefix_map[scope]:
-        prev_i, prev_var = prefix_map[scope][prefix]
-        diagnostics.append(Diagnostic(
-            range=Range(
-                start=Position(line=i, character=line.find(var)),
-                end=Position(line=i, character=line.find(var) + len(var))
-            ),
-            message=f"Variable '{var}' has the same first 24 characters as '{prev_var}' (line {prev_i+1}) in the same scope.",
-            severity=DiagnosticSeverity.Error,
-            source="scl-ls"
-        ))
-    else:
-        prefix_map[scope][prefix] = (i, var)
-    return diagnostics
+class SymbolIndex:
+    """Every name an assignment token may resolve to, built once per pass so
+    each token is resolved with a few lookups instead of scans over all FBs."""
 
+    def __init__(self, nodes: NodePaths, declared_vars: set[str], fb_names: set[str]):
+        self.paths = nodes
+        self.names = set(declared_vars)
+        self.names.update(fb_names)
+        self.fb_names = fb_names
 
-def check_variable_prefix_collisions(lines: list[str]) -> list[Diagnostic]:
-    """
-    Return diagnostics if two variables have the same first 24 characters or are too long.
-    The check is done per scope: global for top-level, or per structure for nested variables.
+    def is_defined(self, var: str) -> bool:
+        if var in self.names or var in self.paths:
+            return True
+        # Members of FB instances and constants (var starts with "<fb>."):
+        # look up every dotted prefix of the token instead of every FB name
+        dot = var.find(".")
+        while dot != -1:
+            if var[:dot] in self.fb_names:
+                return True
+            dot = var.find(".", dot + 1)
+        return False
+
+
+def function_block_names(nodes: NodePaths) -> set[str]:
+    """Names of declared instances (FBs, UDTs, ...) whose members the parser doesn't know."""
+    return {node.name for node in nodes.values() if node.data_type.upper() not in SCL_KEYWORDS}
+
+
+def declared_names(lexed: LexedDocument) -> tuple[list[str], list[int], list[int], list[int]]:
+    """Names, lines, columns and scopes of the variables and constants declared
+    before BEGIN, as parallel lists.
+
+    A scope is a number standing for the path of STRUCTs the name is declared
+    in, 0 at the top level; the same path always gets the same number.
     """
-    diagnostics = []
-    prefix_map = {}
+    names, lines, columns, scopes = [], [], [], []
+    scope_ids = {(): 0}
     struct_stack = []
-    # Regex for structure and variable declarations
-    struct_start_pattern = re.compile(r"(?i)^\s*(\w+)\s*:\s*STRUCT\b")
-    struct_end_pattern = re.compile(r"(?i)^\s*END_STRUCT\s*;")
-    var_decl_pattern = re.compile(r"(?i)^\s*([\w.]+)\s*:\s*[\w.]+\s*(?::=|:=)?")
-    const_decl_pattern = re.compile(r"(?i)^\s*([\w.]+)\s*:=\s*([\w]+)#([^;]+)\s*;")
-    for i, line in enumerate(lines):
-        code = line.split("//")[0].strip()
-        # Check for structure start
-        struct_start = struct_start_pattern.match(code)
-        if struct_start:
-            struct_stack.append(struct_start.group(1))
+    scope = 0
+    for i, line in enumerate(lexed.lines):
+        code = lexed.code_tokens(i)
+        if not code or code[0][0] != IDENT:
             continue
+        first = line[code[0][1]:code[0][2]].upper()
+        if first == "BEGIN":
+            break
         # Check for structure end
-        if struct_end_pattern.match(code):
-            if struct_stack:
+        if first == "END_STRUCT":
+            if len(code) > 1 and token_text(line, code[1]) == ";" and struct_stack:
                 struct_stack.pop()
+                scope = scope_ids[tuple(struct_stack)]
             continue
-        # Check for variable declaration
-        match = var_decl_pattern.match(code)
-        if match:
-            var_name = match.group(1).strip()
-            scope = tuple(struct_stack)
-            diagnostics += check_variable_length_and_prefix(var_name, i, line, prefix_map, scope)
+        name_end = dotted_end(line, code, 0)
+        if name_end + 1 >= len(code):
             continue
-        # Check for constant definition
-        const_match = const_decl_pattern.match(code)
-        if const_match:
-            const_name = const_match.group(1).strip()
-            scope = tuple(struct_stack)
-            diagnostics += check_variable_length_and_prefix(const_name, i, line, prefix_map, scope)
-        if line.strip().startswith("BEGIN"):
-            break
-    return diagnostics
+        separator = token_text(line, code[name_end])
+        following = code[name_end + 1]
+        if separator == ":" and following[0] == IDENT:
+            # Check for structure start
+            if name_end == 1 and token_text(line, following).upper() == "STRUCT":
+                struct_stack.append(line[code[0][1]:code[0][2]])
+                scope = scope_ids.setdefault(tuple(struct_stack), len(scope_ids))
+                continue
+        elif not (separator == ":=" and following[0] == TYPED_LITERAL and find_operator(line, code, ";", name_end + 2) is not None):
+            continue
+        # Variable declaration or constant definition
+        names.append(line[code[0][1]:code[name_end - 1][2]])
+        lines.append(i)
+        columns.append(code[0][1])
+        scopes.append(scope)
+    return names, lines, columns, scopes
 
 
-def check_assignments(lines: list[str], declared_vars: set[str]) -> list[Diagnostic]:
+def check_variable_prefix_collisions(lexed: LexedDocument) -> list[Diagnostic]:
+    """
+    Return diagnostics if two variables have the same first 24 characters or are too long.
+    The check is done per scope: global for top-level, or per structure for nested variables.
+
+    The declarations are collected in one pass and checked in bulk; Diagnostics
+    are only made for the names that fail.
+    """
+    names, lines, columns, scopes = declared_names(lexed)
+    hits = [(k, 0) for k, name in enumerate(names) if len(name) > 24]
+    keys = list(zip(scopes, [name[:24] for name in names]))
+    # Index of the first declaration of every (scope, prefix), filled backwards so the first one wins
+    first = dict(zip(reversed(keys), range(len(keys) - 1, -1, -1)))
+    if len(first) < len(keys):
+        hits += [(k, 1) for k, key in enumerate(keys) if first[key] != k]
+        hits.sort()
+
     diagnostics = []
-    fb_names, fb_arg_names = preprocess_function_block_info(lines)
-    in_code_block = False
-    logical_ops = ("AND", "OR", "XOR", "NOT")
-    # Join all code lines into a single string for multiline context
-    multiline_code = "\n".join(line.split("//")[0].rstrip() for line in lines)
-    for i, line in enumerate(lines):
-        stripped = line.strip().upper()
-        if stripped == "BEGIN":
-            in_code_block = True
-            continue
-        if not in_code_block:
-            continue
+    name_range = None
+    for n, (k, collision) in enumerate(hits):
+        var, i, character = names[k], lines[k], columns[k]
+        # A long name that also collides gets both diagnostics on one Range
+        if not n or hits[n - 1][0] != k:
+            name_range = Range(
+                start=Position(line=i, character=character),
+                end=Position(line=i, character=character + len(var))
+            )
+        if collision:
+            previous = first[keys[k]]
+            message = f"Variable '{var}' has the same first 24 characters as '{names[previous]}' (line {lines[previous] + 1}) in the same scope."
+        else:
+            message = f"Variable '{var}' is longer than 24 characters."
+        diagnostics.append(Diagnostic(
+            range=name_range,
+            message=message,
+            severity=DiagnosticSeverity.Error if collision else DiagnosticSeverity.Information,
+            source="scl-ls"
+        ))
+    return diagnostics
 
-        code = line.split("//")[0].rstrip()
-        match = re.search(r"([\w.]+)\s*:=\s*(.+)", code)
-        if not match:
-            continue
 
-        lhs, rhs = match.groups()
-
-        for var in extract_variables(lhs) + extract_variables(rhs):
-            if (
-                not is_literal(var)
-                and not is_var_defined(var)
-                and var not in declared_vars
-                and var not in fb_names
-                and not any(var.startswith(fb + ".") for fb in fb_names)
-                and var not in fb_arg_names
-            ):
+def check_statements(tree: SyntaxTree, variables: dict, nodes: NodePaths, global_names: frozenset, is_cancelled=None) -> list[Diagnostic]:
+    """Undefined names and missing semicolons or parentheses in the statements,
+    given the declared variables and the global DB names of the workspace."""
+    diagnostics = []
+    # Global DBs of the workspace resolve like FB instances: members aren't checked
+    fb_names = function_block_names(nodes) | global_names
+    symbols = SymbolIndex(nodes, set(variables), fb_names)
+    missing_paren = None
+    for count, (node, line) in enumerate(tree.walk()):
+        if is_cancelled is not None and count % 4096 == 0 and is_cancelled():
+            raise DiagnosticsCancelled()
+        kind = node.kind
+        if kind == "NAME":
+            var = node.text
+            if not symbols.is_defined(var) and not is_literal(var):
                 diagnostics.append(Diagnostic(
                     range=Range(
-                        start=Position(line=i, character=line.find(var)),
-                        end=Position(line=i, character=line.find(var) + len(var))
+                        start=Position(line=line + node.line, character=node.start),
+                        end=Position(line=line + node.line, character=node.end)
                     ),
                     message=f"Variable '{var}' is not defined.",
                     severity=DiagnosticSeverity.Warning,
                     source="scl-ls"
                 ))
-
-        # Check for missing semicolon, but allow line continuation with logical operators
-        # For function calls, require semicolon only after the closing parenthesis of the call
-        if not code.endswith(";"):
-            # Check if we are inside an unclosed parenthesis (e.g., multiline function call)
-            open_parens = 0
-            for ch in code:
-                if ch == "(":
-                    open_parens += 1
-                elif ch == ")":
-                    open_parens -= 1
-            # Look ahead for closing parenthesis and semicolon
-            if open_parens > 0:
-                # Scan following lines to find the closing parenthesis and check for semicolon
-                found_close = False
-                for k in range(i + 1, len(lines)):
-                    next_line = lines[k].split("//")[0].rstrip()
-                    for ch in next_line:
-                        if ch == "(":
-                            open_parens += 1
-                        elif ch == ")":
-                            open_parens -= 1
-                    if open_parens <= 0:
-                        found_close = True
-                        # After closing parenthesis, require semicolon at end of line
-                        if not next_line.rstrip().endswith(";"):
-                            diagnostics.append(Diagnostic(
-                                range=Range(
-                                    start=Position(line=k, character=len(next_line)),
-                                    end=Position(line=k, character=len(next_line) + 1)
-                                ),
-                                message="Missing semicolon ';' after function call.",
-                                severity=DiagnosticSeverity.Error,
-                                source="scl-ls"
-                            ))
-                        break
-                # If never closed, do not report semicolon error here
+        elif node.flags & MISSING_PAREN:
+            # Calls nested in an unclosed call's arguments end at the same token
+            position = (line + node.end_line, node.end)
+            if position == missing_paren:
                 continue
-            # Otherwise, check for logical operator continuation as before
-            continuation_found = False
-            for k in range(i + 1, len(lines)):
-                next_line = lines[k].split("//")[0]
-                if not next_line.strip():
-                    continue  # skip empty/comment lines
-                tokens = next_line.lstrip().split()
-                if tokens and tokens[0].upper() in logical_ops:
-                    continuation_found = True
-                    break
-                if len(tokens) > 1 and tokens[1].upper() in logical_ops:
-                    continuation_found = True
-                    break
-                break  # only check the first non-empty line after current
-            if not continuation_found:
-                diagnostics.append(Diagnostic(
-                    range=Range(
-                        start=Position(line=i, character=len(code)),
-                        end=Position(line=i, character=len(code) + 1)
-                    ),
-                    message="Missing semicolon ';'",
-                    severity=DiagnosticSeverity.Error,
-                    source="scl-ls"
-                ))
-
+            missing_paren = position
+            diagnostics.append(Diagnostic(
+                range=Range(
+                    start=Position(line=position[0], character=node.end),
+                    end=Position(line=position[0], character=node.end + 1)
+                ),
+                message="Missing closing parenthesis ')'.",
+                severity=DiagnosticSeverity.Error,
+                source="scl-ls"
+            ))
+        elif node.flags & MISSING_SEMICOLON and kind not in END_KEYWORDS:
+            # Compound statements are reported by check_blocks
+            message = "Missing semicolon ';' after function call." if kind == "CALL" else "Missing semicolon ';'"
+            diagnostics.append(missing_semicolon(line + node.end_line, node.end, message))
     return diagnostics
 
 
-def check_if_blocks(lines: list[str]) -> list[Diagnostic]:
-    diagnostics = []
-    if_stack = []
-
-    for i, line in enumerate(lines):
-        upper = line.strip().upper()
-        stripped_code = line.split("//")[0].strip()
-
-        if upper.startswith("IF"):
-            if_stack.append({'if': i, 'then': None, 'else': None, 'end_if': None})
+def missing_semicolon(line: int, character: int, message: str = "Missing semicolon ';'") -> Diagnostic:
+    return Diagnostic(
+        range=Range(
+            start=Position(line=line, character=character),
+            end=Position(line=line, character=character + 1)
+        ),
+        message=message,
+        severity=DiagnosticSeverity.Error,
+        source="scl-ls"
+    )
 
-        if "THEN" in upper and if_stack:
-            if_stack[-1]['then'] = i
 
-        if upper.startswith("ELSE"):
-            if if_stack:
-                if_stack[-1]['else'] = i
-            if is_empty_else_block(lines, i):
+def check_blocks(tree: SyntaxTree, lexed: LexedDocument) -> list[Diagnostic]:
+    """Missing THEN/OF/DO/UNTIL and END_* keywords of IF, CASE, FOR, WHILE, REPEAT and REGION."""
+    diagnostics = []
+    for node, line in tree.walk():
+        kind = node.kind
+        if kind == "ELSE":
+            if not node.children[0].children:
                 diagnostics.append(Diagnostic(
-                    range=Range(start=Position(line=i, character=0), end=Position(line=i, character=len(line))),
+                    range=line_range(lexed, line + node.line),
                     message="Missing semicolon ';'",
                     severity=DiagnosticSeverity.Warning,
                     source="scl-ls"
                 ))
-
-        if "END_IF" in upper and if_stack:
-            block = if_stack.pop()
-            block['end_if'] = i
-            if block['then'] is None:
-                diagnostics.append(Diagnostic(
-                    range=Range(
-                        start=Position(line=block['if'], character=0),
-                        end=Position(line=block['if'], character=len(lines[block['if']]))
-                    ),
-                    message="Missing THEN after IF statement.",
-                    severity=DiagnosticSeverity.Error,
-                    source="scl-ls"
-                ))
-            if not stripped_code.rstrip().endswith(";"):
-                diagnostics.append(Diagnostic(
-                    range=Range(
-                        start=Position(line=i, character=len(stripped_code)),
-                        end=Position(line=i, character=len(stripped_code) + 1)
-                    ),
-                    message="Missing semicolon ';'",
-                    severity=DiagnosticSeverity.Error,
-                    source="scl-ls"
-                ))
-
-    for block in if_stack:
-        diagnostics.append(Diagnostic(
-            range=Range(
-                start=Position(line=block['if'], character=0),
-                end=Position(line=block['if'], character=len(lines[block['if']]))
-            ),
-            message="END_IF missing after IF statment.",
-            severity=DiagnosticSeverity.Error,
-            source="scl-ls"
-        ))
-
-    return diagnostics
-
-
-def is_empty_else_block(lines: list[str], start_index: int) -> bool:
-    for j in range(start_index + 1, len(lines)):
-        line = lines[j].split("//")[0].strip()
-        if not line:
             continue
-        if ";" in line:
-            return False
-        if line.strip().upper().startswith("END_IF"):
-            return True
-    return False
+        if not node.flags or (kind not in END_KEYWORDS and kind != "ELSIF"):
+            continue
+        if node.flags & MISSING_KEYWORD:
+            diagnostics.append(Diagnostic(
+                range=line_range(lexed, line + node.line),
+                message=f"Missing {BLOCK_KEYWORDS[kind]} after {kind} statement.",
+                severity=DiagnosticSeverity.Error,
+                source="scl-ls"
+            ))
+        if node.flags & MISSING_END:
+            diagnostics.append(Diagnostic(
+                range=line_range(lexed, line + node.line),
+                message=f"{END_KEYWORDS[kind]} missing after {kind} statement.",
+                severity=DiagnosticSeverity.Error,
+                source="scl-ls"
+            ))
+        elif node.flags & MISSING_SEMICOLON:
+            diagnostics.append(missing_semicolon(line + node.end_line, node.end))
+    return diagnostics
 
 
-def is_empty_else_block(lines: list[str], start_index: int) -> bool:
-    for j in range(start_index + 1, len(lines)):
-        line = lines[j].split("//")[0].strip()
-        if not line:
-            continue
-        if ";" in line:
-            return False
-        if line.strip().upper().startswith("END_IF"):
-            return True
-    return False
+def line_range(lexed: LexedDocument, line: int) -> Range:
+    return Range(
+        start=Position(line=line, character=0),
+        end=Position(line=line, character=len(lexed.lines[line].rstrip("\r\n")))
+    )
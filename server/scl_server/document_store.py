@@ -0,0 +1,177 @@
+from lsprotocol.types import TextDocumentContentChangeEvent, TextDocumentContentChangeEvent_Type1
+from pygls.workspace import Document
+
+from hover_index import HoverIndex
+from lexer import LexedDocument
+from memory_manager import MODEL_BYTES_PER_CHAR, memory
+from occurrence_index import OccurrenceIndex
+from pair_index import PairIndex
+from parser_body import SyntaxTree
+from parser_structured import StructuredSCLParser
+from semantic_tokens import SemanticTokensCache
+from telemetry import telemetry
+
+
+class DocumentModel:
+    """Parsed state of a single document at a single version."""
+
+    def __init__(self, uri: str, version, lexed: LexedDocument, parser: StructuredSCLParser, tree: SyntaxTree):
+        self.uri = uri
+        self.version = version
+        self.lexed = lexed
+        self.parser = parser  # declarations
+        self.tree = tree  # statements
+        self._pairs = None
+        self._hovers = None
+        self._occurrences = None
+        self._semantic_tokens = None
+
+    @property
+    def lines(self) -> list[str]:
+        return self.lexed.lines
+
+    @property
+    def pairs(self) -> PairIndex:
+        """Bracket and keyword pairs, built on first use for each version."""
+        if self._pairs is None or self._pairs.lexed is not self.lexed:
+            telemetry.count("pair_index.miss")
+            with telemetry.timer("pair_index.build", len(self.lexed.lines)):
+                self._pairs = PairIndex(self.lexed)
+        else:
+            telemetry.count("pair_index.hit")
+        return self._pairs
+
+    @property
+    def hovers(self) -> HoverIndex:
+        """Hover contents, cached for each version and kept while the declarations are unchanged."""
+        if self._hovers is None or self._hovers.lexed is not self.lexed:
+            self._hovers = HoverIndex(self.lexed, self.parser, self._hovers)
+        return self._hovers
+
+    @property
+    def occurrences(self) -> OccurrenceIndex:
+        """Uses of the names of the document, built on first use for each version."""
+        if self._occurrences is None or self._occurrences.lexed is not self.lexed:
+            self._occurrences = OccurrenceIndex(self.lexed, self.parser)
+        return self._occurrences
+
+    @property
+    def semantic_tokens(self) -> SemanticTokensCache:
+        """Semantic tokens, kept across versions to reuse unchanged lines and send deltas."""
+        if self._semantic_tokens is None:
+            self._semantic_tokens = SemanticTokensCache()
+        return self._semantic_tokens
+
+
+class DocumentStore:
+    """URI -> DocumentModel cache shared by handlers and diagnostics.
+
+    A model is reused as long as the document version is unchanged, so repeated
+    hover/completion requests against the same text cost a dict lookup.
+    Models are tracked by the memory manager, which drops those of documents
+    that aren't open when over budget; get() parses them again.
+    """
+
+    def __init__(self):
+        self._models = {}  # uri -> DocumentModel
+
+    def get(self, doc: Document) -> DocumentModel:
+        version = _version_key(doc)
+        model = self._models.get(doc.uri)
+        if model is not None and model.version == version:
+            telemetry.count("document_store.hit")
+            memory.touch(doc.uri)
+            return model
+
+        telemetry.count("document_store.miss")
+        with telemetry.timer("document_store.parse") as timer:
+            lexed = LexedDocument.from_text(doc.source)
+            timer.size = len(lexed.lines)
+            parser = StructuredSCLParser()
+            parser.parse_lexed(lexed)
+            model = DocumentModel(doc.uri, version, lexed, parser, SyntaxTree.from_lexed(lexed))
+        self._models[doc.uri] = model
+        memory.track(doc.uri, "model", len(doc.source) * MODEL_BYTES_PER_CHAR, self.remove)
+        return model
+
+    def update(self, doc: Document, changes: list[TextDocumentContentChangeEvent]) -> DocumentModel:
+        """Bring the model up to date after `changes` were applied to `doc`.
+
+        Incremental changes are mapped to a single changed line window so the
+        lexer and parsers only re-scan the edited region instead of the whole
+        document.
+        """
+        model = self._models.get(doc.uri)
+        lines = doc.source.splitlines(True)
+        window = _changed_window(changes, len(model.lines)) if model is not None else None
+        if window is None:
+            self._models.pop(doc.uri, None)
+            return self.get(doc)
+
+        start, suffix = window
+        old_end = len(model.lines) - suffix
+        new_end = len(lines) - suffix
+        with telemetry.timer("document_store.update", len(lines)):
+            lexed, relexed = model.lexed.edited(lines, min(start, old_end, new_end), old_end, new_end)
+            if relexed is None:
+                parser = StructuredSCLParser()
+                parser.parse_lexed(lexed)
+                tree = SyntaxTree.from_lexed(lexed)
+            else:
+                parser = model.parser.edited(lexed, *relexed)
+                tree = model.tree.edited(lexed, *relexed)
+        model.version = _version_key(doc)
+        model.lexed = lexed
+        model.parser = parser
+        model.tree = tree
+        memory.track(doc.uri, "model", len(doc.source) * MODEL_BYTES_PER_CHAR, self.remove)
+        return model
+
+    def peek(self, uri: str) -> DocumentModel | None:
+        """The model of `uri` at whatever version was last parsed, without parsing."""
+        return self._models.get(uri)
+
+    def remove(self, uri: str):
+        self._models.pop(uri, None)
+        memory.untrack(uri, "model")
+
+
+def _version_key(doc: Document):
+    # Documents read from disk (not opened by the client) have no version
+    if doc.version is not None:
+        return doc.version
+    return ("hash", hash(doc.source))
+
+
+def _changed_window(changes: list[TextDocumentContentChangeEvent], line_count: int) -> tuple[int, int] | None:
+    """Return (first changed line, number of unchanged trailing lines) for a
+    batch of incremental changes, or None if any change replaces the full text."""
+    if not changes:
+        return line_count, 0
+    start = line_count
+    suffix = line_count
+    for change in changes:
+        if not isinstance(change, TextDocumentContentChangeEvent_Type1):
+            return None
+        first, last = change.range.start.line, change.range.end.line
+        # An edit past the last line is appended to it by pygls
+        start = max(0, min(start, first, line_count - 1))
+        suffix = min(suffix, max(0, line_count - 1 - last))
+        # Line breaks counted the same way as str.splitlines()
+        line_count += len((change.text + "x").splitlines()) - 1 - (last - first)
+    return start, suffix
+
+
+store = DocumentStore()
+
+
+def get_model(doc: Document) -> DocumentModel:
+    return store.get(doc)
+
+
+def update_model(doc: Document, changes: list[TextDocumentContentChangeEvent]) -> DocumentModel:
+    return store.update(doc, changes)
+
+
+def get_parser(doc: Document) -> StructuredSCLParser:
+    return store.get(doc).parser
@@ -1,6 +1,7 @@
-import re
 from lsprotocol.types import (
     CompletionItem,
+    CompletionItemKind,
+    CompletionList,
     CompletionParams,
     Hover,
     HoverParams,
@@ -12,32 +13,28 @@ from lsprotocol.types import (
     Range,
     Position,
     Diagnostic, 
-    DiagnosticSeverity
+    DiagnosticSeverity,
+    SemanticTokens,
+    SemanticTokensDelta,
+    SemanticTokensDeltaParams,
+    SemanticTokensParams,
 )
 from pygls.server import LanguageServer
 from pygls.workspace import Document
 
-from parser_structured import StructuredSCLParser
-
-# Initialize parser instance
-parser = StructuredSCLParser()
-
-def update_parser(doc):
-    parser.parse(doc.source)
-
-def find_hover_token_with_segment(line: str, char: int) -> tuple[str, int] | None:
-    if char > len(line):
-        return None
-    start = char
-    end = char
-
-    while start > 0 and (line[start - 1].isalnum() or line[start - 1] in '._'):
-        start -= 1
-    while end < len(line) and (line[end].isalnum() or line[end] in '._'):
-        end += 1
-
-    token = line[start:end]
-    if not token:
+from completion_index import completion_indexes
+from document_store import DocumentModel, get_model
+from lexer import IDENT, QUOTED_IDENT, LexedDocument, access_path
+from parser_structured import VariableNode
+from settings import settings
+from type_resolver import type_resolver
+from workspace_index import workspace_index
+
+def find_hover_token_with_segment(lexed: LexedDocument, line: int, char: int) -> tuple[str, int] | None:
+    for token, start, end in lexed.dotted_names(line):
+        if start <= char <= end:
+            break
+    else:
         return None
 
     relative_pos = char - start
@@ -53,131 +50,185 @@ def find_hover_token_with_segment(line: str, char: int) -> tuple[str, int] | Non
 
     return token, seg_index
 
-def handle_hover(ls: LanguageServer, params: HoverParams) -> Hover | None:
-    doc = ls.workspace.get_document(params.text_document.uri)
-    update_parser(doc)
 
-    line = doc.lines[params.position.line]
-    char = params.position.character
-
-    token_info = find_hover_token_with_segment(line, char)
-    if not token_info:
-        return None
+def find_completion_path(lexed: LexedDocument, line: int, char: int) -> str | None:
+    """Access path typed up to the cursor ("motor.sp", "recipes[].", see
+    lexer.access_path), None when the cursor isn't at a name or after a dot."""
+    text = lexed.lines[line]
+    tokens = lexed.tokens[line]
+    for index, (kind, start, end) in enumerate(tokens):
+        if start >= char:
+            break
+        if kind == IDENT and char <= end:
+            path = access_path(text, tokens, index)
+            return path[:len(path) - (end - char)] if path is not None else None
+        if end == char and text[start:end] == ".":
+            path = access_path(text, tokens, index - 1) if index and tokens[index - 1][2] == start else None
+            return path + "." if path is not None else None
+        if char < end:
+            # Inside a comment, string, "quoted name" or operator
+            return None
+    return None
 
-    full_token, segment_index = token_info
-    path = full_token.split('.')
-    target_path = path[:segment_index + 1]
-    full_path_str = ".".join(target_path)
+def handle_hover(ls: LanguageServer, params: HoverParams) -> Hover | None:
+    """Type, default, comments and declaration of the variable at the cursor,
+    or the members of the UDT, FB or DB named there."""
+    doc = ls.workspace.get_text_document(params.text_document.uri)
+    model = get_model(doc)
+    line, char = params.position.line, params.position.character
 
-    node = parser.all_nodes.get(full_path_str)
-    if not node:
+    if line >= len(model.lines):
         return None
+    kind = hover_markup_kind(ls)
+    token_info = find_hover_token_with_segment(model.lexed, line, char)
+    if token_info:
+        full_token, segment_index = token_info
+        path = ".".join(full_token.split(".")[:segment_index + 1])
+        node = model.parser.all_nodes.get(path)
+        if node is not None:
+            return model.hovers.variable(node, kind)
+        node = find_node(model, path)
+        if isinstance(node, VariableNode):
+            return model.hovers.variable(node, kind, local=False)
+
+    # Type names (UDTs, FBs) and DBs, quoted or not
+    index = model.lexed.token_at(line, char)
+    if index is None:
+        return None
+    token_kind, start, end = model.lexed.tokens[line][index]
+    if token_kind not in (IDENT, QUOTED_IDENT):
+        return None
+    # Members of array elements and "quoted" DBs, which aren't plain dotted names
+    path = access_path(model.lines[line], model.lexed.tokens[line], index)
+    if path is not None and "." in path:
+        node = find_node(model, path)
+        if isinstance(node, VariableNode):
+            return model.hovers.variable(node, kind, local=False)
+    unit = workspace_index.units.get(model.lines[line][start:end].strip('"'))
+    if unit is None:
+        return None
+    return model.hovers.unit(unit, kind)
+
+def hover_markup_kind(ls: LanguageServer) -> MarkupKind:
+    """Markdown if the client prefers it for hovers, plain text otherwise."""
+    text_document = ls.client_capabilities.text_document
+    hover = text_document.hover if text_document is not None else None
+    for kind in (hover.content_format or []) if hover is not None else []:
+        if kind in (MarkupKind.Markdown, MarkupKind.PlainText):
+            return kind
+    return MarkupKind.PlainText
+
+def handle_completion(ls: LanguageServer, params: CompletionParams) -> CompletionList:
+    """Ranked completions of the scope at the cursor, at most settings.completion_max_items.
+
+    Items carry only a label; completionItem/resolve adds the details.
+    """
+    doc = ls.workspace.get_text_document(params.text_document.uri)
+    model = get_model(doc)
+    empty = CompletionList(is_incomplete=False, items=[])
+
+    if params.position.line >= len(model.lines):
+        return empty
+    full_path = find_completion_path(model.lexed, params.position.line, params.position.character)
+    if full_path is None:
+        return empty
 
-    # Build comment chain
-    comment_chain = []
-    for i in range(len(target_path)):
-        sub_path = ".".join(target_path[:i+1])
-        n = parser.all_nodes.get(sub_path)
-        if n and n.comment:
-            comment_chain.append(n.comment)
-    comment_str = ", ".join(comment_chain) if comment_chain else ""
-
-    if node.data_type == "STRUCT":
-        type_str = "Type: STRUCT"
-        comment_out = f"\nComment:\n{comment_str}" if comment_str else ""
-        result = f"{type_str}{comment_out}"
-    else:
-        type_str = f"Type: {node.data_type}"
-        default_str = f"\nDefault: {node.default}" if node.default else ""
-        comment_out = f"\nComment: {comment_str}" if comment_str else ""
-        result = f"{type_str}{default_str}{comment_out}"
-
-    return Hover(contents=MarkupContent(kind=MarkupKind.PlainText, value=result))
-
-def handle_completion(ls: LanguageServer, params: CompletionParams) -> list[CompletionItem]:
-    doc = ls.workspace.get_document(params.text_document.uri)
-    update_parser(doc)
-
-    line = doc.lines[params.position.line][:params.position.character]
-    match = re.search(r'([\w.]+)$', line)
-    if not match:
-        return []
-
-    full_path = match.group(1)
     path_parts = full_path.split('.')
     prefix = path_parts[-1]
-    path = path_parts[:-1]
-    parent_path_str = ".".join(path) if path else None
+    parent_path_str = ".".join(path_parts[:-1])
 
+    limit = settings.completion_max_items
     if parent_path_str:
-        parent_node = parser.all_nodes.get(parent_path_str)
-        candidates = list(parent_node.children.keys()) if parent_node and parent_node.children else []
+        # Members of STRUCTs, global DBs and variables of UDT, FB or ARRAY types
+        scope = type_resolver.scope(model.parser.variables, parent_path_str)
+        scopes = [scope] if scope else []
     else:
-        candidates = list(parser.variables.keys())
-
-    filtered = [c for c in candidates if c.startswith(prefix)]
-    return [CompletionItem(label=s) for s in filtered]
+        # Global DBs of the workspace complete like variables of the document
+        scopes = [model.parser.variables, workspace_index.global_units]
+
+    matches = []
+    incomplete = False
+    for scope in scopes:
+        found, more = completion_indexes.get(scope).match(prefix, limit)
+        matches += [(rank, name, scope) for rank, name in found]
+        incomplete = incomplete or more
+    matches.sort(key=lambda match: match[0])
+    if len(matches) > limit:
+        matches = matches[:limit]
+        incomplete = True
+
+    items = []
+    for number, (rank, name, scope) in enumerate(matches):
+        path = f"{parent_path_str}.{name}" if parent_path_str else name
+        items.append(CompletionItem(
+            label=name,
+            kind=completion_kind(scope[name], bool(parent_path_str)),
+            sort_text=f"{number:05d}",
+            data={"uri": doc.uri, "path": path},
+        ))
+    return CompletionList(is_incomplete=incomplete, items=items)
+
+def handle_completion_resolve(ls: LanguageServer, item: CompletionItem) -> CompletionItem:
+    """Fill in the type, default and comment of an item returned by handle_completion."""
+    data = item.data if isinstance(item.data, dict) else {}
+    if "uri" not in data or "path" not in data:
+        return item
+    model = get_model(ls.workspace.get_text_document(data["uri"]))
+    node = find_node(model, data["path"])
+    if isinstance(node, VariableNode):
+        item.detail = node.data_type
+        documentation = [f"Default: {node.default}"] if node.default else []
+        if node.comment:
+            documentation.append(node.comment)
+        if documentation:
+            item.documentation = MarkupContent(kind=MarkupKind.PlainText, value="\n".join(documentation))
+    elif node is not None:
+        item.detail = f"{node.kind} {node.name}"
+    return item
+
+def find_node(model: DocumentModel, path: str):
+    """VariableNode at an access path of the document or of a global DB of the
+    workspace, following the members of UDT, FB and ARRAY types.
+
+    A bare global DB name gives its UnitSymbols.
+    """
+    node = model.parser.all_nodes.get(path)
+    if node is not None:
+        return node
+    found = type_resolver.resolve(model.parser.variables, path)
+    return found[0] if found is not None else None
+
+def completion_kind(node, member: bool) -> CompletionItemKind:
+    if not isinstance(node, VariableNode):
+        return CompletionItemKind.Module
+    if node.var_type == "constant":
+        return CompletionItemKind.Constant
+    if node.data_type == "STRUCT":
+        return CompletionItemKind.Struct
+    return CompletionItemKind.Field if member else CompletionItemKind.Variable
 
 def handle_highlight(ls: LanguageServer, params: DocumentHighlightParams) -> list[DocumentHighlight]:
-    doc = ls.workspace.get_document(params.text_document.uri)
-    lines = doc.lines
+    doc = ls.workspace.get_text_document(params.text_document.uri)
+    model = get_model(doc)
     pos = params.position
 
-    if pos.line >= len(lines):
+    if pos.line >= len(model.lines):
         return []
-
-    line = lines[pos.line]
-    if pos.character >= len(line):
-        return []
-
-    char = line[pos.character]
-    pairs = {'(': ')', ')': '(', '{': '}', '}': '{', '[': ']', ']': '['}
-    openers = '([{'
-    closers = ')]}'
-
-    def find_match(lines, line_idx, char_idx, open_br, close_br, forward=True):
-        stack = 1
-        if forward:
-            for l in range(line_idx, len(lines)):
-                line_text = lines[l]
-                r = range(char_idx + 1, len(line_text)) if l == line_idx else range(len(line_text))
-                for c in r:
-                    if line_text[c] == open_br:
-                        stack += 1
-                    elif line_text[c] == close_br:
-                        stack -= 1
-                        if stack == 0:
-                            return Position(line=l, character=c)
-        else:
-            for l in range(line_idx, -1, -1):
-                line_text = lines[l]
-                r = range(char_idx - 1, -1, -1) if l == line_idx else range(len(line_text) - 1, -1, -1)
-                for c in r:
-                    if line_text[c] == close_br:
-                        stack += 1
-                    elif line_text[c] == open_br:
-                        stack -= 1
-                        if stack == 0:
-                            return Position(line=l, character=c)
-        return None
-
-    if char in openers:
-        match = find_match(lines, pos.line, pos.character, char, pairs[char], forward=True)
-    elif char in closers:
-        match = find_match(lines, pos.line, pos.character, pairs[char], char, forward=False)
-    else:
+    match = model.pairs.match(pos.line, pos.character)
+    if match is None:
         return []
-
-    if match:
-        return [
-            DocumentHighlight(
-                range=Range(start=pos, end=Position(line=pos.line, character=pos.character + 1)),
-                kind=DocumentHighlightKind.Text,
-            ),
-            DocumentHighlight(
-                range=Range(start=match, end=Position(line=match.line, character=match.character + 1)),
-                kind=DocumentHighlightKind.Text,
-            ),
-        ]
-    return []
-
+    return [
+        DocumentHighlight(
+            range=Range(start=Position(line=line, character=start), end=Position(line=line, character=end)),
+            kind=DocumentHighlightKind.Text,
+        )
+        for line, start, end in match
+    ]
+
+def handle_semantic_tokens(ls: LanguageServer, params: SemanticTokensParams) -> SemanticTokens:
+    model = get_model(ls.workspace.get_text_document(params.text_document.uri))
+    return model.semantic_tokens.full(model.lexed, model.parser)
+
+def handle_semantic_tokens_delta(ls: LanguageServer, params: SemanticTokensDeltaParams) -> SemanticTokens | SemanticTokensDelta:
+    model = get_model(ls.workspace.get_text_document(params.text_document.uri))
+    return model.semantic_tokens.delta(model.lexed, model.parser, params.previous_result_id)
@@ -0,0 +1,134 @@
+import os
+
+from lsprotocol.types import Hover, MarkupContent, MarkupKind
+
+from lexer import LexedDocument
+from parser_structured import StructuredSCLParser, VariableNode
+from telemetry import telemetry
+
+# Members listed in the hover of a TYPE, FUNCTION_BLOCK, DATA_BLOCK, ...
+MAX_UNIT_MEMBERS = 20
+
+
+class HoverIndex:
+    """Hover contents of the variables and units shown in one document version.
+
+    A payload is built the first time its node or unit is hovered and then
+    reused for every hover on it, in the following versions too as long as
+    their parser shares the node tree and the declaring lines (edits that
+    didn't touch or move a declaration). The comment chain comes from the
+    node's parents, so the cost doesn't depend on how deep the node is
+    nested, and the declaring lines are looked up once per declarations.
+    """
+
+    def __init__(self, lexed: LexedDocument, parser: StructuredSCLParser, previous: "HoverIndex | None" = None):
+        self.lexed = lexed
+        self.parser = parser
+        self._hovers = {}  # (node or unit, markup kind) -> Hover
+        if (
+            previous is not None and previous._hovers
+            and previous.parser.variables is parser.variables
+            and previous.parser.declaration_lines() is parser.declaration_lines()
+        ):
+            self._hovers = previous._hovers
+
+    def variable(self, node: VariableNode, kind: MarkupKind, local: bool = True) -> Hover:
+        """Hover of a declared variable; `local` if it is declared in this document."""
+        key = (node, kind)
+        hover = self._hovers.get(key)
+        if hover is not None:
+            telemetry.count("hover_index.hit")
+            return hover
+        telemetry.count("hover_index.miss")
+        path = []
+        parent = node
+        while parent is not None:
+            path.append(parent)
+            parent = parent.parent
+        path.reverse()
+        comments = [n.comment for n in path if n.comment]
+        line = self.declaration_line(tuple(n.name for n in path)) if local else None
+        if kind == MarkupKind.Markdown:
+            value = variable_markdown(node, comments, line)
+        else:
+            value = variable_text(node, comments, line)
+        hover = self._hovers[key] = Hover(contents=MarkupContent(kind=kind, value=value))
+        return hover
+
+    def unit(self, unit, kind: MarkupKind) -> Hover:
+        """Hover of a program unit of the workspace index (UnitSymbols)."""
+        key = (unit, kind)
+        hover = self._hovers.get(key)
+        if hover is not None:
+            telemetry.count("hover_index.hit")
+            return hover
+        telemetry.count("hover_index.miss")
+        if kind == MarkupKind.Markdown:
+            value = unit_markdown(unit)
+        else:
+            value = unit_text(unit)
+        hover = self._hovers[key] = Hover(contents=MarkupContent(kind=kind, value=value))
+        return hover
+
+    def declaration_line(self, path: tuple) -> int | None:
+        return self.parser.declaration_lines().get(path)
+
+
+def variable_text(node: VariableNode, comments: list[str], line: int | None) -> str:
+    comment = ", ".join(comments)
+    if node.data_type == "STRUCT":
+        text = "Type: STRUCT" + (f"\nComment:\n{comment}" if comment else "")
+    else:
+        text = f"Type: {node.data_type}"
+        if node.default:
+            text += f"\nDefault: {node.default}"
+        if comment:
+            text += f"\nComment: {comment}"
+    declared = [part for part in (node.block_type, f"line {line + 1}" if line is not None else None) if part]
+    if declared:
+        text += f"\nDeclared: {', '.join(declared)}"
+    return text
+
+
+def variable_markdown(node: VariableNode, comments: list[str], line: int | None) -> str:
+    declaration = f"{node.name} : {node.data_type}"
+    if node.default:
+        declaration += f" := {node.default}"
+    parts = [f"```scl\n{declaration}\n```"]
+    declared = [part for part in (node.block_type and f"`{node.block_type}`",
+                                  f"line {line + 1}" if line is not None else None) if part]
+    if declared:
+        parts.append(" · ".join(declared))
+    if comments:
+        parts.append(" › ".join(comments))
+    return "\n\n".join(parts)
+
+
+def unit_members(unit) -> tuple[list[VariableNode], int]:
+    variables = unit.variables
+    return list(variables.values())[:MAX_UNIT_MEMBERS], len(variables)
+
+
+def unit_text(unit) -> str:
+    members, count = unit_members(unit)
+    text = f'{unit.kind} "{unit.name}"'
+    if unit.path:
+        text += f"\nDeclared: {os.path.basename(unit.path)}, line {unit.line + 1}"
+    if members:
+        text += "\nMembers:" + "".join(f"\n  {node.name} : {node.data_type}" for node in members)
+        if count > len(members):
+            text += f"\n  ... {count - len(members)} more"
+    return text
+
+
+def unit_markdown(unit) -> str:
+    members, count = unit_members(unit)
+    parts = [f'```scl\n{unit.kind} "{unit.name}"\n```']
+    if unit.path:
+        parts.append(f"{os.path.basename(unit.path)}, line {unit.line + 1}")
+    if members:
+        lines = [f"{node.name} : {node.data_type}" for node in members]
+        if count > len(members):
+            lines.append(f"(* ... {count - len(members)} more *)")
+        parts.append("```scl\n" + "\n".join(lines) + "\n```")
+    return "\n\n".join(parts)
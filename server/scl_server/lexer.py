@@ -0,0 +1,299 @@
+import re
+
+# Token kinds
+IDENT = 0
+NUMBER = 1
+TYPED_LITERAL = 2  # T#5s, INT#100, 16#FF, STRING#'x'
+STRING = 3  # 'text'
+QUOTED_IDENT = 4  # "Block_Name"
+OPERATOR = 5
+COMMENT = 6  # // line comment or one line of a (* block comment *)
+
+KIND_NAMES = ("ident", "number", "typed_literal", "string", "quoted_ident", "operator", "comment")
+
+TOKEN_PATTERN = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<line_comment>//.*)
+  | (?P<block_comment>\(\*)
+  | (?P<string>'(?:[^'$\r\n]|\$.)*'?)
+  | (?P<quoted>"[^"\r\n]*"?)
+  | (?P<typed>\w+\#(?:'(?:[^'$\r\n]|\$.)*'?|-?[\w.:\-]+))
+  | (?P<number>\d[\d_]*(?:\.\d[\d_]*)?(?:[eE][+-]?\d+)?)
+  | (?P<ident>[^\W\d]\w*)
+  | (?P<operator>:=|=>|<=|>=|<>|\*\*|\.\.|[^\s\w])
+""", re.VERBOSE)
+
+_GROUP_KINDS = {
+    "line_comment": COMMENT,
+    "string": STRING,
+    "quoted": QUOTED_IDENT,
+    "typed": TYPED_LITERAL,
+    "number": NUMBER,
+    "ident": IDENT,
+    "operator": OPERATOR,
+}
+
+# Lines share identical (kind, start, end) tuples, which keeps the token
+# stream of large generated sources small
+_token_cache = {}
+
+
+def tokenize_line(line: str, in_comment: bool = False) -> tuple[list[tuple[int, int, int]], bool]:
+    """Split one line into (kind, start, end) tokens.
+
+    `in_comment` tells whether the line starts inside a (* block comment *);
+    the returned flag is the same state for the start of the next line.
+    Whitespace is dropped, every other character belongs to a token.
+    """
+    tokens = []
+    cache = _token_cache
+    pos = 0
+    length = len(line)
+    if in_comment:
+        close = line.find("*)")
+        if close == -1:
+            end = len(line.rstrip("\r\n"))
+            if end:
+                tokens.append(cache.setdefault((COMMENT, 0, end), (COMMENT, 0, end)))
+            return tokens, True
+        pos = close + 2
+        tokens.append(cache.setdefault((COMMENT, 0, pos), (COMMENT, 0, pos)))
+
+    match = TOKEN_PATTERN.match
+    while pos < length:
+        m = match(line, pos)
+        if m is None:  # not reachable with the catch-all operator group
+            pos += 1
+            continue
+        group = m.lastgroup
+        start, pos = m.span()
+        if group == "space":
+            continue
+        if group == "block_comment":
+            close = line.find("*)", pos)
+            if close == -1:
+                end = len(line.rstrip("\r\n"))
+                tokens.append(cache.setdefault((COMMENT, start, end), (COMMENT, start, end)))
+                return tokens, True
+            pos = close + 2
+            tokens.append(cache.setdefault((COMMENT, start, pos), (COMMENT, start, pos)))
+            continue
+        token = (_GROUP_KINDS[group], start, pos)
+        tokens.append(cache.setdefault(token, token))
+    return tokens, False
+
+
+class LexedDocument:
+    """Token stream of a document, kept per line so edits can be re-lexed locally.
+
+    `lines` are the document lines (line endings may be kept) and `tokens[i]`
+    the (kind, start, end) tokens of line i, with columns into `lines[i]`.
+    """
+
+    def __init__(self, lines: list[str]):
+        self.lines = lines
+        self.tokens = []
+        self._states = []  # True if the line starts inside a block comment
+        self._end_state = False
+        in_comment = False
+        for line in lines:
+            self._states.append(in_comment)
+            line_tokens, in_comment = tokenize_line(line, in_comment)
+            self.tokens.append(line_tokens)
+        self._end_state = in_comment
+
+    @classmethod
+    def from_text(cls, text: str) -> "LexedDocument":
+        return cls(text.splitlines(True))
+
+    def edited(self, lines: list[str], start: int, old_end: int, new_end: int) -> tuple["LexedDocument", tuple[int, int, int] | None]:
+        """Lex the document after lines [start, old_end) were replaced by lines[start:new_end].
+
+        Only the edited lines are lexed, plus following lines while the block
+        comment state differs from before. Returns the new document, which
+        shares the tokens of unchanged lines with this one (neither is
+        modified afterwards, so other threads may keep reading this one), and
+        the (start, old_end, new_end) window of lines whose tokens were
+        replaced, or None when everything was lexed again.
+        """
+        old_count = len(self.lines)
+        if not (0 <= start <= old_end <= old_count and start <= new_end <= len(lines)) \
+                or len(lines) - old_count != new_end - old_end:
+            return LexedDocument(lines), None
+
+        in_comment = self._states[start] if start < old_count else self._end_state
+        new_states = []
+        new_tokens = []
+        i = start
+        while True:
+            if i >= new_end:
+                j = i - new_end + old_end
+                if j >= old_count or self._states[j] == in_comment:
+                    break
+            new_states.append(in_comment)
+            line_tokens, in_comment = tokenize_line(lines[i], in_comment)
+            new_tokens.append(line_tokens)
+            i += 1
+
+        j = i - new_end + old_end
+        lexed = LexedDocument.__new__(LexedDocument)
+        lexed.lines = lines
+        lexed.tokens = self.tokens[:start] + new_tokens + self.tokens[j:]
+        lexed._states = self._states[:start] + new_states + self._states[j:]
+        lexed._end_state = in_comment if j >= old_count else self._end_state
+        return lexed, (start, j, i)
+
+    def section(self, start: int, end: int) -> "LexedDocument":
+        """Lines [start, end) as a document of their own, sharing the tokens."""
+        lexed = LexedDocument.__new__(LexedDocument)
+        lexed.lines = self.lines[start:end]
+        lexed.tokens = self.tokens[start:end]
+        lexed._states = self._states[start:end]
+        lexed._end_state = self._states[end] if end < len(self._states) else self._end_state
+        return lexed
+
+    def text(self, line: int, token: tuple[int, int, int]) -> str:
+        return self.lines[line][token[1]:token[2]]
+
+    def code_tokens(self, line: int) -> list[tuple[int, int, int]]:
+        """Tokens of a line without comments."""
+        return [t for t in self.tokens[line] if t[0] != COMMENT]
+
+    def comment(self, line: int) -> str:
+        return comment_text(self.lines[line], self.tokens[line])
+
+    def dotted_names(self, line: int, tokens: list[tuple[int, int, int]] | None = None) -> list[tuple[str, int, int]]:
+        return dotted_names(self.lines[line], self.tokens[line] if tokens is None else tokens)
+
+    def token_at(self, line: int, character: int) -> int | None:
+        """Index of the token of `line` containing (or ending at) `character`."""
+        if line >= len(self.tokens):
+            return None
+        found = None
+        for index, (_, start, end) in enumerate(self.tokens[line]):
+            if start <= character < end:
+                return index
+            if end == character:
+                found = index
+            elif start > character:
+                break
+        return found
+
+
+def comment_text(line: str, tokens: list[tuple[int, int, int]]) -> str:
+    """Text of the comment trailing the code of a line, without its delimiters.
+
+    Falls back to the first comment when no comment follows code.
+    """
+    comment = None
+    seen_code = False
+    for token in tokens:
+        if token[0] != COMMENT:
+            seen_code = True
+        elif seen_code:
+            comment = token
+            break
+        elif comment is None:
+            comment = token
+    if comment is None:
+        return ""
+    text = line[comment[1]:comment[2]]
+    if text.startswith("//"):
+        return text[2:].strip()
+    if text.startswith("(*"):
+        text = text[2:]
+    if text.endswith("*)"):
+        text = text[:-2]
+    return text.strip()
+
+
+def dotted_names(line: str, tokens: list[tuple[int, int, int]]) -> list[tuple[str, int, int]]:
+    """Return (text, start, end) of every IDENT('.'IDENT)* run written without spaces.
+
+    Runs that continue a member access on something else (`arr[1].x`,
+    `"DB".x`) are skipped since they can't be resolved on their own.
+    """
+    names = []
+    count = len(tokens)
+    i = 0
+    while i < count:
+        kind, start, end = tokens[i]
+        if kind != IDENT:
+            i += 1
+            continue
+        previous = tokens[i - 1] if i else None
+        member = previous is not None and previous[2] == start and line[previous[1]:start] == "."
+        j = i + 1
+        while (
+            j + 1 < count
+            and tokens[j][1] == end
+            and line[tokens[j][1]:tokens[j][2]] == "."
+            and tokens[j + 1][0] == IDENT
+            and tokens[j + 1][1] == tokens[j][2]
+        ):
+            end = tokens[j + 1][2]
+            j += 2
+        if not member:
+            names.append((line[start:end], start, end))
+        i = j
+    return names
+
+
+def access_path(line: str, tokens: list, index: int) -> str | None:
+    """Path of the member access ending with tokens[index], written without spaces
+    around the dots: `"DB".a.b` gives "DB.a.b" and `arr[i + 1].x` "arr[].x", "[]"
+    marking an element access. None if tokens[index] isn't a name or "]"."""
+    parts = []
+    suffix = ""
+    while index >= 0:
+        kind, start, end = tokens[index]
+        if line[start:end] == "]":
+            depth = 0
+            for index in range(index, -1, -1):
+                text = line[tokens[index][1]:tokens[index][2]]
+                depth += (text == "]") - (text == "[")
+                if not depth:
+                    break
+            if depth or not index:
+                return None
+            suffix = "[]" + suffix
+            index -= 1
+            if tokens[index][2] != tokens[index + 1][1]:
+                return None
+            continue
+        if kind not in (IDENT, QUOTED_IDENT):
+            return None
+        parts.append(line[start:end].strip('"') + suffix)
+        suffix = ""
+        if index < 2 or tokens[index - 1][2] != start or line[tokens[index - 1][1]:start] != "." \
+                or tokens[index - 2][2] != tokens[index - 1][1]:
+            break
+        index -= 2
+    parts.reverse()
+    return ".".join(parts)
+
+
+def token_text(line: str, token: tuple[int, int, int]) -> str:
+    return line[token[1]:token[2]]
+
+
+def dotted_end(line: str, tokens: list, index: int) -> int:
+    """Index just past the IDENT('.'IDENT)* run starting at tokens[index]."""
+    end = index + 1
+    while (
+        end + 1 < len(tokens)
+        and tokens[end][0] == OPERATOR
+        and line[tokens[end][1]:tokens[end][2]] == "."
+        and tokens[end + 1][0] == IDENT
+    ):
+        end += 2
+    return end
+
+
+def find_operator(line: str, tokens: list, operator: str, start: int = 0) -> int | None:
+    """Index of the first `operator` token at or after tokens[start]."""
+    for index in range(start, len(tokens)):
+        kind, token_start, token_end = tokens[index]
+        if kind == OPERATOR and line[token_start:token_end] == operator:
+            return index
+    return None
@@ -0,0 +1,341 @@
+"""Run the editor's diagnostics on .scl files from the command line, e.g. in CI.
+
+    python -m scl_server lint PATH... [--format text|json|sarif] [--jobs N]
+    server.exe lint PATH...
+
+PATHs are .scl files or directories searched for them. The global DBs of
+the --project directories (by default the directories given) are indexed
+first, so references to them are resolved as in the editor. Files are
+checked in worker processes and results are printed as each file
+completes: one line per diagnostic (text), one JSON object per file (json),
+or a single SARIF 2.1.0 log at the end (sarif).
+
+The diagnostics of every file are cached by content hash in --cache, so a
+later run only checks files that changed. The exit status is 1 when a
+diagnostic at or above --fail-on severity was reported.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+
+from lsprotocol.types import DiagnosticSeverity
+
+from pull_diagnostics import file_diagnostics
+from workspace_index import _digest, find_scl_files, workspace_index
+
+logger = logging.getLogger(__name__)
+
+# Bump when the checks change, so cached diagnostics are not reused
+LINT_CACHE_VERSION = 2
+DEFAULT_CACHE = ".scl-lint-cache.json"
+# Below this many files to check, starting worker processes costs more than it saves
+POOL_MIN_FILES = 16
+
+SEVERITIES = {
+    "error": DiagnosticSeverity.Error,
+    "warning": DiagnosticSeverity.Warning,
+    "information": DiagnosticSeverity.Information,
+    "hint": DiagnosticSeverity.Hint,
+}
+SEVERITY_NAMES = {value: name for name, value in SEVERITIES.items()}
+SARIF_LEVELS = {
+    DiagnosticSeverity.Error: "error",
+    DiagnosticSeverity.Warning: "warning",
+    DiagnosticSeverity.Information: "note",
+    DiagnosticSeverity.Hint: "note",
+}
+
+# rule id -> (pattern of the messages of diagnostics.py, description)
+RULES = {
+    "name-length": (re.compile(r"Variable '.*' is longer than"), "Variable names longer than 24 characters"),
+    "name-prefix-collision": (
+        re.compile(r"Variable '.*' has the same first 24 characters"),
+        "Variables of a scope sharing their first 24 characters",
+    ),
+    "undefined-variable": (re.compile(r"Variable '.*' is not defined"), "Undeclared variables"),
+    "missing-parenthesis": (re.compile(r"Missing closing parenthesis"), "Unclosed parentheses"),
+    "missing-semicolon": (re.compile(r"Missing semicolon"), "Statements without a semicolon"),
+    "missing-keyword": (re.compile(r"Missing \w+ after \w+ statement"), "THEN, DO or OF missing after a condition"),
+    "missing-end": (re.compile(r"END_\w+ missing after"), "Blocks without their END_ keyword"),
+}
+
+
+def rule_id(message: str) -> str:
+    for rule, (pattern, _) in RULES.items():
+        if pattern.match(message):
+            return rule
+    return "scl"
+
+
+def check_file(path: str) -> tuple[str, list | None, str | None]:
+    """(path, diagnostics as [line, character, end line, end character, severity, message], error)."""
+    try:
+        diagnostics = file_diagnostics(path)
+    except (OSError, ValueError) as e:
+        return path, None, str(e)
+    return path, [
+        [d.range.start.line, d.range.start.character, d.range.end.line, d.range.end.character,
+         int(d.severity or DiagnosticSeverity.Error), d.message]
+        for d in diagnostics
+    ], None
+
+
+def _check_batch(paths: list[str]) -> list:
+    # Runs in the worker processes of check_files
+    return [check_file(path) for path in paths]
+
+
+def _init_worker(global_names: frozenset):
+    workspace_index.global_names = global_names
+
+
+def check_files(paths: list[str], jobs: int):
+    """Yield check_file results in the order the files complete."""
+    if jobs <= 1 or len(paths) < POOL_MIN_FILES:
+        for path in paths:
+            yield check_file(path)
+        return
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    size = max(1, min(16, len(paths) // (jobs * 4)))
+    batches = [paths[i:i + size] for i in range(0, len(paths), size)]
+    # Not forked: the index executor has started a thread, see WorkspaceIndex._parse_files
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_worker, initargs=(workspace_index.global_names,)) as pool:
+        for future in as_completed([pool.submit(_check_batch, batch) for batch in batches]):
+            yield from future.result()
+
+
+class LintCache:
+    """Diagnostics of previous runs keyed by the sha1 of the file contents.
+
+    The entries are only valid for the same checks and the same global DB
+    names, which are part of the cache key.
+    """
+
+    def __init__(self, path: str | None, global_names: frozenset):
+        self.path = path
+        self.key = hashlib.sha1(
+            "\n".join([str(LINT_CACHE_VERSION)] + sorted(global_names)).encode("utf-8")
+        ).hexdigest()
+        self.entries = {}  # digest -> diagnostics
+        self.used = {}
+
+    def load(self):
+        if self.path is None or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            logger.warning("Ignoring unreadable lint cache %s", self.path)
+            return
+        if isinstance(data, dict) and data.get("key") == self.key and isinstance(data.get("files"), dict):
+            self.entries = data["files"]
+
+    def get(self, digest: str) -> list | None:
+        diagnostics = self.entries.get(digest)
+        if diagnostics is not None:
+            self.used[digest] = diagnostics
+        return diagnostics
+
+    def put(self, digest: str, diagnostics: list):
+        self.used[digest] = diagnostics
+
+    def save(self):
+        # Only the entries of this run are kept, so the cache doesn't grow with old contents
+        if self.path is None:
+            return
+        try:
+            temporary = f"{self.path}.{os.getpid()}.tmp"
+            with open(temporary, "w", encoding="utf-8") as f:
+                json.dump({"key": self.key, "files": self.used}, f, separators=(",", ":"))
+            os.replace(temporary, self.path)
+        except OSError:
+            logger.warning("Failed to write lint cache %s", self.path, exc_info=True)
+
+
+class TextReport:
+    def __init__(self, out):
+        self.out = out
+
+    def file(self, path: str, diagnostics: list):
+        for line, character, _, _, severity, message in diagnostics:
+            self.out.write(f"{path}:{line + 1}:{character + 1}: {SEVERITY_NAMES[severity]}: {message} [{rule_id(message)}]\n")
+        self.out.flush()
+
+    def error(self, path: str, error: str):
+        self.out.write(f"{path}: error: {error}\n")
+
+    def close(self, summary: dict):
+        counts = ", ".join(f"{summary[name]} {name}" for name in ("error", "warning", "information", "hint") if summary[name])
+        self.out.write(f"{summary['files']} files checked ({summary['cached']} cached): {counts or 'no problems'}\n")
+
+
+class JsonReport:
+    """One JSON object per file with diagnostics, as JSON lines."""
+
+    def __init__(self, out):
+        self.out = out
+
+    def file(self, path: str, diagnostics: list):
+        if not diagnostics:
+            return
+        self.out.write(json.dumps({
+            "path": path,
+            "diagnostics": [
+                {"line": line + 1, "character": character + 1, "endLine": end_line + 1,
+                 "endCharacter": end_character + 1, "severity": SEVERITY_NAMES[severity],
+                 "rule": rule_id(message), "message": message}
+                for line, character, end_line, end_character, severity, message in diagnostics
+            ],
+        }) + "\n")
+        self.out.flush()
+
+    def error(self, path: str, error: str):
+        self.out.write(json.dumps({"path": path, "error": error}) + "\n")
+
+    def close(self, summary: dict):
+        pass
+
+
+class SarifReport:
+    """A SARIF 2.1.0 log, written when all files are checked (it is a single JSON document)."""
+
+    def __init__(self, out):
+        self.out = out
+        self.results = []
+        self.notifications = []
+
+    def file(self, path: str, diagnostics: list):
+        uri = path.replace(os.sep, "/")
+        for line, character, end_line, end_character, severity, message in diagnostics:
+            self.results.append({
+                "ruleId": rule_id(message),
+                "level": SARIF_LEVELS[severity],
+                "message": {"text": message},
+                "locations": [{"physicalLocation": {
+                    "artifactLocation": {"uri": uri},
+                    "region": {"startLine": line + 1, "startColumn": character + 1,
+                               "endLine": end_line + 1, "endColumn": end_character + 1},
+                }}],
+            })
+
+    def error(self, path: str, error: str):
+        self.notifications.append({"level": "error", "message": {"text": f"{path}: {error}"}})
+
+    def close(self, summary: dict):
+        run = {
+            "tool": {"driver": {
+                "name": "scl-ls",
+                "informationUri": "https://github.com/Slickuss/scl-language-server",
+                "rules": [
+                    {"id": rule, "shortDescription": {"text": description}}
+                    for rule, (_, description) in RULES.items()
+                ],
+            }},
+            "results": self.results,
+        }
+        if self.notifications:
+            run["invocations"] = [{"executionSuccessful": False, "toolExecutionNotifications": self.notifications}]
+        json.dump({
+            "$schema": "https://json.schemastore.org/sarif-2.1.0.json",
+            "version": "2.1.0",
+            "runs": [run],
+        }, self.out, indent=2)
+        self.out.write("\n")
+
+
+REPORTS = {"text": TextReport, "json": JsonReport, "sarif": SarifReport}
+
+
+def collect_files(paths: list[str]) -> list[str]:
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += find_scl_files([path])
+        else:
+            files.append(path)
+    return list(dict.fromkeys(os.path.normpath(path) for path in files))
+
+
+def lint(args) -> int:
+    files = collect_files(args.paths)
+    projects = args.project if args.project is not None else [path for path in args.paths if os.path.isdir(path)]
+    if projects and not args.no_index:
+        workspace_index.start([os.path.abspath(path) for path in projects]).result()
+
+    cache = LintCache(None if args.no_cache else args.cache, workspace_index.global_names)
+    cache.load()
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    report = REPORTS[args.format](out)
+    summary = {**dict.fromkeys(SEVERITIES, 0), "files": len(files), "cached": 0}
+    failed = False
+    fail_at = SEVERITIES[args.fail_on]
+
+    def reported(path: str, diagnostics: list):
+        nonlocal failed
+        diagnostics.sort()
+        report.file(path, diagnostics)
+        for diagnostic in diagnostics:
+            summary[SEVERITY_NAMES[diagnostic[4]]] += 1
+            failed = failed or diagnostic[4] <= fail_at
+
+    try:
+        pending = {}  # path -> digest
+        for path in files:
+            try:
+                with open(path, "rb") as f:
+                    digest = _digest(f.read())
+            except OSError as e:
+                report.error(path, str(e))
+                failed = True
+                continue
+            diagnostics = cache.get(digest)
+            if diagnostics is None:
+                pending[path] = digest
+            else:
+                summary["cached"] += 1
+                reported(path, diagnostics)
+
+        jobs = args.jobs or os.cpu_count() or 1
+        for path, diagnostics, error in check_files(list(pending), jobs):
+            if error is not None:
+                report.error(path, error)
+                failed = True
+                continue
+            cache.put(pending[path], diagnostics)
+            reported(path, diagnostics)
+        report.close(summary)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    cache.save()
+    workspace_index.shutdown()
+    return 1 if failed else 0
+
+
+def main(argv=None) -> int:
+    arg_parser = argparse.ArgumentParser(prog="scl_server lint", description=__doc__.splitlines()[0])
+    arg_parser.add_argument("paths", nargs="+", metavar="PATH", help=".scl files or directories")
+    arg_parser.add_argument("--format", choices=sorted(REPORTS), default="text")
+    arg_parser.add_argument("--output", help="write the report to this file instead of standard output")
+    arg_parser.add_argument("--jobs", type=int, default=0, help="worker processes (default: one per CPU)")
+    arg_parser.add_argument("--project", nargs="+", metavar="DIR",
+                            help="directories whose global DBs are indexed (default: the directories given)")
+    arg_parser.add_argument("--no-index", action="store_true", help="don't index global DBs")
+    arg_parser.add_argument("--cache", default=DEFAULT_CACHE, help=f"cache file (default: {DEFAULT_CACHE})")
+    arg_parser.add_argument("--no-cache", action="store_true", help="check every file, without reading or writing a cache")
+    arg_parser.add_argument("--fail-on", choices=list(SEVERITIES), default="error",
+                            help="lowest severity that makes the exit status 1 (default: error)")
+    args = arg_parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s: %(message)s")
+    return lint(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,10 @@
 from pygls.server import LanguageServer
 from lsprotocol.types import (
     TEXT_DOCUMENT_COMPLETION,
+    COMPLETION_ITEM_RESOLVE,
+    CompletionItem,
+    CompletionList,
+    CompletionOptions,
     TEXT_DOCUMENT_HOVER,
     CompletionParams,
     HoverParams,
@@ -10,39 +14,272 @@ from lsprotocol.types import (
     DocumentHighlight,
     TEXT_DOCUMENT_DID_OPEN,
     TEXT_DOCUMENT_DID_CHANGE,
+    TEXT_DOCUMENT_DID_CLOSE,
+    TEXT_DOCUMENT_DEFINITION,
+    TEXT_DOCUMENT_REFERENCES,
+    WORKSPACE_SYMBOL,
+    TEXT_DOCUMENT_SEMANTIC_TOKENS_FULL,
+    TEXT_DOCUMENT_SEMANTIC_TOKENS_FULL_DELTA,
     DidOpenTextDocumentParams, 
-    DidChangeTextDocumentParams
+    DidChangeTextDocumentParams,
+    DidCloseTextDocumentParams,
+    DefinitionParams,
+    Location,
+    ReferenceParams,
+    SymbolInformation,
+    WorkspaceSymbolParams,
+    SemanticTokens,
+    SemanticTokensDelta,
+    SemanticTokensDeltaParams,
+    SemanticTokensParams,
+    TextDocumentSyncKind,
+    INITIALIZE,
+    InitializeParams,
+    INITIALIZED,
+    SHUTDOWN,
+    WORKSPACE_DID_CHANGE_WATCHED_FILES,
+    DidChangeWatchedFilesParams,
+    FileChangeType,
+    WorkDoneProgressBegin,
+    WorkDoneProgressEnd,
+    WorkDoneProgressReport,
+    TEXT_DOCUMENT_DIAGNOSTIC,
+    WORKSPACE_DIAGNOSTIC,
+    WORKSPACE_DIAGNOSTIC_REFRESH,
+    DiagnosticOptions,
+    DocumentDiagnosticParams,
+    WorkspaceDiagnosticParams,
 )
+from pygls.uris import to_fs_path
+from functools import partial
+import uuid
 from typing import Optional
 
-from handlers import handle_hover, handle_completion, handle_highlight
-from diagnostics import run_diagnostics
+from handlers import (
+    handle_hover, handle_completion, handle_completion_resolve, handle_highlight,
+    handle_semantic_tokens, handle_semantic_tokens_delta,
+)
+from document_store import get_model, store, update_model
+from memory_manager import memory
+from navigation import handle_definition, handle_references, handle_workspace_symbol
+from pull_diagnostics import document_diagnostic, workspace_diagnostic
+from scheduler import scheduler
+from semantic_tokens import LEGEND
+from settings import settings
+from telemetry import telemetry
+from workspace_index import SCL_EXTENSIONS, workspace_index
+
+server = LanguageServer("scl-server", "v0.1.0", text_document_sync_kind=TextDocumentSyncKind.Incremental)
+
+def document_lines(ls: LanguageServer, params) -> int | None:
+    # Size recorded with the timing of a request on a document
+    model = store.peek(params.text_document.uri)
+    return len(model.lines) if model is not None else None
+
+@server.feature(INITIALIZE)
+def initialize(ls: LanguageServer, params: InitializeParams):
+    settings.update(params.initialization_options)
+    telemetry.configure()
+
+@server.feature(INITIALIZED)
+@telemetry.timed("initialized")
+async def initialized(ls: LanguageServer, *args):
+    telemetry.start_log(ls.loop)
+    if not settings.index_workspace:
+        return
+    roots = [to_fs_path(folder.uri) for folder in ls.workspace.folders.values()] or [ls.workspace.root_path]
+    progress = None
+    window = ls.client_capabilities.window
+    if window is not None and window.work_done_progress:
+        progress = IndexProgress(ls)
+        await progress.begin()
+    future = workspace_index.start(roots, progress)
+    future.add_done_callback(partial(indexed, ls))
+    if progress is not None:
+        future.add_done_callback(progress.end)
+
+class IndexProgress:
+    """window/workDoneProgress of the initial workspace index, called from the index thread."""
+
+    def __init__(self, ls: LanguageServer):
+        self.ls = ls
+        self.token = f"scl-index-{uuid.uuid4()}"
+        self.percentage = 0
+
+    async def begin(self):
+        await self.ls.progress.create_async(self.token)
+        self.ls.progress.begin(self.token, WorkDoneProgressBegin(title="Indexing SCL files", percentage=0))
+
+    def __call__(self, done: int, total: int):
+        percentage = done * 100 // total if total else 100
+        if percentage == self.percentage:
+            return
+        self.percentage = percentage
+        report = WorkDoneProgressReport(message=f"{done}/{total} files", percentage=percentage)
+        self.ls.loop.call_soon_threadsafe(self.ls.progress.report, self.token, report)
+
+    def end(self, future):
+        self.ls.loop.call_soon_threadsafe(self.ls.progress.end, self.token, WorkDoneProgressEnd())
+
+@server.feature(SHUTDOWN)
+def shutdown(ls: LanguageServer, *args):
+    telemetry.stop_log()
+    scheduler.shutdown()
+    workspace_index.shutdown()
+
+@server.feature(WORKSPACE_DID_CHANGE_WATCHED_FILES)
+@telemetry.timed("workspace/didChangeWatchedFiles")
+def did_change_watched_files(ls: LanguageServer, params: DidChangeWatchedFilesParams):
+    changed, deleted = [], []
+    for change in params.changes:
+        path = to_fs_path(change.uri)
+        if path is None or not path.lower().endswith(SCL_EXTENSIONS):
+            continue
+        (deleted if change.type == FileChangeType.Deleted else changed).append(path)
+    if changed or deleted:
+        workspace_index.update(changed, deleted).add_done_callback(partial(indexed, ls))
 
-server = LanguageServer("scl-server", "v0.1.0")
+def indexed(ls: LanguageServer, future):
+    # Runs in the index thread
+    if not future.cancelled():
+        ls.loop.call_soon_threadsafe(refresh_diagnostics, ls)
 
-@server.feature(TEXT_DOCUMENT_COMPLETION)
-def completions(ls: LanguageServer, params: CompletionParams):
+def refresh_diagnostics(ls: LanguageServer):
+    """Re-check open documents after the symbols of other files changed."""
+    if pulls_diagnostics(ls):
+        workspace = ls.client_capabilities.workspace
+        if workspace is not None and workspace.diagnostics is not None and workspace.diagnostics.refresh_support:
+            ls.lsp.send_request(WORKSPACE_DIAGNOSTIC_REFRESH)
+        return
+    for uri in list(ls.workspace.text_documents):
+        scheduler.schedule(ls, uri)
+
+def pulls_diagnostics(ls: LanguageServer) -> bool:
+    # Clients that pull get no pushed diagnostics, which would show up twice
+    text_document = ls.client_capabilities.text_document
+    return text_document is not None and text_document.diagnostic is not None
+
+@server.feature(TEXT_DOCUMENT_DIAGNOSTIC, DiagnosticOptions(
+    identifier="scl-ls", inter_file_dependencies=True, workspace_diagnostics=True,
+))
+@telemetry.timed("textDocument/diagnostic", document_lines)
+async def diagnostic(ls: LanguageServer, params: DocumentDiagnosticParams):
+    return await document_diagnostic(ls, params)
+
+@server.feature(WORKSPACE_DIAGNOSTIC)
+@telemetry.timed("workspace/diagnostic")
+async def diagnostic_workspace(ls: LanguageServer, params: WorkspaceDiagnosticParams):
+    return await workspace_diagnostic(ls, params)
+
+@server.feature(TEXT_DOCUMENT_COMPLETION, CompletionOptions(trigger_characters=["."], resolve_provider=True))
+@telemetry.timed("textDocument/completion", document_lines)
+def completions(ls: LanguageServer, params: CompletionParams) -> CompletionList:
     return handle_completion(ls, params)
 
+@server.feature(COMPLETION_ITEM_RESOLVE)
+@telemetry.timed("completionItem/resolve")
+def completion_resolve(ls: LanguageServer, item: CompletionItem) -> CompletionItem:
+    return handle_completion_resolve(ls, item)
+
 @server.feature(TEXT_DOCUMENT_HOVER)
+@telemetry.timed("textDocument/hover", document_lines)
 def hover(ls: LanguageServer, params: HoverParams) -> Optional[Hover]:
     return handle_hover(ls, params)
 
 @server.feature(TEXT_DOCUMENT_DOCUMENT_HIGHLIGHT)
+@telemetry.timed("textDocument/documentHighlight", document_lines)
 def highlight(ls: LanguageServer, params: DocumentHighlightParams) -> list[DocumentHighlight]:
     return handle_highlight(ls, params)
 
+@server.feature(TEXT_DOCUMENT_DEFINITION)
+@telemetry.timed("textDocument/definition", document_lines)
+def definition(ls: LanguageServer, params: DefinitionParams) -> Optional[Location]:
+    return handle_definition(ls, params)
+
+@server.feature(TEXT_DOCUMENT_REFERENCES)
+@telemetry.timed("textDocument/references", document_lines)
+def references(ls: LanguageServer, params: ReferenceParams) -> list[Location]:
+    return handle_references(ls, params)
+
+@server.feature(WORKSPACE_SYMBOL)
+@telemetry.timed("workspace/symbol")
+def workspace_symbol(ls: LanguageServer, params: WorkspaceSymbolParams) -> list[SymbolInformation]:
+    return handle_workspace_symbol(ls, params)
+
+@server.feature(TEXT_DOCUMENT_SEMANTIC_TOKENS_FULL, LEGEND)
+@telemetry.timed("textDocument/semanticTokens/full", document_lines)
+def semantic_tokens(ls: LanguageServer, params: SemanticTokensParams) -> SemanticTokens:
+    return handle_semantic_tokens(ls, params)
+
+@server.feature(TEXT_DOCUMENT_SEMANTIC_TOKENS_FULL_DELTA, LEGEND)
+@telemetry.timed("textDocument/semanticTokens/full/delta", document_lines)
+def semantic_tokens_delta(ls: LanguageServer, params: SemanticTokensDeltaParams) -> SemanticTokens | SemanticTokensDelta:
+    return handle_semantic_tokens_delta(ls, params)
+
 @server.feature(TEXT_DOCUMENT_DID_OPEN)
+@telemetry.timed("textDocument/didOpen", document_lines)
 def did_open(ls, params: DidOpenTextDocumentParams):
     doc = ls.workspace.get_text_document(params.text_document.uri)
-    run_diagnostics(ls, doc)
+    # Open documents are never evicted
+    memory.pin(doc.uri)
+    get_model(doc)
+    if not pulls_diagnostics(ls):
+        scheduler.schedule(ls, doc.uri, delay=0)
 
 @server.feature(TEXT_DOCUMENT_DID_CHANGE)
+@telemetry.timed("textDocument/didChange", document_lines)
 def did_change(ls, params: DidChangeTextDocumentParams):
     doc = ls.workspace.get_text_document(params.text_document.uri)
-    run_diagnostics(ls, doc)
+    update_model(doc, params.content_changes)
+    if not pulls_diagnostics(ls):
+        scheduler.schedule(ls, doc.uri)
+
+@server.feature(TEXT_DOCUMENT_DID_CLOSE)
+@telemetry.timed("textDocument/didClose")
+def did_close(ls, params: DidCloseTextDocumentParams):
+    uri = params.text_document.uri
+    scheduler.forget(uri)
+    memory.unpin(uri)
+    memory.forget(uri)
+    if not pulls_diagnostics(ls):
+        # They were computed from the editor's text, which is gone
+        ls.publish_diagnostics(uri, [])
+
+@server.command("scl.performanceReport")
+def performance_report(ls: LanguageServer, *args) -> dict:
+    """Timings, counters and cache hit rates collected since startup (with the telemetry option)."""
+    report = telemetry.report()
+    report["memory"] = memory.report()
+    return report
 
 if __name__ == "__main__":
-    import time
-    time.sleep(10)
-    server.start_io()
+    import argparse
+    import multiprocessing
+    import os
+    import sys
+    # The index worker processes re-run the frozen executable
+    multiprocessing.freeze_support()
+    if sys.argv[1:2] == ["lint"]:
+        from lint import main as lint_main
+        sys.exit(lint_main(sys.argv[2:]))
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument(
+        "--record", metavar="TRACE", default=os.environ.get("SCL_LS_RECORD"),
+        help="write the session's JSON-RPC messages to TRACE for server/benchmarks/replay.py",
+    )
+    arg_parser.add_argument(
+        "--debug-wait", metavar="SECONDS", type=float, nargs="?", const=10.0,
+        default=float(os.environ.get("SCL_LS_DEBUG_WAIT") or 0),
+        help="wait before serving so a debugger can attach to the process (default 10 s)",
+    )
+    args, _ = arg_parser.parse_known_args()
+    if args.debug_wait > 0:
+        import time
+        print(f"Waiting {args.debug_wait:g} s for a debugger to attach to process {os.getpid()}", file=sys.stderr, flush=True)
+        time.sleep(args.debug_wait)
+    if args.record:
+        from trace_recorder import TraceRecorder
+        recorder = TraceRecorder(args.record)
+        server.start_io(recorder.reader(sys.stdin.buffer), recorder.writer(sys.stdout.buffer))
+    else:
+        server.start_io()
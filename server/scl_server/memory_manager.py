@@ -0,0 +1,99 @@
+import threading
+from collections import OrderedDict
+
+from settings import settings
+from telemetry import telemetry
+
+# Estimated bytes of a DocumentModel (tokens, declarations, statements) per source character
+MODEL_BYTES_PER_CHAR = 25
+# Estimated bytes of a published Diagnostic
+DIAGNOSTIC_BYTES = 600
+# Estimated bytes of the VariableNodes of a declaration record
+DECLARATION_BYTES = 200
+
+
+class MemoryManager:
+    """Least recently used accounting of state derived from documents.
+
+    Caches report what they keep for a key (a document URI, an index unit)
+    with track(); when more than settings.memory_max_entries keys or
+    settings.memory_budget bytes are tracked, the least recently used keys
+    that aren't pinned (open in the editor) are dropped from every cache
+    that tracked them. The caches rebuild dropped state on the next access.
+    Sizes are estimates from the source size, not measured.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()  # key -> {part: (bytes, drop(key))}
+        self._pinned = set()
+        self._lock = threading.RLock()
+        self.bytes = 0
+
+    def track(self, key, part: str, size: int, drop):
+        """Record that a cache keeps `size` bytes for `key`, dropped with `drop(key)`."""
+        with self._lock:
+            parts = self._entries.get(key)
+            if parts is None:
+                parts = self._entries[key] = {}
+            else:
+                self._entries.move_to_end(key)
+            previous = parts.get(part)
+            if previous is not None:
+                self.bytes -= previous[0]
+            parts[part] = (size, drop)
+            self.bytes += size
+            self._evict(key)
+
+    def touch(self, key):
+        """Mark `key` as used."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+
+    def pin(self, key):
+        with self._lock:
+            self._pinned.add(key)
+
+    def unpin(self, key):
+        with self._lock:
+            self._pinned.discard(key)
+
+    def forget(self, key):
+        """Drop everything kept for `key`."""
+        with self._lock:
+            parts = self._entries.pop(key, None)
+            if parts is None:
+                return
+            for size, drop in parts.values():
+                self.bytes -= size
+                drop(key)
+
+    def untrack(self, key, part: str):
+        """Stop accounting a part its cache dropped by itself."""
+        with self._lock:
+            parts = self._entries.get(key)
+            if parts is None or part not in parts:
+                return
+            self.bytes -= parts.pop(part)[0]
+            if not parts:
+                del self._entries[key]
+
+    def _evict(self, current):
+        budget = settings.memory_budget
+        max_entries = settings.memory_max_entries
+        if self.bytes <= budget and len(self._entries) <= max_entries:
+            return
+        for key in list(self._entries):
+            if self.bytes <= budget and len(self._entries) <= max_entries:
+                break
+            if key == current or key in self._pinned:
+                continue
+            self.forget(key)
+            telemetry.count("memory.evicted")
+
+    def report(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "pinned": len(self._pinned), "bytes": self.bytes}
+
+
+memory = MemoryManager()
@@ -0,0 +1,251 @@
+import logging
+import re
+from bisect import bisect_right
+
+from lsprotocol.types import (
+    DefinitionParams,
+    Location,
+    Position,
+    Range,
+    ReferenceParams,
+    SymbolInformation,
+    SymbolKind,
+    WorkspaceSymbolParams,
+)
+from pygls.server import LanguageServer
+from pygls.uris import from_fs_path
+
+from document_store import DocumentModel, get_model
+from lexer import COMMENT, LexedDocument
+from occurrence_index import OccurrenceIndex, line_occurrences
+from parser_structured import StructuredSCLParser, declaration_paths
+from telemetry import telemetry
+from workspace_index import workspace_index
+
+logger = logging.getLogger(__name__)
+
+# Results of a workspace/symbol query
+MAX_WORKSPACE_SYMBOLS = 200
+# Fuzzy matches ranked per query; more are ignored
+MAX_FUZZY_CANDIDATES = 10000
+
+UNIT_KINDS = {
+    "FUNCTION_BLOCK": SymbolKind.Class,
+    "FUNCTION": SymbolKind.Function,
+    "ORGANIZATION_BLOCK": SymbolKind.Module,
+    "DATA_BLOCK": SymbolKind.Module,
+    "TYPE": SymbolKind.Struct,
+    "PROGRAM": SymbolKind.Module,
+}
+
+
+def symbol_at(model: DocumentModel, line: int, char: int):
+    """The symbol named at a position, as ("local", path), ("unit", unit)
+    or ("member", unit, path) with paths as tuples of names, or None."""
+    if line >= len(model.lines):
+        return None
+    text = model.lines[line]
+    code = [t for t in model.lexed.tokens[line] if t[0] != COMMENT]
+    if model.parser.declares(line) and code[0][1] <= char <= code[0][2]:
+        # The name of a declaration, possibly a member of a STRUCT
+        path = model.occurrences.declaration_at(line)
+        return ("local", path) if path is not None else None
+    for start, name, quoted in line_occurrences(text, code):
+        end = start + len(name) + 2 * quoted
+        if not start <= char <= end:
+            continue
+        # Segments up to the one at the cursor
+        offset = start + 2 * quoted
+        path = []
+        for segment in name.split("."):
+            path.append(segment)
+            offset += len(segment) + 1
+            if char < offset:
+                break
+        path = tuple(path)
+        if model.parser.all_nodes.get(".".join(path)) is not None:
+            return "local", path
+        unit = workspace_index.units.get(path[0])
+        if unit is None:
+            return None
+        if len(path) == 1:
+            return "unit", unit
+        if unit.kind == "DATA_BLOCK" and unit.parser.all_nodes.get(".".join(path[1:])) is not None:
+            return "member", unit, path[1:]
+        return None
+    return None
+
+
+def name_range(line: int, column: int, name: str) -> Range:
+    return Range(start=Position(line=line, character=column), end=Position(line=line, character=column + len(name)))
+
+
+def declaration_location(model: DocumentModel, uri: str, symbol) -> Location | None:
+    if symbol[0] == "local":
+        line = model.occurrences.declarations.get(symbol[1])
+        if line is None:
+            return None
+        code = model.lexed.code_tokens(line)
+        return Location(uri=uri, range=name_range(line, code[0][1] if code else 0, symbol[1][-1]))
+    unit = symbol[1]
+    if unit.path is None:
+        return None
+    if symbol[0] == "unit":
+        return Location(uri=from_fs_path(unit.path), range=name_range(unit.line, unit.column, unit.name))
+    position = unit.declaration(symbol[2])
+    if position is None:
+        return None
+    return Location(uri=from_fs_path(unit.path), range=name_range(position[0], position[1], symbol[2][-1]))
+
+
+def handle_definition(ls: LanguageServer, params: DefinitionParams) -> Location | None:
+    """Declaration of the variable, DB member, UDT, FB or other unit at the cursor."""
+    doc = ls.workspace.get_text_document(params.text_document.uri)
+    model = get_model(doc)
+    symbol = symbol_at(model, params.position.line, params.position.character)
+    if symbol is None:
+        return None
+    return declaration_location(model, doc.uri, symbol)
+
+
+def handle_references(ls: LanguageServer, params: ReferenceParams) -> list[Location]:
+    """Uses of the symbol at the cursor.
+
+    Variables of the document are looked up in its occurrence index. Units
+    and DB members are looked up in the open documents and the indexed
+    files whose identifiers include the unit name.
+    """
+    doc = ls.workspace.get_text_document(params.text_document.uri)
+    model = get_model(doc)
+    symbol = symbol_at(model, params.position.line, params.position.character)
+    if symbol is None:
+        return []
+    locations = []
+    if params.context.include_declaration:
+        declaration = declaration_location(model, doc.uri, symbol)
+        if declaration is not None:
+            locations.append(declaration)
+
+    if symbol[0] == "local":
+        name = ".".join(symbol[1])
+        return locations + [Location(uri=doc.uri, range=_range(*found)) for found in model.occurrences.find(name)]
+
+    unit = symbol[1]
+    name = ".".join((unit.name,) + symbol[2]) if symbol[0] == "member" else unit.name
+    open_uris = set(ls.workspace.text_documents)
+    for uri in sorted(open_uris):
+        ranges = get_model(ls.workspace.get_text_document(uri)).occurrences.find(name)
+        locations += [Location(uri=uri, range=_range(*found)) for found in ranges]
+    for path in workspace_index.files_using(unit.name):
+        uri = from_fs_path(path)
+        if uri is None or uri in open_uris:
+            continue
+        try:
+            ranges = file_occurrences(path).find(name)
+        except OSError:
+            logger.warning("Failed to read %s", path, exc_info=True)
+            continue
+        locations += [Location(uri=uri, range=_range(*found)) for found in ranges]
+    return locations
+
+
+def _range(line: int, start: int, end: int) -> Range:
+    return Range(start=Position(line=line, character=start), end=Position(line=line, character=end))
+
+
+def file_occurrences(path: str) -> OccurrenceIndex:
+    """Occurrence index of a file on disk that isn't open; it isn't kept."""
+    with open(path, "rb") as f:
+        lexed = LexedDocument.from_text(f.read().decode("utf-8-sig", errors="replace"))
+    parser = StructuredSCLParser()
+    parser.parse_lexed(lexed)
+    return OccurrenceIndex(lexed, parser)
+
+
+class WorkspaceSymbols:
+    """Units of the workspace index and their top-level declarations, searched
+    by fuzzy matching. Rebuilt when the index generation changes."""
+
+    def __init__(self):
+        self.generation = None
+        self._entries = []  # (name, kind, container, unit, record index or None)
+        self._text = ""  # lowercase names, one per line
+        self._offsets = []  # start of each name in _text
+
+    def _refresh(self):
+        if self.generation == workspace_index.generation:
+            return
+        with telemetry.timer("workspace_symbols.build"):
+            entries = []
+            for unit in workspace_index.units.values():
+                entries.append((unit.name, UNIT_KINDS.get(unit.kind, SymbolKind.Module), None, unit, None))
+                for i, path in declaration_paths(unit.records):
+                    if len(path) == 1:
+                        entries.append((path[0], record_kind(unit.records[i]), unit.name, unit, i))
+            offsets = []
+            position = 0
+            for entry in entries:
+                offsets.append(position)
+                position += len(entry[0]) + 1
+            self._entries = entries
+            self._offsets = offsets
+            self._text = "\n".join(entry[0] for entry in entries).lower()
+            self.generation = workspace_index.generation
+
+    def search(self, query: str) -> list[SymbolInformation]:
+        """Symbols whose name contains the characters of `query` in order (ignoring case),
+        names starting with the query first, then names containing it, then shorter names."""
+        self._refresh()
+        query = query.strip()
+        if not query:
+            matches = [entry for entry in self._entries if entry[4] is None][:MAX_WORKSPACE_SYMBOLS]
+        else:
+            # Unanchored on the lowercase text the regex engine can skip ahead to the first character
+            lowered = query.lower()
+            pattern = re.compile("[^\n]*?".join(re.escape(c) for c in lowered))
+            ranked = []
+            previous = -1
+            for match in pattern.finditer(self._text):
+                index = bisect_right(self._offsets, match.start()) - 1
+                if index == previous:
+                    continue
+                previous = index
+                name = self._entries[index][0].lower()
+                rank = 0 if name.startswith(lowered) else 1 if lowered in name else 2
+                ranked.append((rank, len(name), index))
+                if len(ranked) == MAX_FUZZY_CANDIDATES:
+                    break
+            ranked.sort()
+            matches = [self._entries[index] for _, _, index in ranked[:MAX_WORKSPACE_SYMBOLS]]
+        return [symbol for symbol in map(symbol_information, matches) if symbol is not None]
+
+
+def record_kind(record) -> SymbolKind:
+    if record[0] == "CONST":
+        return SymbolKind.Constant
+    if record[0] == "STRUCT":
+        return SymbolKind.Struct
+    return SymbolKind.Variable
+
+
+def symbol_information(entry) -> SymbolInformation | None:
+    name, kind, container, unit, record = entry
+    if unit.path is None:
+        return None
+    if record is None:
+        line, column = unit.line, unit.column
+    elif record < len(unit.positions):
+        line, column = unit.positions[record]
+    else:
+        line, column = unit.line, unit.column
+    return SymbolInformation(
+        name=name, kind=kind, container_name=container,
+        location=Location(uri=from_fs_path(unit.path), range=name_range(line, column, name)),
+    )
+
+
+workspace_symbols = WorkspaceSymbols()
+
+
+def handle_workspace_symbol(ls: LanguageServer, params: WorkspaceSymbolParams) -> list[SymbolInformation]:
+    return workspace_symbols.search(params.query)
@@ -0,0 +1,104 @@
+from lexer import COMMENT, IDENT, QUOTED_IDENT, LexedDocument
+from parser_body import UNIT_STARTS
+from parser_structured import StructuredSCLParser
+from syntax_keywords import SCL_KEYWORDS
+from telemetry import telemetry
+
+
+class OccurrenceIndex:
+    """Where the names of one document version are used, by their first segment.
+
+    An occurrence is a dotted name (`stMotor.bOn`, `"DB_Alarms".active`)
+    anywhere in the document except where it is declared: the names of
+    declarations and unit headers are left out, so a lookup only finds uses.
+    Built on first use for each version, like the pair index.
+    """
+
+    def __init__(self, lexed: LexedDocument, parser: StructuredSCLParser):
+        self.lexed = lexed
+        self.parser = parser
+        self._occurrences = None  # first segment -> [(line, start, dotted name, quoted)]
+        self._declarations = None  # path of names -> line
+        self._declared = None  # line -> path of names
+
+    @property
+    def occurrences(self) -> dict[str, list[tuple[int, int, str, bool]]]:
+        if self._occurrences is None:
+            with telemetry.timer("occurrence_index.build", len(self.lexed.lines)):
+                self._occurrences = scan_occurrences(self.lexed, self.parser)
+        return self._occurrences
+
+    @property
+    def declarations(self) -> dict[tuple, int]:
+        if self._declarations is None:
+            self._declarations = self.parser.declaration_lines()
+        return self._declarations
+
+    def declaration_at(self, line: int) -> tuple | None:
+        if self._declared is None:
+            self._declared = {i: path for path, i in self.declarations.items()}
+        return self._declared.get(line)
+
+    def find(self, name: str) -> list[tuple[int, int, int]]:
+        """(line, start, end) of the last segment of every use of the dotted `name`,
+        also as the start of a longer name."""
+        segments = name.split(".")
+        ranges = []
+        for line, start, text, quoted in self.occurrences.get(segments[0], ()):
+            if text != name and not text.startswith(name + "."):
+                continue
+            end = start + len(name) + 2 * quoted
+            ranges.append((line, start if len(segments) == 1 else end - len(segments[-1]), end))
+        return ranges
+
+
+def line_occurrences(line: str, code: list, skip: int = -1):
+    """Yield (start, dotted name, quoted) of the names among the code tokens of a line.
+
+    Runs that continue a member access on something else (`arr[1].x`) are
+    left out, as are keywords and the token at index `skip`.
+    """
+    count = len(code)
+    k = 0
+    while k < count:
+        kind, start, end = code[k]
+        if kind not in (IDENT, QUOTED_IDENT) or k == skip \
+                or k and code[k - 1][2] == start and line[code[k - 1][1]:start] == ".":
+            k += 1
+            continue
+        quoted = kind == QUOTED_IDENT
+        parts = [line[start:end].strip('"')]
+        j = k + 1
+        while (
+            j + 1 < count
+            and code[j][1] == end
+            and line[code[j][1]:code[j][2]] == "."
+            and code[j + 1][0] == IDENT
+            and code[j + 1][1] == code[j][2]
+        ):
+            end = code[j + 1][2]
+            parts.append(line[code[j + 1][1]:end])
+            j += 2
+        if quoted or len(parts) > 1 or parts[0].upper() not in SCL_KEYWORDS:
+            yield start, ".".join(parts), quoted
+        k = j
+
+
+def declared_token(lexed: LexedDocument, parser: StructuredSCLParser, line: int, code: list) -> int:
+    """Index of the code token of `line` naming a declaration or unit, -1 if none."""
+    if parser.declares(line):
+        return 0
+    if len(code) > 1 and code[0][0] == IDENT and lexed.lines[line][code[0][1]:code[0][2]].upper() in UNIT_STARTS:
+        return 1
+    return -1
+
+
+def scan_occurrences(lexed: LexedDocument, parser: StructuredSCLParser) -> dict:
+    occurrences = {}
+    for i, (line, tokens) in enumerate(zip(lexed.lines, lexed.tokens)):
+        code = [t for t in tokens if t[0] != COMMENT]
+        if not code:
+            continue
+        for start, name, quoted in line_occurrences(line, code, declared_token(lexed, parser, i, code)):
+            occurrences.setdefault(name.partition(".")[0], []).append((i, start, name, quoted))
+    return occurrences
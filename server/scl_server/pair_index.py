@@ -0,0 +1,71 @@
+import re
+from bisect import bisect_right
+
+from lexer import IDENT, OPERATOR, LexedDocument
+from parser_body import END_KEYWORDS
+
+BRACKETS = {"(": ")", "[": "]", "{": "}"}
+# Closer -> opener, for brackets and for the END_* keywords of compound statements
+_OPENERS = {close: open_ for open_, close in list(BRACKETS.items()) + list(END_KEYWORDS.items())}
+_CANDIDATE = re.compile(
+    r"[()\[\]{}]|\b(?:END_)?(?:" + "|".join(END_KEYWORDS) + r")\b", re.IGNORECASE
+)
+
+
+class PairIndex:
+    """Matching brackets and IF/END_IF, CASE/END_CASE, ... keywords of one document version.
+
+    Built from the tokens in a single pass, so brackets in comments and
+    strings don't count. Each pair member is kept sorted by position and
+    looked up with a bisect.
+    """
+
+    def __init__(self, lexed: LexedDocument):
+        self.lexed = lexed
+        self.starts = []  # (line, start column) of every bracket and keyword token
+        self.ends = []  # end column of each
+        self.partners = []  # index of the matching token, or -1
+        stacks = {}  # opener -> indexes of unclosed openers
+        for line, (text, tokens) in enumerate(zip(lexed.lines, lexed.tokens)):
+            if not _CANDIDATE.search(text):
+                continue
+            for kind, start, end in tokens:
+                if kind == OPERATOR:
+                    word = text[start:end]
+                    if word not in BRACKETS and word not in _OPENERS:
+                        continue
+                elif kind == IDENT:
+                    word = text[start:end].upper()
+                    if word not in END_KEYWORDS and word not in _OPENERS:
+                        continue
+                else:
+                    continue
+                index = len(self.starts)
+                self.starts.append((line, start))
+                self.ends.append(end)
+                self.partners.append(-1)
+                opener = _OPENERS.get(word)
+                if opener is None:
+                    stacks.setdefault(word, []).append(index)
+                elif stacks.get(opener):
+                    partner = stacks[opener].pop()
+                    self.partners[index] = partner
+                    self.partners[partner] = index
+
+    def match(self, line: int, character: int) -> tuple[tuple[int, int, int], tuple[int, int, int]] | None:
+        """(line, start, end) of the bracket or keyword at the position and of its partner.
+
+        A bracket must start at `character`, a keyword may also end there.
+        """
+        index = bisect_right(self.starts, (line, character)) - 1
+        if index < 0 or self.starts[index][0] != line:
+            return None
+        start = self.starts[index][1]
+        end = self.ends[index]
+        # Brackets are the only one-character tokens indexed
+        if not (start == character if end - start == 1 else character <= end):
+            return None
+        partner = self.partners[index]
+        if partner == -1:
+            return None
+        return (line, start, end), (*self.starts[partner], self.ends[partner])
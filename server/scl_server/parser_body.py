@@ -0,0 +1,656 @@
+from bisect import bisect_left
+
+from lexer import COMMENT, IDENT, NUMBER, QUOTED_IDENT, STRING, TYPED_LITERAL, LexedDocument
+from syntax_keywords import DECLARATION_KEYWORDS
+
+# SyntaxNode.flags
+MISSING_SEMICOLON = 1
+MISSING_END = 2
+MISSING_KEYWORD = 4  # THEN, OF, DO or UNTIL
+MISSING_PAREN = 8
+
+# Keyword expected after the condition/header and closing keyword of each compound statement
+BLOCK_KEYWORDS = {"IF": "THEN", "ELSIF": "THEN", "CASE": "OF", "FOR": "DO", "WHILE": "DO", "REPEAT": "UNTIL"}
+END_KEYWORDS = {
+    "IF": "END_IF", "CASE": "END_CASE", "FOR": "END_FOR", "WHILE": "END_WHILE",
+    "REPEAT": "END_REPEAT", "REGION": "END_REGION",
+}
+
+UNIT_STARTS = {"FUNCTION_BLOCK", "FUNCTION", "ORGANIZATION_BLOCK", "DATA_BLOCK", "TYPE", "PROGRAM"}
+UNIT_ENDS = {"END_" + word for word in UNIT_STARTS}
+
+# Words that can't appear inside an expression; END_* words are handled separately
+EXPRESSION_STOPS = {
+    "THEN", "OF", "TO", "BY", "DO", "ELSE", "ELSIF", "UNTIL",
+    "IF", "CASE", "FOR", "WHILE", "REPEAT", "REGION", "EXIT", "CONTINUE", "RETURN", "BEGIN",
+} | UNIT_STARTS | DECLARATION_KEYWORDS
+BINARY_OPERATORS = {"+", "-", "*", "/", "**", "=", "<>", "<", ">", "<=", ">=", "&", ".."}
+BINARY_WORDS = {"AND", "OR", "XOR", "MOD"}
+LITERAL_WORDS = {"TRUE", "FALSE", "NULL"}
+CASE_LABEL_OPERATORS = {",", "..", "-", "#", "."}
+
+_IF_CLOSERS = ("ELSIF", "ELSE", "END_IF")
+_CASE_CLOSERS = ("ELSE", "END_CASE")
+_REPEAT_CLOSERS = ("UNTIL", "END_REPEAT")
+
+
+class SyntaxNode:
+    """Statement or expression node.
+
+    `line`/`end_line` are relative to the first line of the top-level
+    statement containing the node and `start`/`end` are columns, so a whole
+    statement can be reused after lines were inserted above it.
+    NAME and CALL nodes carry the (dotted) name in `text`, ARG nodes the
+    formal parameter name of a named argument.
+    """
+
+    __slots__ = ("kind", "line", "start", "end_line", "end", "children", "text", "flags")
+
+    def __init__(self, kind: str, line: int, start: int, text: str | None = None, children=()):
+        self.kind = kind
+        self.line = line
+        self.start = start
+        self.end_line = line
+        self.end = start
+        self.children = children
+        self.text = text
+        self.flags = 0
+
+    def __repr__(self):
+        return f"SyntaxNode({self.kind}, {self.line}:{self.start}-{self.end_line}:{self.end}, {self.text!r})"
+
+
+class SyntaxTree:
+    """Top-level statements of the code sections (BEGIN ... END_<unit>) of a document.
+
+    `roots[i]` starts on document line `lines[i]`. The BEGIN keyword and the
+    end of a code section are roots of kind BEGIN and END.
+    """
+
+    def __init__(self, roots: list[SyntaxNode], lines: list[int], line_count: int):
+        self.roots = roots
+        self.lines = lines
+        self.line_count = line_count
+        self.end_lines = [line + root.end_line for line, root in zip(lines, roots)]
+
+    @classmethod
+    def from_lexed(cls, lexed: LexedDocument) -> "SyntaxTree":
+        roots, lines, _ = BodyParser(lexed).parse()
+        return cls(roots, lines, len(lexed.lines))
+
+    def edited(self, lexed: LexedDocument, start: int, old_end: int, new_end: int) -> "SyntaxTree":
+        """Tree after lines [start, old_end) were replaced by lexed lines [start, new_end).
+
+        Parsing resumes after the last statement unaffected by the edit and
+        stops at the first statement after the edit that starts where an old
+        one did; that one and all following are reused with their line
+        shifted. This tree is left unchanged.
+        """
+        line_count = len(lexed.lines)
+        if not (0 <= start <= old_end <= self.line_count and start <= new_end <= line_count) \
+                or line_count - self.line_count != new_end - old_end:
+            return SyntaxTree.from_lexed(lexed)
+
+        roots, lines = self.roots, self.lines
+        # A statement also depends on the token after it (which ended it), so
+        # only statements followed by another one starting before the edit are kept
+        first = max(0, bisect_left(lines, start) - 1)
+        if first:
+            previous = roots[first - 1]
+            line, character = lines[first - 1] + previous.end_line, previous.end
+            in_body = previous.kind != "END"
+        else:
+            line, character, in_body = 0, 0, False
+        delta = new_end - old_end
+
+        def resume(line: int, character: int) -> int | None:
+            if line < new_end:
+                return None
+            old_line = line - delta
+            index = bisect_left(lines, old_line, first)
+            while index < len(lines) and lines[index] == old_line:
+                if roots[index].start == character:
+                    return index
+                index += 1
+            return None
+
+        new_roots, new_lines, reused = BodyParser(lexed).parse(line, character, in_body, resume)
+        if reused is None:
+            reused = len(roots)
+        return SyntaxTree(
+            roots[:first] + new_roots + roots[reused:],
+            lines[:first] + new_lines + [old + delta for old in lines[reused:]],
+            line_count,
+        )
+
+    def walk(self):
+        """Yield (node, line) for every node; the node's document line is line + node.line."""
+        for line, root in zip(self.lines, self.roots):
+            stack = [root]
+            while stack:
+                node = stack.pop()
+                yield node, line
+                if node.children:
+                    stack.extend(reversed(node.children))
+
+    def statement_at(self, line: int) -> tuple[SyntaxNode, int] | None:
+        """Top-level statement spanning `line` and its first line."""
+        index = bisect_left(self.end_lines, line)
+        if index < len(self.roots) and self.lines[index] <= line:
+            return self.roots[index], self.lines[index]
+        return None
+
+
+class BodyParser:
+    """Error-tolerant recursive descent parser for SCL statements.
+
+    Missing keywords, semicolons and parentheses are recorded in the node
+    flags instead of aborting; statements stop at any closing keyword an
+    enclosing statement is waiting for, so one broken statement doesn't
+    swallow the rest of the block.
+    """
+
+    def __init__(self, lexed: LexedDocument):
+        self.lexed = lexed
+        self._lines = lexed.lines
+        self._tokens = lexed.tokens
+        self._expected = {}  # closing keyword -> number of open statements waiting for it
+        self._base = 0  # first line of the current top-level statement
+        self._i = 0
+        self._k = 0
+        self._code = []
+        self._kind = None
+        self._start = self._end = 0
+        self._word = ""
+        self._last_line = self._last_end = 0
+        self._column = 0  # column of the first token of the current statement
+
+    def parse(self, line: int = 0, character: int = 0, in_body: bool = False, resume=None):
+        """Parse top-level statements from (line, character).
+
+        `resume(line, character)` is asked before each statement in a code
+        section; when it returns an index parsing stops there.
+        Returns (roots, root lines, index returned by resume or None).
+        """
+        roots = []
+        lines = []
+        self._seek(line, character)
+        while self._kind is not None:
+            word = self._word
+            if not in_body and word != "BEGIN" or word == ";":
+                self._advance()
+                continue
+            if resume is not None:
+                index = resume(self._i, self._start)
+                if index is not None:
+                    return roots, lines, index
+            self._base = self._i
+            if word == "BEGIN":
+                node = self._leaf("BEGIN")
+                in_body = True
+            elif word in UNIT_ENDS:
+                node = self._leaf("END")
+                in_body = False
+            elif word in UNIT_STARTS:
+                # Next unit without closing this one
+                node = self._node("END")
+                node.flags |= MISSING_END
+                in_body = False
+            else:
+                node = self._statement()
+            roots.append(node)
+            lines.append(self._base)
+        return roots, lines, None
+
+    # Token cursor
+
+    def _seek(self, line: int, character: int):
+        self._i = line
+        if line < len(self._tokens):
+            self._code = [t for t in self._tokens[line] if t[0] != COMMENT and t[1] >= character]
+            self._k = 0
+            if self._code:
+                self._set()
+                return
+        self._next_line()
+
+    def _next_line(self):
+        tokens = self._tokens
+        i = self._i + 1
+        while i < len(tokens):
+            code = [t for t in tokens[i] if t[0] != COMMENT]
+            if code:
+                self._i = i
+                self._code = code
+                self._k = 0
+                self._set()
+                return
+            i += 1
+        self._i = i
+        self._kind = None
+        self._word = ""
+
+    def _set(self):
+        self._kind, self._start, self._end = token = self._code[self._k]
+        text = self._lines[self._i][self._start:self._end]
+        self._word = text.upper() if token[0] == IDENT else text
+
+    def _advance(self):
+        self._last_line = self._i
+        self._last_end = self._end
+        self._k += 1
+        if self._k < len(self._code):
+            self._set()
+        else:
+            self._next_line()
+
+    def _peek(self) -> str:
+        """Text of the token after the current one."""
+        if self._k + 1 < len(self._code):
+            _, start, end = self._code[self._k + 1]
+            return self._lines[self._i][start:end]
+        for i in range(self._i + 1, len(self._tokens)):
+            for kind, start, end in self._tokens[i]:
+                if kind != COMMENT:
+                    return self._lines[i][start:end]
+        return ""
+
+    def _text(self) -> str:
+        return self._lines[self._i][self._start:self._end]
+
+    # Nodes
+
+    def _node(self, kind: str, text: str | None = None, children=()) -> SyntaxNode:
+        return SyntaxNode(kind, self._i - self._base, self._start, text, children)
+
+    def _finish(self, node: SyntaxNode) -> SyntaxNode:
+        end_line = self._last_line - self._base
+        if (end_line, self._last_end) > (node.line, node.start):
+            node.end_line = end_line
+            node.end = self._last_end
+        return node
+
+    def _leaf(self, kind: str) -> SyntaxNode:
+        node = self._node(kind)
+        self._advance()
+        return self._finish(node)
+
+    def _terminate(self, node: SyntaxNode) -> SyntaxNode:
+        if self._word == ";":
+            self._advance()
+        else:
+            node.flags |= MISSING_SEMICOLON
+        return self._finish(node)
+
+    def _close(self, node: SyntaxNode, keyword: str, semicolon: bool = True) -> SyntaxNode:
+        if self._word != keyword:
+            node.flags |= MISSING_END
+            return self._finish(node)
+        self._advance()
+        if semicolon:
+            return self._terminate(node)
+        return self._finish(node)
+
+    def _expect(self, words):
+        expected = self._expected
+        for word in words:
+            expected[word] = expected.get(word, 0) + 1
+
+    def _unexpect(self, words):
+        expected = self._expected
+        for word in words:
+            expected[word] -= 1
+
+    # Statements
+
+    def _statements(self, case_labels: bool = False) -> list[SyntaxNode]:
+        statements = []
+        while self._kind is not None:
+            word = self._word
+            if self._expected.get(word) or word in UNIT_ENDS or word in UNIT_STARTS:
+                break
+            if word == ";":
+                self._advance()
+                continue
+            if case_labels and self._at_case_label():
+                break
+            statements.append(self._statement())
+        return statements
+
+    def _block(self, case_labels: bool = False) -> SyntaxNode:
+        node = self._node("BLOCK")
+        node.children = self._statements(case_labels)
+        return self._finish(node) if node.children else node
+
+    def _statement(self) -> SyntaxNode:
+        word = self._word
+        self._column = self._start
+        if self._kind == IDENT:
+            if word == "IF":
+                return self._if()
+            if word == "CASE":
+                return self._case()
+            if word == "FOR":
+                return self._for()
+            if word == "WHILE":
+                return self._while()
+            if word == "REPEAT":
+                return self._repeat()
+            if word == "REGION":
+                return self._region()
+            if word in ("EXIT", "CONTINUE", "RETURN"):
+                node = self._node(word)
+                self._advance()
+                return self._terminate(node)
+            if _is_stop(word):
+                return self._leaf("ERROR")
+        return self._simple_statement()
+
+    def _simple_statement(self) -> SyntaxNode:
+        line, start = self._i, self._start
+        target = self._expression()
+        if self._word == ":=":
+            node = self._node("ASSIGN", children=[target])
+            node.line, node.start = target.line, target.start
+            self._advance()
+            node.children.append(self._expression())
+        elif (line, start) == (self._i, self._start) and self._kind is not None:
+            # Nothing that starts a statement
+            return self._leaf("ERROR")
+        elif (
+            len(target.children) == 1
+            and target.children[0].kind == "CALL"
+            and _span(target.children[0]) == _span(target)
+        ):
+            node = target.children[0]
+        else:
+            node = target
+        if node.kind == "CALL" and node.flags & MISSING_PAREN:
+            # Don't ask for a ';' before the missing ')'; `;` may still close the
+            # statement but isn't part of it, so the call ends with its arguments
+            # like the calls nested in them
+            self._finish(node)
+            if self._word == ";":
+                self._advance()
+            return node
+        return self._terminate(node)
+
+    def _if(self) -> SyntaxNode:
+        node = self._node("IF", children=[])
+        self._advance()
+        self._expect(_IF_CLOSERS)
+        node.children.append(self._expression())
+        node.children.append(self._keyword_block(node, "THEN"))
+        while self._word == "ELSIF":
+            branch = self._node("ELSIF", children=[])
+            self._advance()
+            branch.children.append(self._expression())
+            branch.children.append(self._keyword_block(branch, "THEN"))
+            node.children.append(self._finish(branch))
+        if self._word == "ELSE":
+            node.children.append(self._else())
+        self._unexpect(_IF_CLOSERS)
+        return self._close(node, "END_IF")
+
+    def _case(self) -> SyntaxNode:
+        node = self._node("CASE", children=[])
+        self._advance()
+        self._expect(_CASE_CLOSERS)
+        node.children.append(self._expression())
+        if self._word == "OF":
+            self._advance()
+        else:
+            node.flags |= MISSING_KEYWORD
+        while self._kind is not None:
+            word = self._word
+            if self._expected.get(word) or word in UNIT_ENDS or word in UNIT_STARTS:
+                break
+            if self._at_case_label():
+                branch = self._node("LABEL", children=[])
+                labels = self._node("EXPR", children=[])
+                while self._word != ":":
+                    line, start = self._i, self._start
+                    self._operands(labels.children)
+                    if (line, start) == (self._i, self._start):
+                        self._advance()
+                branch.children.append(self._finish(labels))
+                self._advance()
+                branch.children.append(self._block(case_labels=True))
+                node.children.append(self._finish(branch))
+            else:
+                # Statements before the first label
+                node.children.append(self._block(case_labels=True))
+        if self._word == "ELSE":
+            node.children.append(self._else())
+        self._unexpect(_CASE_CLOSERS)
+        return self._close(node, "END_CASE")
+
+    def _for(self) -> SyntaxNode:
+        node = self._node("FOR", children=[])
+        self._advance()
+        self._expect(("END_FOR",))
+        header = self._node("EXPR", children=[])
+        self._operands(header.children)
+        for word in (":=", "TO", "BY"):
+            if self._word == word:
+                self._advance()
+                self._operands(header.children)
+        node.children.append(self._finish(header))
+        node.children.append(self._keyword_block(node, "DO"))
+        self._unexpect(("END_FOR",))
+        return self._close(node, "END_FOR")
+
+    def _while(self) -> SyntaxNode:
+        node = self._node("WHILE", children=[])
+        self._advance()
+        self._expect(("END_WHILE",))
+        node.children.append(self._expression())
+        node.children.append(self._keyword_block(node, "DO"))
+        self._unexpect(("END_WHILE",))
+        return self._close(node, "END_WHILE")
+
+    def _repeat(self) -> SyntaxNode:
+        node = self._node("REPEAT", children=[])
+        self._advance()
+        self._expect(_REPEAT_CLOSERS)
+        node.children.append(self._block())
+        self._unexpect(_REPEAT_CLOSERS)
+        if self._word == "UNTIL":
+            self._advance()
+            node.children.append(self._expression())
+        else:
+            node.flags |= MISSING_KEYWORD
+        return self._close(node, "END_REPEAT")
+
+    def _region(self) -> SyntaxNode:
+        # REGION <free text up to the end of the line> ... END_REGION
+        line = self._i
+        node = self._node("REGION", children=[])
+        self._advance()
+        if self._i == line and self._kind is not None:
+            node.text = self._lines[line][self._start:self._code[-1][2]]
+            while self._i == line and self._kind is not None:
+                self._advance()
+        self._expect(("END_REGION",))
+        node.children.append(self._block())
+        self._unexpect(("END_REGION",))
+        return self._close(node, "END_REGION", semicolon=False)
+
+    def _keyword_block(self, node: SyntaxNode, keyword: str) -> SyntaxNode:
+        if self._word == keyword:
+            self._advance()
+        else:
+            node.flags |= MISSING_KEYWORD
+        return self._block()
+
+    def _else(self) -> SyntaxNode:
+        node = self._node("ELSE", children=[])
+        self._advance()
+        node.children.append(self._block())
+        return self._finish(node)
+
+    def _at_case_label(self) -> bool:
+        """Whether the current line continues with `<labels> :`."""
+        line = self._lines[self._i]
+        code = self._code
+        for index in range(self._k, len(code)):
+            kind, start, end = code[index]
+            if kind == IDENT:
+                if _is_stop(line[start:end].upper()):
+                    return False
+            elif kind not in (NUMBER, TYPED_LITERAL, STRING, QUOTED_IDENT):
+                text = line[start:end]
+                if text == ":":
+                    return index > self._k
+                if text not in CASE_LABEL_OPERATORS:
+                    return False
+        return False
+
+    # Expressions
+
+    def _expression(self) -> SyntaxNode:
+        node = self._node("EXPR", children=[])
+        self._operands(node.children)
+        return self._finish(node)
+
+    def _operands(self, out: list):
+        """Consume an expression, appending its NAME and CALL nodes to `out`.
+
+        Operators and literals aren't kept; the expression ends at the first
+        token that can't continue it.
+        """
+        operand = True
+        while self._kind is not None:
+            kind = self._kind
+            word = self._word
+            if operand:
+                if kind == IDENT:
+                    if word == "NOT":
+                        self._advance()
+                        continue
+                    if _is_stop(word):
+                        return
+                    if word in LITERAL_WORDS:
+                        self._advance()
+                    else:
+                        self._name(out)
+                elif kind == QUOTED_IDENT:
+                    self._name(out)
+                elif kind == NUMBER or kind == TYPED_LITERAL or kind == STRING:
+                    self._advance()
+                elif word == "(" or word == "[":
+                    closing = ")" if word == "(" else "]"
+                    self._advance()
+                    self._list(out, closing)
+                    if self._word != closing:
+                        return
+                    self._advance()
+                elif word == "-" or word == "+" or word == "#":
+                    self._advance()
+                    continue
+                else:
+                    return
+                operand = False
+            elif word in BINARY_OPERATORS or (kind == IDENT and word in BINARY_WORDS):
+                self._advance()
+                operand = True
+            else:
+                return
+
+    def _list(self, out: list, closing: str):
+        while self._kind is not None and self._word != closing:
+            line, start = self._i, self._start
+            self._operands(out)
+            if self._word == ",":
+                self._advance()
+            elif (line, start) == (self._i, self._start):
+                return
+
+    def _name(self, out: list):
+        """Consume a variable access or call starting at an identifier."""
+        line = self._i
+        quoted = self._kind == QUOTED_IDENT
+        node = self._node("NAME")
+        name_end = self._end
+        in_name = not quoted  # still reading the IDENT('.'IDENT)* run
+        if not quoted:
+            out.append(node)
+        self._advance()
+        while self._kind is not None:
+            word = self._word
+            if word == ".":
+                adjacent = in_name and self._i == line and self._start == name_end
+                self._advance()
+                if self._word == "%":  # bit/byte access, e.g. x.%X0
+                    in_name = False
+                    self._advance()
+                if self._kind == IDENT or self._kind == QUOTED_IDENT:
+                    if adjacent and self._kind == IDENT and self._i == line and self._start == name_end + 1:
+                        name_end = self._end
+                    else:
+                        in_name = False
+                    self._advance()
+                else:
+                    in_name = False
+            elif word == "[":
+                in_name = False
+                self._advance()
+                self._list(out, "]")
+                if self._word == "]":
+                    self._advance()
+            else:
+                break
+        node.text = self._lines[line][node.start:name_end]
+        node.end = name_end
+        if self._word == "(":
+            if quoted:
+                node.text = self._lines[line][node.start:self._last_end]
+                out.append(node)
+            node.kind = "CALL"
+            node.children = self._arguments(node)
+            self._finish(node)
+
+    def _arguments(self, call: SyntaxNode) -> list[SyntaxNode]:
+        arguments = []
+        self._advance()
+        while True:
+            word = self._word
+            if word == ")":
+                self._advance()
+                return arguments
+            if self._kind is None or word == ";" or (self._kind == IDENT and (_is_stop(word) or self._expected.get(word))) \
+                    or self._at_next_statement():
+                call.flags |= MISSING_PAREN
+                return arguments
+            if self._kind == IDENT and self._peek() in (":=", "=>"):
+                argument = self._node("ARG", self._text(), children=[])
+                self._advance()
+                self._advance()
+                argument.children.append(self._expression())
+                arguments.append(self._finish(argument))
+            else:
+                arguments.append(self._expression())
+            if self._word == ",":
+                self._advance()
+            elif self._word != ")":
+                # Stray token or a missing ',' between arguments
+                call.flags |= MISSING_PAREN
+                return arguments
+
+
+    def _at_next_statement(self) -> bool:
+        """Whether a name starting a line, no further right than the statement
+        being parsed, most likely starts the next statement after an unclosed call."""
+        return (
+            (self._kind == IDENT or self._kind == QUOTED_IDENT)
+            and self._i != self._last_line
+            and self._start <= self._column
+        )
+
+
+def _is_stop(word: str) -> bool:
+    return word in EXPRESSION_STOPS or word.startswith("END_")
+
+
+def _span(node: SyntaxNode) -> tuple[int, int, int, int]:
+    return node.line, node.start, node.end_line, node.end
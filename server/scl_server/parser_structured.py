@@ -1,22 +1,34 @@
-import re
+import sys
 from collections import defaultdict
+from collections.abc import Mapping
+from types import MappingProxyType
+
+from lexer import COMMENT, IDENT, QUOTED_IDENT, TYPED_LITERAL, LexedDocument, comment_text, dotted_end, find_operator
 
 VAR_BLOCKS = {
     "VAR_INPUT", "VAR_OUTPUT", "VAR_IN_OUT", "VAR", "VAR_TEMP", "CONST",
 }
 
+# Children of every leaf node; add_child() replaces it with a dict of its own
+NO_CHILDREN = MappingProxyType({})
+
+
 class VariableNode:
+    __slots__ = ("name", "var_type", "data_type", "parent", "children", "default", "comment", "block_type")
+
     def __init__(self, name, var_type, data_type, parent=None, default=None, comment=None, block_type=None):
         self.name = name
         self.var_type = var_type  # input, output, inout, static, temp, normal
         self.data_type = data_type  # INT, BOOL, STRUCT, etc.
         self.parent = parent  # parent VariableNode or None
-        self.children = {}  # name -> VariableNode
+        self.children = NO_CHILDREN  # name -> VariableNode
         self.default = default
         self.comment = comment
         self.block_type = block_type  # VAR_INPUT, VAR_OUTPUT, etc.
 
     def add_child(self, child):
+        if self.children is NO_CHILDREN:
+            self.children = {}
         self.children[child.name] = child
 
     def to_dict(self):
@@ -31,100 +43,313 @@ class VariableNode:
             "block_type": self.block_type,
         }
 
+def _interned(record) -> tuple:
+    """Record with its name and type strings interned, as _scan_line() makes them."""
+    if record[0] == "END_STRUCT":
+        return tuple(record)
+    kind, name, block_type, data_type, default, comment = record
+    return kind, sys.intern(name), sys.intern(block_type), sys.intern(data_type), default, comment
+
+
+class NodePaths(Mapping):
+    """All VariableNodes by full path ("outer.inner.member").
+
+    The paths aren't stored: a lookup walks the children of `variables` one
+    segment at a time, and iteration joins the paths on the fly.
+    """
+
+    def __init__(self, variables: dict):
+        self._variables = variables
+
+    def __getitem__(self, path):
+        if not isinstance(path, str):
+            raise KeyError(path)
+        nodes = self._variables
+        node = None
+        for name in path.split("."):
+            node = nodes.get(name)
+            if node is None:
+                raise KeyError(path)
+            nodes = node.children
+        return node
+
+    def __iter__(self):
+        return (path for path, _ in self._walk())
+
+    def __len__(self):
+        return sum(1 for _ in self._walk())
+
+    def values(self):
+        return (node for _, node in self._walk())
+
+    def items(self):
+        return self._walk()
+
+    def _walk(self):
+        stack = [(None, node) for node in reversed(self._variables.values())]
+        while stack:
+            prefix, node = stack.pop()
+            path = node.name if prefix is None else f"{prefix}.{node.name}"
+            yield path, node
+            if node.children:
+                stack.extend((path, child) for child in reversed(node.children.values()))
+
+
+def declaration_paths(records: list):
+    """Yield (index, path of names) of the declarations among records (None entries allowed)."""
+    parents = ()
+    for i, record in enumerate(records):
+        if record is None:
+            continue
+        if record[0] == "END_STRUCT":
+            parents = parents[:-1]
+            continue
+        path = parents + (record[1],)
+        yield i, path
+        if record[0] == "STRUCT":
+            parents = path
+
+
+def data_type_end(line: str, code: list, index: int) -> int | None:
+    """Index just past the data type starting at code[index]: a name, a "UDT",
+    STRING[n] or ARRAY[..] OF another data type; None if there is none."""
+    if index >= len(code) or code[index][0] not in (IDENT, QUOTED_IDENT):
+        return None
+    if code[index][0] == QUOTED_IDENT:
+        return index + 1
+    array = line[code[index][1]:code[index][2]].upper() == "ARRAY"
+    end = dotted_end(line, code, index)
+    if end < len(code) and line[code[end][1]:code[end][2]] == "[":
+        depth = 0
+        for end in range(end, len(code)):
+            text = line[code[end][1]:code[end][2]]
+            depth += (text == "[") - (text == "]")
+            if not depth:
+                break
+        else:
+            return None
+        end += 1
+    if not array:
+        return end
+    if end < len(code) and code[end][0] == IDENT and line[code[end][1]:code[end][2]].upper() == "OF":
+        return data_type_end(line, code, end + 1)
+    return None
+
+
 class StructuredSCLParser:
     def __init__(self):
         self.variables = {}  # name -> VariableNode
-        self.all_nodes = {}  # all VariableNodes by full path
+        self.all_nodes = NodePaths(self.variables)  # all VariableNodes by full path
+        self.symbols_key = hash(())  # hash of the declared names, kinds and types, see _build_nodes()
+        # Per-line checkpoints used by edited():
+        # scan state (block_type, parent_stack) at the start of each line
+        # and the declaration record found on that line (or None)
+        self._states = []
+        self._records = []
+        self._end_state = (None, ())
+        self._lines = None  # declaration_lines(), built on first use
 
     def parse(self, text: str):
-        self.variables = {}
-        self.all_nodes = {}
-        lines = text.splitlines()
-        block_type = None
+        self.parse_lexed(LexedDocument.from_text(text))
+
+    def parse_lexed(self, lexed: LexedDocument):
+        self._states = []
+        self._records = []
+        self._lines = None
+        state = (None, ())
+        for line, tokens in zip(lexed.lines, lexed.tokens):
+            self._states.append(state)
+            state, record = self._scan_line(line, tokens, state)
+            self._records.append(record)
+        self._end_state = state
+        self._build_nodes()
+
+    def edited(self, lexed: LexedDocument, start: int, old_end: int, new_end: int) -> "StructuredSCLParser":
+        """Parser of `lexed`, in which lines [start, old_end) were replaced by lines [start, new_end).
+
+        Scanning resumes from the checkpoint at `start` and stops as soon as the
+        scan state matches the old checkpoint again after the edited range.
+        The new parser shares the checkpoints of unchanged lines with this one,
+        its node tree too unless a declaration actually changed, and its
+        declaration_lines() if no declaration moved either; neither is
+        modified afterwards, so other threads may keep reading this one.
+        Everything is parsed again when the range doesn't fit.
+        """
+        parser = StructuredSCLParser.__new__(StructuredSCLParser)
+        lines = lexed.lines
+        old_count = len(self._states)
+        if not (0 <= start <= old_end <= old_count and start <= new_end <= len(lines)) \
+                or len(lines) - old_count != new_end - old_end:
+            parser.parse_lexed(lexed)
+            return parser
+
+        state = self._states[start] if start < old_count else self._end_state
+        new_states = []
+        new_records = []
+        i = start
+        while True:
+            if i >= new_end:
+                j = i - new_end + old_end
+                if j >= old_count or self._states[j] == state:
+                    break
+            new_states.append(state)
+            state, record = self._scan_line(lines[i], lexed.tokens[i], state)
+            new_records.append(record)
+            i += 1
+
+        j = i - new_end + old_end
+        parser._states = self._states[:start] + new_states + self._states[j:]
+        parser._records = self._records[:start] + new_records + self._records[j:]
+        parser._end_state = state if j >= old_count else self._end_state
+        parser._lines = None
+        # The node tree only depends on the sequence of records, not on their lines
+        if [r for r in self._records[start:j] if r is not None] != [r for r in new_records if r is not None]:
+            parser._build_nodes()
+        else:
+            parser.variables = self.variables
+            parser.all_nodes = self.all_nodes
+            parser.symbols_key = self.symbols_key
+            if i == j or not any(record is not None for record in self._records[j:]):
+                parser._lines = self._lines
+        return parser
+
+    def declarations(self) -> list[tuple]:
+        """Declaration records in source order; a compact, picklable form of the node tree."""
+        return [record for record in self._records if record is not None]
+
+    @classmethod
+    def from_declarations(cls, records: list) -> "StructuredSCLParser":
+        """Parser holding the nodes of `declarations()` output (without edited() checkpoints)."""
+        parser = cls()
+        parser._records = [_interned(record) for record in records]
+        parser._build_nodes()
+        return parser
+
+    def _scan_line(self, line: str, tokens: list, state: tuple):
+        """Return (next_state, record) for a single lexed source line."""
+        block_type, parent_stack = state
+        code = [t for t in tokens if t[0] != COMMENT]
+        if not code:
+            return state, None
+        words = [line[start:end] for _, start, end in code[:3]]
+        first = words[0].upper()
+
+        # Detect block start
+        if len(code) == 1 and first in VAR_BLOCKS:
+            return (sys.intern(first), parent_stack), None
+        if first == "END_VAR" or first == "END_CONST":
+            return (None, parent_stack), None
+        # Bare STRUCT ... END_STRUCT; body of a TYPE (UDT) or DATA_BLOCK
+        if len(code) == 1 and first == "STRUCT" and block_type is None:
+            return ("STRUCT", parent_stack), None
+
+        # Structure end
+        if first == "END_STRUCT" and len(words) > 1 and words[1] == ";":
+            if parent_stack:
+                return (block_type, parent_stack[:-1]), ("END_STRUCT",)
+            if block_type == "STRUCT":
+                return (None, parent_stack), None
+            return state, None
+
+        if not block_type or len(code) < 3 or code[0][0] != IDENT:
+            return state, None
+        # Member names repeat across the elements of generated DBs
+        name = sys.intern(words[0])
+
+        # Structure start: NAME : STRUCT
+        if words[1] == ":" and code[2][0] == IDENT and words[2].upper() == "STRUCT":
+            record = ("STRUCT", name, block_type, "STRUCT", None, comment_text(line, tokens))
+            return (block_type, parent_stack + (name,)), record
+
+        # Constant definition: NAME := TYPE#VALUE;
+        if words[1] == ":=" and code[2][0] == TYPED_LITERAL and block_type == "CONST":
+            semicolon = find_operator(line, code, ";", 3)
+            if semicolon is None:
+                return state, None
+            literal_start = code[2][1]
+            hash_index = line.index("#", literal_start)
+            data_type = sys.intern(line[literal_start:hash_index])
+            value = line[hash_index + 1:code[semicolon][1]].strip()
+            return state, ("CONST", name, block_type, data_type, value, comment_text(line, tokens))
+
+        # Variable declaration: NAME : TYPE [:= DEFAULT];
+        if words[1] == ":" and code[2][0] in (IDENT, QUOTED_IDENT):
+            type_end = data_type_end(line, code, 2)
+            if type_end is None or type_end >= len(code):
+                return state, None
+            data_type = sys.intern(line[code[2][1]:code[type_end - 1][2]])
+            after = line[code[type_end][1]:code[type_end][2]]
+            default = None
+            if after == ":=":
+                semicolon = find_operator(line, code, ";", type_end + 1)
+                if semicolon is None or semicolon == type_end + 1:
+                    return state, None
+                default = line[code[type_end][2]:code[semicolon][1]].strip()
+            elif after != ";":
+                return state, None
+            record = ("VAR", name, block_type, data_type, default, comment_text(line, tokens))
+            return state, record
+
+        return state, None
+
+    def _build_nodes(self):
+        """Rebuild the VariableNode tree from the per-line declaration records.
+
+        The new dicts are swapped in at the end so readers on other threads
+        always see a complete tree.
+        """
+        variables = {}
         parent_stack = []
         current_parent = None
+        # What name resolution depends on; comments and initial values are left out
+        symbols = []
 
-        for line in lines:
-            stripped = line.strip()
-            upper = stripped.upper()
-
-            # Detect block start
-            if upper in VAR_BLOCKS:
-                block_type = upper
+        for record in self._records:
+            if record is None:
                 continue
-            if upper.startswith("END_VAR") or upper.startswith("END_CONST"):
-                block_type = None
+            kind = record[0]
+            if kind == "END_STRUCT":
+                symbols.append(kind)
+                parent_stack.pop()
+                current_parent = parent_stack[-1] if parent_stack else None
                 continue
 
-            # Structure start
-            struct_match = re.match(r"(?i)(\w+)\s*:\s*STRUCT\b", stripped)
-            if struct_match and block_type:
-                name = struct_match.group(1)
-                node = VariableNode(
-                    name=name,
-                    var_type=self._block_to_vartype(block_type),
-                    data_type="STRUCT",
-                    parent=current_parent,
-                    comment=self._extract_comment(stripped),
-                    block_type=block_type
-                )
-                if current_parent:
-                    current_parent.add_child(node)
-                else:
-                    self.variables[name] = node
-                self.all_nodes[self._full_path(parent_stack, name)] = node
-                parent_stack.append(name)
+            _, name, block_type, data_type, default, comment = record
+            symbols.append((kind, name, block_type, data_type))
+            node = VariableNode(
+                name=name,
+                var_type="constant" if kind == "CONST" else self._block_to_vartype(block_type),
+                data_type=data_type,
+                parent=current_parent,
+                default=default,
+                comment=comment,
+                block_type=block_type
+            )
+            if current_parent:
+                current_parent.add_child(node)
+            else:
+                variables[name] = node
+            if kind == "STRUCT":
+                parent_stack.append(node)
                 current_parent = node
-                continue
 
-            # Structure end
-            if re.match(r"(?i)END_STRUCT\s*;", stripped):
-                if parent_stack:
-                    parent_stack.pop()
-                    current_parent = self._get_parent_node(parent_stack)
-                continue
+        self.variables = variables
+        self.all_nodes = NodePaths(variables)
+        self.symbols_key = hash(tuple(symbols))
 
-            # Constant definition: NAME := TYPE#VALUE;
-            const_match = re.match(r"(?i)(\w+)\s*:=\s*([\w]+)#([^;]+)\s*;", stripped)
-            if const_match and block_type == "CONST":
-                name, data_type, value = const_match.groups()
-                node = VariableNode(
-                    name=name,
-                    var_type="constant",
-                    data_type=data_type,
-                    parent=current_parent,
-                    default=value.strip(),
-                    comment=self._extract_comment(stripped),
-                    block_type=block_type
-                )
-                if current_parent:
-                    current_parent.add_child(node)
-                else:
-                    self.variables[name] = node
-                self.all_nodes[self._full_path(parent_stack, name)] = node
-                continue
+    def declaration_lines(self) -> dict[tuple, int]:
+        """Line of every declaration by its path of names, the last one of duplicates.
 
-            # Variable declaration
-            var_match = re.match(r"(?i)(\w+)\s*:\s*([\w.]+)(?:\s*:=\s*([^;]+))?\s*;", stripped)
-            if var_match and block_type:
-                name, data_type, default = var_match.groups()
-                node = VariableNode(
-                    name=name,
-                    var_type=self._block_to_vartype(block_type),
-                    data_type=data_type,
-                    parent=current_parent,
-                    default=default.strip() if default else None,
-                    comment=self._extract_comment(stripped),
-                    block_type=block_type
-                )
-                if current_parent:
-                    current_parent.add_child(node)
-                else:
-                    self.variables[name] = node
-                self.all_nodes[self._full_path(parent_stack, name)] = node
-
-        # Optionally: flatten children for easier lookup
-        # self._flatten_children(self.variables)
+        The dict is shared with the parsers of later versions while it holds
+        for them, so it must not be modified.
+        """
+        if self._lines is None:
+            self._lines = {path: i for i, path in declaration_paths(self._records)}
+        return self._lines
+
+    def declares(self, line: int) -> bool:
+        """Whether a variable or constant is declared on `line`."""
+        return line < len(self._records) and self._records[line] is not None and self._records[line][0] != "END_STRUCT"
 
     def _block_to_vartype(self, block_type):
         if block_type == "VAR_INPUT":
@@ -141,21 +366,6 @@ class StructuredSCLParser:
             return "constant"
         return "normal"
 
-    def _full_path(self, parent_stack, name):
-        return ".".join(parent_stack + [name]) if parent_stack else name
-
-    def _get_parent_node(self, parent_stack):
-        if not parent_stack:
-            return None
-        path = ".".join(parent_stack)
-        return self.all_nodes.get(path)
-
-    def _extract_comment(self, line: str) -> str:
-        comment_index = line.find("//")
-        if comment_index != -1:
-            return line[comment_index + 2:].strip()
-        return ""
-
     def get_variable(self, name: str) -> dict | None:
         node = self.all_nodes.get(name)
         return node.to_dict() if node else None
@@ -168,3 +378,4 @@ class StructuredSCLParser:
         if node:
             return [child.to_dict() for child in node.children.values()]
         return []
+
@@ -0,0 +1,136 @@
+import logging
+
+from lsprotocol.types import (
+    DocumentDiagnosticParams,
+    FullDocumentDiagnosticReport,
+    UnchangedDocumentDiagnosticReport,
+    WorkspaceDiagnosticParams,
+    WorkspaceDiagnosticReport,
+    WorkspaceFullDocumentDiagnosticReport,
+    WorkspaceUnchangedDocumentDiagnosticReport,
+)
+from pygls.server import LanguageServer
+from pygls.uris import from_fs_path
+
+from diagnostics import compute_diagnostics
+from document_store import get_model
+from lexer import LexedDocument
+from memory_manager import DIAGNOSTIC_BYTES, memory
+from parser_body import SyntaxTree
+from parser_structured import StructuredSCLParser
+from scheduler import scheduler
+from telemetry import telemetry
+from workspace_index import workspace_index
+
+logger = logging.getLogger(__name__)
+
+
+def result_id(version) -> str:
+    """resultId of the diagnostics of a document version.
+
+    The checks also depend on the workspace symbols (global DBs), so the
+    index generation is part of it.
+    """
+    return f"{version}/{workspace_index.generation}"
+
+
+class ReportCache:
+    """Last computed diagnostics per URI, reused while the resultId is the same.
+
+    Reports are tracked by the memory manager like the document models.
+    """
+
+    def __init__(self):
+        self._reports = {}  # uri -> (result_id, diagnostics)
+
+    def get(self, uri: str, current_id: str):
+        report = self._reports.get(uri)
+        if report is not None and report[0] == current_id:
+            telemetry.count("pull_diagnostics.hit")
+            memory.touch(uri)
+            return report[1]
+        telemetry.count("pull_diagnostics.miss")
+        return None
+
+    def put(self, uri: str, current_id: str, diagnostics: list):
+        self._reports[uri] = (current_id, diagnostics)
+        memory.track(uri, "diagnostics", (len(diagnostics) + 1) * DIAGNOSTIC_BYTES, self.forget)
+
+    def forget(self, uri: str):
+        self._reports.pop(uri, None)
+        memory.untrack(uri, "diagnostics")
+
+
+reports = ReportCache()
+
+
+async def document_diagnostic(ls: LanguageServer, params: DocumentDiagnosticParams):
+    doc = ls.workspace.get_text_document(params.text_document.uri)
+    model = get_model(doc)
+    current_id = result_id(model.version)
+    if params.previous_result_id == current_id:
+        return UnchangedDocumentDiagnosticReport(result_id=current_id)
+    diagnostics = reports.get(doc.uri, current_id)
+    if diagnostics is None:
+        diagnostics = await ls.loop.run_in_executor(
+            scheduler.executor, compute_diagnostics, model.lexed, model.parser, model.tree
+        )
+        # Not if the document or the workspace index changed while checking
+        if result_id(model.version) == current_id:
+            reports.put(doc.uri, current_id, diagnostics)
+    return FullDocumentDiagnosticReport(items=diagnostics, result_id=current_id)
+
+
+async def workspace_diagnostic(ls: LanguageServer, params: WorkspaceDiagnosticParams) -> WorkspaceDiagnosticReport:
+    """Reports for the open documents and every indexed file of the workspace.
+
+    Files that aren't open are identified by the content hash from the index.
+    """
+    previous = {item.uri: item.value for item in params.previous_result_ids or []}
+    items = []
+    open_uris = set(ls.workspace.text_documents)
+    for uri in sorted(open_uris):
+        model = get_model(ls.workspace.get_text_document(uri))
+        version = model.version if isinstance(model.version, int) else None
+        current_id = result_id(model.version)
+        if previous.get(uri) == current_id:
+            items.append(WorkspaceUnchangedDocumentDiagnosticReport(uri=uri, result_id=current_id, version=version))
+            continue
+        diagnostics = reports.get(uri, current_id)
+        if diagnostics is None:
+            diagnostics = await ls.loop.run_in_executor(
+                scheduler.executor, compute_diagnostics, model.lexed, model.parser, model.tree
+            )
+            if result_id(model.version) == current_id:
+                reports.put(uri, current_id, diagnostics)
+        items.append(WorkspaceFullDocumentDiagnosticReport(uri=uri, items=diagnostics, result_id=current_id, version=version))
+
+    for path, file_symbols in sorted(workspace_index.files.items()):
+        uri = from_fs_path(path)
+        if uri is None or uri in open_uris:
+            continue
+        current_id = result_id(file_symbols.digest)
+        if previous.get(uri) == current_id:
+            items.append(WorkspaceUnchangedDocumentDiagnosticReport(uri=uri, result_id=current_id, version=None))
+            continue
+        diagnostics = reports.get(uri, current_id)
+        if diagnostics is None:
+            try:
+                diagnostics = await ls.loop.run_in_executor(scheduler.executor, file_diagnostics, path)
+            except OSError:
+                logger.warning("Failed to check %s", path, exc_info=True)
+                continue
+            file_symbols = workspace_index.files.get(path)
+            if file_symbols is not None and result_id(file_symbols.digest) == current_id:
+                reports.put(uri, current_id, diagnostics)
+        items.append(WorkspaceFullDocumentDiagnosticReport(uri=uri, items=diagnostics, result_id=current_id, version=None))
+    return WorkspaceDiagnosticReport(items=items)
+
+
+def file_diagnostics(path: str) -> list:
+    """Diagnostics of a file on disk that isn't open."""
+    with open(path, "rb") as f:
+        lexed = LexedDocument.from_text(f.read().decode("utf-8-sig", errors="replace"))
+    parser = StructuredSCLParser()
+    parser.parse_lexed(lexed)
+    return compute_diagnostics(lexed, parser, SyntaxTree.from_lexed(lexed))
@@ -0,0 +1,90 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from pygls.server import LanguageServer
+
+from diagnostics import DiagnosticsCancelled, compute_diagnostics
+from document_store import get_model
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class DiagnosticsScheduler:
+    """Debounced, cancellable diagnostics running in a thread pool.
+
+    Each schedule() call for a URI replaces the pending pass for that URI
+    (coalescing superseded versions) and cancels a pass already in flight.
+    All bookkeeping happens on the event loop; only compute_diagnostics runs
+    in the worker threads.
+    """
+
+    def __init__(self):
+        self._executor = None
+        self._pending = {}  # uri -> asyncio.TimerHandle
+        self._running = {}  # uri -> threading.Event cancelling the in-flight pass
+        self._generation = {}  # uri -> id of the latest scheduled pass
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=settings.diagnostics_workers, thread_name_prefix="scl-diagnostics"
+            )
+        return self._executor
+
+    def schedule(self, ls: LanguageServer, uri: str, delay: float | None = None):
+        generation = self._generation.get(uri, 0) + 1
+        self._generation[uri] = generation
+        self._cancel(uri)
+        if delay is None:
+            delay = settings.diagnostics_debounce
+        self._pending[uri] = ls.loop.call_later(delay, self._start, ls, uri, generation)
+
+    def forget(self, uri: str):
+        self._cancel(uri)
+        self._generation.pop(uri, None)
+
+    def _cancel(self, uri: str):
+        handle = self._pending.pop(uri, None)
+        if handle is not None:
+            handle.cancel()
+        cancelled = self._running.pop(uri, None)
+        if cancelled is not None:
+            cancelled.set()
+
+    def _start(self, ls: LanguageServer, uri: str, generation: int):
+        self._pending.pop(uri, None)
+        # The model is normally already up to date from didChange
+        model = get_model(ls.workspace.get_text_document(uri))
+        cancelled = threading.Event()
+        self._running[uri] = cancelled
+        future = ls.loop.run_in_executor(
+            self.executor, compute_diagnostics, model.lexed, model.parser, model.tree, cancelled.is_set
+        )
+        version = model.version if isinstance(model.version, int) else None
+        future.add_done_callback(partial(self._finish, ls, uri, generation, version, cancelled))
+
+    def _finish(self, ls: LanguageServer, uri: str, generation: int, version: int | None, cancelled: threading.Event, future):
+        if self._running.get(uri) is cancelled:
+            del self._running[uri]
+        if future.cancelled() or cancelled.is_set() or self._generation.get(uri) != generation:
+            return
+        error = future.exception()
+        if error is not None:
+            if not isinstance(error, DiagnosticsCancelled):
+                logger.error("Diagnostics failed for %s", uri, exc_info=error)
+            return
+        ls.publish_diagnostics(uri, future.result(), version=version)
+
+    def shutdown(self):
+        for uri in list(self._pending) + list(self._running):
+            self._cancel(uri)
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+scheduler = DiagnosticsScheduler()
@@ -0,0 +1,198 @@
+import itertools
+
+from lsprotocol.types import SemanticTokens, SemanticTokensDelta, SemanticTokensEdit, SemanticTokensLegend
+
+from lexer import COMMENT, LexedDocument
+from occurrence_index import declared_token, line_occurrences
+from parser_structured import StructuredSCLParser, VariableNode
+from telemetry import telemetry
+from type_resolver import type_resolver
+from workspace_index import workspace_index
+
+TOKEN_TYPES = ["variable", "parameter", "property", "struct", "class", "function", "namespace"]
+TOKEN_MODIFIERS = ["declaration", "readonly", "static", "input", "output", "inout", "temporary"]
+LEGEND = SemanticTokensLegend(token_types=TOKEN_TYPES, token_modifiers=TOKEN_MODIFIERS)
+
+VARIABLE, PARAMETER, PROPERTY, STRUCT, CLASS, FUNCTION, NAMESPACE = range(len(TOKEN_TYPES))
+DECLARATION, READONLY, STATIC, INPUT, OUTPUT, INOUT, TEMPORARY = (1 << i for i in range(len(TOKEN_MODIFIERS)))
+
+# VariableNode.var_type -> (token type, modifiers)
+VAR_TYPES = {
+    "input": (PARAMETER, INPUT),
+    "output": (PARAMETER, OUTPUT),
+    "inout": (PARAMETER, INOUT),
+    "static": (VARIABLE, STATIC),
+    "temporary": (VARIABLE, TEMPORARY),
+    "constant": (VARIABLE, READONLY),
+}
+
+UNIT_TYPES = {
+    "FUNCTION_BLOCK": CLASS,
+    "FUNCTION": FUNCTION,
+    "TYPE": STRUCT,
+    "DATA_BLOCK": NAMESPACE,
+    "ORGANIZATION_BLOCK": NAMESPACE,
+    "PROGRAM": NAMESPACE,
+}
+
+_result_ids = itertools.count(1)
+
+
+class SemanticTokensCache:
+    """Semantic tokens of one document, kept across its versions.
+
+    The tokens of a line only depend on its text and on the declared names
+    of the document and the workspace index, so the encoded tokens of each
+    line are reused for every version until the declarations change. The
+    last result is kept to answer delta requests with a single edit.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self._rows = {}  # (text, declared path, first token) -> encoded tokens of the line without the line delta
+        self._rows_key = None  # (symbols_key, index generation) the rows were classified with
+        self._lexed = None
+        self.result_id = None
+        self.data = []
+
+    def full(self, lexed: LexedDocument, parser: StructuredSCLParser) -> SemanticTokens:
+        self._update(lexed, parser)
+        return SemanticTokens(data=self.data, result_id=self.result_id)
+
+    def delta(self, lexed: LexedDocument, parser: StructuredSCLParser, previous_result_id: str):
+        """Edits from the result `previous_result_id` to the tokens of this version,
+        or all of them if that result isn't the last one sent."""
+        if previous_result_id != self.result_id:
+            telemetry.count("semantic_tokens.delta.miss")
+            return self.full(lexed, parser)
+        telemetry.count("semantic_tokens.delta.hit")
+        previous = self.data
+        self._update(lexed, parser)
+        if self.data is previous:
+            return SemanticTokensDelta(edits=[], result_id=self.result_id)
+        return SemanticTokensDelta(edits=token_edits(previous, self.data), result_id=self.result_id)
+
+    def _update(self, lexed: LexedDocument, parser: StructuredSCLParser):
+        key = (parser.symbols_key, workspace_index.generation)
+        if lexed is self._lexed and key == self._rows_key:
+            return
+        with telemetry.timer("semantic_tokens.encode", len(lexed.lines)):
+            if key != self._rows_key or len(self._rows) > 2 * len(lexed.lines) + 100:
+                self._rows = {}
+                self._rows_key = key
+            self.data = self._encode(lexed, parser)
+        self._lexed = lexed
+        self.result_id = str(next(_result_ids))
+
+    def _encode(self, lexed: LexedDocument, parser: StructuredSCLParser) -> list[int]:
+        declared = {i: path for path, i in parser.declaration_lines().items()}
+        rows = self._rows
+        data = []
+        previous = 0
+        reused = 0
+        for i, (text, tokens) in enumerate(zip(lexed.lines, lexed.tokens)):
+            if not tokens:
+                continue
+            row_key = (text, declared.get(i), tokens[0])
+            row = rows.get(row_key)
+            if row is None:
+                row = rows[row_key] = line_tokens(lexed, parser, i, declared.get(i))
+            else:
+                reused += 1
+            if row:
+                data.append(i - previous)
+                data.extend(row)
+                previous = i
+        telemetry.count("semantic_tokens.line.hit", reused)
+        return data
+
+
+def line_tokens(lexed: LexedDocument, parser: StructuredSCLParser, line: int, path: tuple | None) -> list[int]:
+    """Encoded tokens of a line, the delta line of the first one left out."""
+    text = lexed.lines[line]
+    code = [t for t in lexed.tokens[line] if t[0] != COMMENT]
+    if not code:
+        return []
+    found = []  # (start, length, type, modifiers)
+    skip = declared_token(lexed, parser, line, code)
+    if skip == 0 and path is not None:
+        node = parser.all_nodes.get(".".join(path))
+        if node is not None:
+            token_type, modifiers = node_token(node, len(path) > 1)
+            found.append((code[0][1], code[0][2] - code[0][1], token_type, modifiers | DECLARATION))
+    elif skip == 1:
+        keyword = text[code[0][1]:code[0][2]].upper()
+        found.append((code[1][1], code[1][2] - code[1][1], UNIT_TYPES.get(keyword, NAMESPACE), DECLARATION))
+    for start, name, quoted in line_occurrences(text, code, skip):
+        found.extend(name_tokens(parser, start, name, quoted))
+    found.sort()
+    row = []
+    previous = 0
+    for start, length, token_type, modifiers in found:
+        row += (0, start - previous, length, token_type, modifiers)
+        previous = start
+    return row[1:]
+
+
+def node_token(node: VariableNode, member: bool) -> tuple[int, int]:
+    if member:
+        return PROPERTY, 0
+    return VAR_TYPES.get(node.var_type, (VARIABLE, 0))
+
+
+def name_tokens(parser: StructuredSCLParser, start: int, name: str, quoted: bool):
+    """(start, length, type, modifiers) of the segments of a dotted name that resolve."""
+    segments = name.split(".")
+    first = segments[0]
+    node = parser.variables.get(first)
+    if node is not None:
+        yield (start, len(first) + 2 * quoted, *node_token(node, False))
+        members = type_resolver.members(node)
+    else:
+        unit = workspace_index.units.get(first)
+        if unit is None:
+            return
+        yield start, len(first) + 2 * quoted, UNIT_TYPES.get(unit.kind, NAMESPACE), 0
+        if unit.kind != "DATA_BLOCK":
+            return
+        members = unit.variables
+    offset = start + len(first) + 2 * quoted + 1
+    for segment in segments[1:]:
+        node = members.get(segment) if members is not None else None
+        if node is None:
+            return
+        yield offset, len(segment), PROPERTY, 0
+        members = type_resolver.members(node)
+        offset += len(segment) + 1
+
+
+def token_edits(previous: list[int], data: list[int]) -> list[SemanticTokensEdit]:
+    """One edit replacing what lies between the common start and end of two token arrays."""
+    end = min(len(previous), len(data))
+    prefix = _common(previous, data, end)
+    # Whole tokens, so a token is never split between the kept and the replaced ints
+    prefix -= prefix % 5
+    suffix = _common(previous[::-1], data[::-1], end - prefix)
+    suffix -= suffix % 5
+    if prefix == len(previous) == len(data):
+        return []
+    return [SemanticTokensEdit(
+        start=prefix, delete_count=len(previous) - prefix - suffix, data=data[prefix:len(data) - suffix],
+    )]
+
+
+def _common(a: list[int], b: list[int], end: int) -> int:
+    """Length of the common start of a and b, at most `end`, comparing slices in blocks."""
+    start = 0
+    step = 1024
+    while start < end:
+        stop = min(start + step, end)
+        if a[start:stop] == b[start:stop]:
+            start = stop
+            continue
+        if step == 1:
+            return start
+        step = max(1, step // 32)
+    return end
@@ -0,0 +1,45 @@
+class Settings:
+    """Server options, overridable through the client's initializationOptions."""
+
+    def __init__(self):
+        self.diagnostics_debounce = 0.3  # seconds of inactivity before a diagnostics pass
+        self.diagnostics_workers = 1  # threads running diagnostics off the event loop
+        self.index_workspace = True  # scan all .scl files of the workspace on startup
+        self.index_cache_dir = None  # directory of the workspace index cache, None for the default
+        self.index_workers = 0  # processes parsing files on a cold index, 0 for one per CPU but one
+        self.completion_max_items = 100  # completion items per response; more mark the list incomplete
+        self.telemetry = False  # record request and check timings for scl.performanceReport
+        self.telemetry_buffer = 10000  # timings kept in the ring buffer
+        self.telemetry_log = None  # file to append a JSON report to periodically, None for none
+        self.telemetry_interval = 60.0  # seconds between reports written to telemetry_log
+        self.memory_budget = 512 * 1024 * 1024  # estimated bytes of parsed state kept for closed documents
+        self.memory_max_entries = 1000  # documents and index units whose parsed state is kept
+
+    def update(self, options: dict | None):
+        if not isinstance(options, dict):
+            return
+        for key, (attr, convert) in _OPTIONS.items():
+            if key in options:
+                try:
+                    setattr(self, attr, convert(options[key]))
+                except (TypeError, ValueError):
+                    pass
+
+
+# initializationOptions key -> (attribute, converter)
+_OPTIONS = {
+    "diagnosticsDebounceMs": ("diagnostics_debounce", lambda v: max(0.0, float(v)) / 1000),
+    "diagnosticsWorkers": ("diagnostics_workers", lambda v: max(1, int(v))),
+    "indexWorkspace": ("index_workspace", bool),
+    "indexCacheDir": ("index_cache_dir", lambda v: str(v) if v else None),
+    "indexWorkers": ("index_workers", lambda v: max(0, int(v))),
+    "completionMaxItems": ("completion_max_items", lambda v: max(1, int(v))),
+    "telemetry": ("telemetry", bool),
+    "telemetryBufferSize": ("telemetry_buffer", lambda v: max(1, int(v))),
+    "telemetryLogFile": ("telemetry_log", lambda v: str(v) if v else None),
+    "telemetryLogIntervalSeconds": ("telemetry_interval", lambda v: max(1.0, float(v))),
+    "memoryBudgetMb": ("memory_budget", lambda v: int(max(1.0, float(v)) * 1024 * 1024)),
+    "memoryMaxEntries": ("memory_max_entries", lambda v: max(1, int(v))),
+}
+
+settings = Settings()
@@ -0,0 +1,162 @@
+import functools
+import inspect
+import json
+import logging
+import threading
+import time
+from collections import deque
+
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class Telemetry:
+    """Opt-in timings and counters (settings.telemetry) for scl.performanceReport.
+
+    Timings go into a ring buffer of (time, name, seconds, size) tuples; size
+    is the line count of the document involved, if any. Counters hold cache
+    hits and misses as "<cache>.hit" / "<cache>.miss"; they are updated
+    from the diagnostics threads too, so under a lock. When disabled, timed
+    code only pays for a flag check.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.events = deque(maxlen=10000)
+        self.counters = {}
+        self._counters_lock = threading.Lock()
+        self._log_handle = None
+
+    def configure(self):
+        self.enabled = settings.telemetry
+        if self.events.maxlen != settings.telemetry_buffer:
+            self.events = deque(self.events, maxlen=settings.telemetry_buffer)
+
+    def record(self, name: str, seconds: float, size: int | None = None):
+        self.events.append((time.time(), name, seconds, size))
+
+    def count(self, name: str, amount: int = 1):
+        if self.enabled:
+            with self._counters_lock:
+                self.counters[name] = self.counters.get(name, 0) + amount
+
+    def timer(self, name: str, size: int | None = None) -> "Timer":
+        return Timer(self, name, size)
+
+    def timed(self, name: str, size=None):
+        """Decorator timing each call of a function (sync or async).
+
+        `size(*args)` may return the size to record for the call.
+        """
+        def decorate(function):
+            if inspect.iscoroutinefunction(function):
+                @functools.wraps(function)
+                async def async_wrapper(*args, **kwargs):
+                    if not self.enabled:
+                        return await function(*args, **kwargs)
+                    start = time.perf_counter()
+                    try:
+                        return await function(*args, **kwargs)
+                    finally:
+                        self.record(name, time.perf_counter() - start, size(*args) if size else None)
+                return async_wrapper
+
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self.record(name, time.perf_counter() - start, size(*args) if size else None)
+            return wrapper
+        return decorate
+
+    def report(self) -> dict:
+        """Latency percentiles per name over the buffered events, counters and hit rates."""
+        durations = {}
+        sizes = {}
+        for _, name, seconds, size in list(self.events):
+            durations.setdefault(name, []).append(seconds)
+            if size is not None:
+                sizes.setdefault(name, []).append(size)
+        timings = {}
+        for name, values in sorted(durations.items()):
+            values.sort()
+            timings[name] = {
+                "count": len(values),
+                "p50_ms": round(_percentile(values, 50) * 1000, 3),
+                "p95_ms": round(_percentile(values, 95) * 1000, 3),
+                "max_ms": round(values[-1] * 1000, 3),
+                "total_ms": round(sum(values) * 1000, 3),
+            }
+            if name in sizes:
+                timings[name]["max_lines"] = max(sizes[name])
+        with self._counters_lock:
+            counters = dict(sorted(self.counters.items()))
+        hit_rates = {}
+        for name, hits in counters.items():
+            if name.endswith(".hit"):
+                cache = name[:-len(".hit")]
+                total = hits + counters.get(cache + ".miss", 0)
+                hit_rates[cache] = round(hits / total, 4) if total else 0.0
+        return {
+            "enabled": self.enabled,
+            "events": len(self.events),
+            "timings": timings,
+            "counters": counters,
+            "hit_rates": hit_rates,
+        }
+
+    def start_log(self, loop):
+        """Append a report to settings.telemetry_log every settings.telemetry_interval seconds."""
+        if not self.enabled or not settings.telemetry_log or self._log_handle is not None:
+            return
+        self._log_handle = loop.call_later(settings.telemetry_interval, self._write_log, loop)
+
+    def stop_log(self):
+        if self._log_handle is not None:
+            self._log_handle.cancel()
+            self._log_handle = None
+
+    def _write_log(self, loop):
+        report = self.report()
+        report["time"] = time.time()
+        try:
+            with open(settings.telemetry_log, "a", encoding="utf-8") as f:
+                f.write(json.dumps(report, separators=(",", ":")) + "\n")
+        except OSError:
+            logger.warning("Failed to write telemetry to %s", settings.telemetry_log, exc_info=True)
+        self._log_handle = loop.call_later(settings.telemetry_interval, self._write_log, loop)
+
+
+class Timer:
+    """Context manager recording the duration of its block if telemetry is enabled."""
+
+    __slots__ = ("telemetry", "name", "size", "start")
+
+    def __init__(self, telemetry: Telemetry, name: str, size: int | None):
+        self.telemetry = telemetry
+        self.name = name
+        self.size = size
+        self.start = None
+
+    def __enter__(self):
+        if self.telemetry.enabled:
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.start is not None:
+            self.telemetry.record(self.name, time.perf_counter() - self.start, self.size)
+        return False
+
+
+def _percentile(ordered: list[float], percent: float) -> float:
+    index = max(0, min(len(ordered) - 1, round(percent / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+telemetry = Telemetry()
@@ -0,0 +1,82 @@
+import json
+import threading
+import time
+
+
+class TraceRecorder:
+    """Writes the JSON-RPC messages of a live session as JSON lines.
+
+    Each line is {"time": seconds since the start, "from": "client" or
+    "server", "message": ...}; server/benchmarks/replay.py replays the
+    client messages of such a trace.
+    """
+
+    def __init__(self, path: str):
+        self._file = open(path, "w", encoding="utf-8")
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def record(self, source: str, body: bytes):
+        try:
+            message = json.loads(body)
+        except ValueError:
+            return
+        entry = {"time": round(time.perf_counter() - self._start, 6), "from": source, "message": message}
+        with self._lock:
+            self._file.write(json.dumps(entry, separators=(",", ":")) + "\n")
+            self._file.flush()
+
+    def reader(self, rfile) -> "RecordingReader":
+        return RecordingReader(rfile, self)
+
+    def writer(self, wfile) -> "RecordingWriter":
+        return RecordingWriter(wfile, self)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class RecordingReader:
+    """Server input stream recording each message body read from the client."""
+
+    def __init__(self, rfile, recorder: TraceRecorder):
+        self._rfile = rfile
+        self._recorder = recorder
+
+    @property
+    def closed(self) -> bool:
+        return self._rfile.closed
+
+    def readline(self) -> bytes:
+        return self._rfile.readline()
+
+    def read(self, size: int = -1) -> bytes:
+        # The transport reads the headers line by line and each body in one read()
+        body = self._rfile.read(size)
+        if body:
+            self._recorder.record("client", body)
+        return body
+
+    def close(self):
+        self._rfile.close()
+
+
+class RecordingWriter:
+    """Server output stream recording each message written to the client."""
+
+    def __init__(self, wfile, recorder: TraceRecorder):
+        self._wfile = wfile
+        self._recorder = recorder
+
+    def write(self, data: bytes):
+        self._wfile.write(data)
+        _, _, body = data.partition(b"\r\n\r\n")
+        if body:
+            self._recorder.record("server", body)
+
+    def flush(self):
+        self._wfile.flush()
+
+    def close(self):
+        self._wfile.close()
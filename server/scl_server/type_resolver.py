@@ -0,0 +1,189 @@
+import re
+from collections.abc import Mapping
+from functools import lru_cache
+
+from lexer import LexedDocument
+from parser_structured import VariableNode
+from workspace_index import UnitSymbols, scan_units, workspace_index
+
+# Interfaces of the IEC timers, counters and edge detectors that have no source in a project
+BUILTIN_SOURCE = """
+FUNCTION_BLOCK TP
+VAR_INPUT
+    IN : BOOL;
+    PT : TIME;
+END_VAR
+VAR_OUTPUT
+    Q : BOOL;
+    ET : TIME;
+END_VAR
+END_FUNCTION_BLOCK
+FUNCTION_BLOCK TON
+VAR_INPUT
+    IN : BOOL;
+    PT : TIME;
+END_VAR
+VAR_OUTPUT
+    Q : BOOL;
+    ET : TIME;
+END_VAR
+END_FUNCTION_BLOCK
+FUNCTION_BLOCK TOF
+VAR_INPUT
+    IN : BOOL;
+    PT : TIME;
+END_VAR
+VAR_OUTPUT
+    Q : BOOL;
+    ET : TIME;
+END_VAR
+END_FUNCTION_BLOCK
+FUNCTION_BLOCK TONR
+VAR_INPUT
+    IN : BOOL;
+    R : BOOL;
+    PT : TIME;
+END_VAR
+VAR_OUTPUT
+    Q : BOOL;
+    ET : TIME;
+END_VAR
+END_FUNCTION_BLOCK
+FUNCTION_BLOCK CTU
+VAR_INPUT
+    CU : BOOL;
+    R : BOOL;
+    PV : INT;
+END_VAR
+VAR_OUTPUT
+    Q : BOOL;
+    CV : INT;
+END_VAR
+END_FUNCTION_BLOCK
+FUNCTION_BLOCK CTD
+VAR_INPUT
+    CD : BOOL;
+    LD : BOOL;
+    PV : INT;
+END_VAR
+VAR_OUTPUT
+    Q : BOOL;
+    CV : INT;
+END_VAR
+END_FUNCTION_BLOCK
+FUNCTION_BLOCK CTUD
+VAR_INPUT
+    CU : BOOL;
+    CD : BOOL;
+    R : BOOL;
+    LD : BOOL;
+    PV : INT;
+END_VAR
+VAR_OUTPUT
+    QU : BOOL;
+    QD : BOOL;
+    CV : INT;
+END_VAR
+END_FUNCTION_BLOCK
+FUNCTION_BLOCK R_TRIG
+VAR_INPUT
+    CLK : BOOL;
+END_VAR
+VAR_OUTPUT
+    Q : BOOL;
+END_VAR
+END_FUNCTION_BLOCK
+FUNCTION_BLOCK F_TRIG
+VAR_INPUT
+    CLK : BOOL;
+END_VAR
+VAR_OUTPUT
+    Q : BOOL;
+END_VAR
+END_FUNCTION_BLOCK
+"""
+
+ARRAY_PATTERN = re.compile(r"ARRAY\s*\[.*?\]\s*OF\s+(.*)", re.IGNORECASE | re.DOTALL)
+
+
+@lru_cache(maxsize=4096)
+def type_parts(data_type: str) -> tuple[str, int]:
+    """(name of the element type without quotes, number of ARRAY levels) of a data type."""
+    dimensions = 0
+    while True:
+        match = ARRAY_PATTERN.fullmatch(data_type)
+        if match is None:
+            return data_type.strip('"'), dimensions
+        data_type = match.group(1).strip()
+        dimensions += 1
+
+
+def _segment(segment: str) -> tuple[str, int]:
+    # "name[][]" -> ("name", 2)
+    name = segment.split("[", 1)[0]
+    return name, segment.count("[]")
+
+
+class TypeResolver:
+    """Members of variables whose type is a UDT, an FB or an array of them.
+
+    Type names are looked up in the workspace index and a few built-in FBs.
+    The member tree of a type is the VariableNode tree of its unit, built
+    once per unit (UnitSymbols.interface) and shared by every variable of
+    that type, so thousands of instances of a UDT don't copy it. Array
+    elements are reached through "[]" segments of a path.
+    """
+
+    def __init__(self):
+        self._builtins = None  # upper case name -> UnitSymbols
+
+    def unit(self, name: str) -> UnitSymbols | None:
+        unit = workspace_index.units.get(name)
+        if unit is not None:
+            return unit
+        if self._builtins is None:
+            self._builtins = {unit.name.upper(): unit for unit in scan_units(LexedDocument.from_text(BUILTIN_SOURCE))}
+        return self._builtins.get(name.upper())
+
+    def members(self, target, indexed: int = 0) -> Mapping[str, VariableNode] | None:
+        """Members of a VariableNode (with `indexed` array indexes applied) or of a
+        global DB's UnitSymbols; None if it has none or its type is unknown."""
+        if isinstance(target, UnitSymbols):
+            return target.variables if not indexed else None
+        name, dimensions = type_parts(target.data_type)
+        if indexed != dimensions:
+            return None
+        if name == "STRUCT":
+            return target.children
+        unit = self.unit(name)
+        return unit.interface if unit is not None else None
+
+    def resolve(self, variables: Mapping[str, VariableNode], path: str):
+        """(VariableNode or global DB, number of trailing "[]") at a path, or None.
+
+        The first segment is looked up in `variables`, then in the global DBs.
+        """
+        segments = path.split(".")
+        name, indexed = _segment(segments[0])
+        target = variables.get(name)
+        if target is None:
+            target = workspace_index.global_units.get(name)
+            if target is None:
+                return None
+        for segment in segments[1:]:
+            members = self.members(target, indexed)
+            if members is None:
+                return None
+            name, indexed = _segment(segment)
+            target = members.get(name)
+            if target is None:
+                return None
+        return target, indexed
+
+    def scope(self, variables: Mapping[str, VariableNode], path: str) -> Mapping[str, VariableNode] | None:
+        """Members of what `path` names, for completing "path."."""
+        found = self.resolve(variables, path)
+        return self.members(*found) if found is not None else None
+
+
+type_resolver = TypeResolver()
@@ -0,0 +1,399 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import sys
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from lexer import COMMENT, IDENT, QUOTED_IDENT, LexedDocument
+from memory_manager import DECLARATION_BYTES, memory
+from parser_body import UNIT_ENDS, UNIT_STARTS
+from parser_structured import StructuredSCLParser, VariableNode, declaration_paths
+from settings import settings
+from syntax_keywords import SCL_KEYWORDS
+from telemetry import telemetry
+
+logger = logging.getLogger(__name__)
+
+CACHE_VERSION = 3
+SCL_EXTENSIONS = (".scl",)
+# Below this many files to parse, starting worker processes costs more than it saves
+POOL_MIN_FILES = 64
+
+
+class UnitSymbols:
+    """Declarations of one program unit (FUNCTION_BLOCK, DATA_BLOCK, TYPE, ...) of a file.
+
+    Only the declaration records are kept; the VariableNode tree is built on
+    first use, so an index of thousands of files stays small, and dropped
+    again by the memory manager when it wasn't used for a while.
+    """
+
+    def __init__(self, kind: str, name: str, line: int, records: list, column: int = 0, positions: list = ()):
+        self.kind = kind
+        self.name = name  # without quotes
+        self.line = line
+        self.column = column  # of the name
+        self.records = records
+        self.positions = positions  # [line, column] of the name of each record
+        self.path = None  # file declaring the unit, set by FileSymbols
+        self._parser = None
+        self._interface = None
+
+    @property
+    def parser(self) -> StructuredSCLParser:
+        parser = self._parser
+        if parser is None:
+            parser = self._parser = StructuredSCLParser.from_declarations(self.records)
+            memory.track(self, "parser", len(self.records) * DECLARATION_BYTES, UnitSymbols.release)
+        else:
+            memory.touch(self)
+        return parser
+
+    def release(self):
+        self._parser = None
+        self._interface = None
+
+    @property
+    def variables(self) -> dict[str, VariableNode]:
+        return self.parser.variables
+
+    @property
+    def interface(self) -> dict[str, VariableNode]:
+        """Members reachable through a variable of this unit's type: all of a
+        TYPE or DATA_BLOCK, the parameters and statics of a FUNCTION_BLOCK."""
+        variables = self.variables
+        if self.kind != "FUNCTION_BLOCK":
+            return variables if self.kind in ("TYPE", "DATA_BLOCK") else {}
+        interface = self._interface
+        if interface is None:
+            interface = self._interface = {
+                name: node for name, node in variables.items() if node.var_type not in ("temporary", "constant")
+            }
+        return interface
+
+    def declaration(self, path: tuple) -> tuple[int, int] | None:
+        """(line, column) of the declaration at a path of names, the last one of duplicates."""
+        found = None
+        for i, record_path in declaration_paths(self.records):
+            if record_path == path and i < len(self.positions):
+                found = tuple(self.positions[i])
+        return found
+
+    def to_cache(self) -> list:
+        return [self.kind, self.name, self.line, self.records, self.column, self.positions]
+
+    @classmethod
+    def from_cache(cls, entry: list) -> "UnitSymbols":
+        return cls(*entry)
+
+
+class FileSymbols:
+    """Units declared in one file, keyed for the cache by path, mtime, size and content hash.
+
+    `words` are the identifiers used anywhere in the file, to find the files
+    that may reference a symbol without reading them all.
+    """
+
+    def __init__(self, path: str, mtime: int, size: int, digest: str, units: list[UnitSymbols], words: tuple = ()):
+        self.path = path
+        self.mtime = mtime
+        self.size = size
+        self.digest = digest
+        self.units = units
+        self.words = words
+        for unit in units:
+            unit.path = path
+
+    def to_cache(self) -> list:
+        return [self.mtime, self.size, self.digest, [unit.to_cache() for unit in self.units], list(self.words)]
+
+    @classmethod
+    def from_cache(cls, path: str, entry: list) -> "FileSymbols":
+        mtime, size, digest, units, words = entry
+        return cls(path, mtime, size, digest, [UnitSymbols.from_cache(unit) for unit in units],
+                   tuple(sys.intern(word) for word in words))
+
+
+def scan_units(lexed: LexedDocument) -> list[UnitSymbols]:
+    """Split a document into its program units and parse the declarations of each."""
+    units = []
+    header = None  # (kind, name, first line)
+
+    def close(end: int):
+        kind, name, start, column = header
+        parser = StructuredSCLParser()
+        parser.parse_lexed(lexed.section(start, end))
+        positions = []
+        for i, record in enumerate(parser._records):
+            if record is not None:
+                code = lexed.code_tokens(start + i)
+                positions.append([start + i, code[0][1] if code else 0])
+        units.append(UnitSymbols(kind, name, start, parser.declarations(), column, positions))
+
+    for i, line in enumerate(lexed.lines):
+        code = [t for t in lexed.tokens[i] if t[0] != COMMENT]
+        if not code or code[0][0] != IDENT:
+            continue
+        first = line[code[0][1]:code[0][2]].upper()
+        if first in UNIT_STARTS and len(code) > 1 and code[1][0] in (IDENT, QUOTED_IDENT):
+            if header is not None:
+                close(i)
+            quoted = code[1][0] == QUOTED_IDENT
+            header = (first, line[code[1][1]:code[1][2]].strip('"'), i, code[1][1] + quoted)
+        elif first in UNIT_ENDS and header is not None:
+            close(i + 1)
+            header = None
+    if header is not None:
+        close(len(lexed.lines))
+    return units
+
+
+def index_file(path: str, data: bytes | None = None, stat: os.stat_result | None = None) -> FileSymbols:
+    if stat is None:
+        stat = os.stat(path)
+    if data is None:
+        with open(path, "rb") as f:
+            data = f.read()
+    lexed = LexedDocument.from_text(data.decode("utf-8-sig", errors="replace"))
+    return FileSymbols(path, stat.st_mtime_ns, stat.st_size, _digest(data), scan_units(lexed), scan_words(lexed))
+
+
+def scan_words(lexed: LexedDocument) -> tuple[str, ...]:
+    """Identifiers (quoted ones without quotes) of a document, except keywords, sorted."""
+    words = set()
+    for line, tokens in zip(lexed.lines, lexed.tokens):
+        for kind, start, end in tokens:
+            if kind == IDENT:
+                words.add(line[start:end])
+            elif kind == QUOTED_IDENT:
+                words.add(line[start:end].strip('"'))
+    return tuple(sorted(sys.intern(word) for word in words if word.upper() not in SCL_KEYWORDS))
+
+
+def find_scl_files(roots: list[str]) -> list[str]:
+    paths = []
+    for root in roots:
+        for directory, dirnames, filenames in os.walk(root):
+            dirnames[:] = [d for d in dirnames if not d.startswith(".") and d != "node_modules"]
+            paths += [
+                os.path.join(directory, name) for name in filenames
+                if name.lower().endswith(SCL_EXTENSIONS)
+            ]
+    return sorted(paths)
+
+
+class WorkspaceIndex:
+    """Symbols of all .scl files of the workspace, built in a background thread.
+
+    The index is persisted to a gzipped JSON cache file so a restart only
+    re-parses files whose mtime/size changed and whose content hash differs
+    from the cache.
+    Readers on the event loop see `files` and `units` swapped in whole after
+    each (re)build.
+    """
+
+    def __init__(self):
+        self._executor = None
+        self._roots = []
+        self.files = {}  # path -> FileSymbols
+        self.units = {}  # unit name -> UnitSymbols
+        self.global_units = {}  # global DB name -> UnitSymbols
+        self.generation = 0  # incremented whenever the symbols are swapped
+        self.global_names = frozenset()  # names usable as variables from any unit (global DBs)
+        self._users = None  # word -> paths of the files using it, built on first use
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="scl-index")
+        return self._executor
+
+    def start(self, roots: list[str], progress=None) -> Future:
+        """Index every .scl file under `roots`; the future completes when the index is ready.
+
+        `progress(done, total)` is called from the indexing thread as files are indexed.
+        """
+        self._roots = [root for root in roots if root and os.path.isdir(root)]
+        return self.executor.submit(self._build, progress)
+
+    def update(self, changed: list[str], deleted: list[str]) -> Future:
+        """Re-index changed (or created) files and drop deleted ones."""
+        return self.executor.submit(self._update, changed, deleted)
+
+    @telemetry.timed("workspace_index.build")
+    def _build(self, progress=None):
+        cache = self._load_cache()
+        paths = find_scl_files(self._roots)
+        files = {}
+        pending = []
+        touched = 0
+        for path in paths:
+            try:
+                stat = os.stat(path)
+                cached = cache.get(path)
+                if cached is not None and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+                    files[path] = FileSymbols.from_cache(path, cached)
+                    continue
+                if cached is not None:
+                    with open(path, "rb") as f:
+                        data = f.read()
+                    if cached[2] == _digest(data):
+                        # Touched but unchanged
+                        files[path] = FileSymbols.from_cache(path, cached)
+                        files[path].mtime, files[path].size = stat.st_mtime_ns, stat.st_size
+                        touched += 1
+                        continue
+                pending.append(path)
+            except OSError:
+                logger.exception("Failed to index %s", path)
+
+        done = len(paths) - len(pending)
+        if progress is not None:
+            progress(done, len(paths))
+        for path, entry in self._parse_files(pending):
+            if entry is None:
+                logger.error("Failed to index %s", path)
+            else:
+                files[path] = FileSymbols.from_cache(path, entry)
+            done += 1
+            if progress is not None:
+                progress(done, len(paths))
+
+        self._publish({path: files[path] for path in paths if path in files})
+        telemetry.count("workspace_index.hit", len(files) - len(pending))
+        telemetry.count("workspace_index.miss", len(pending))
+        logger.info("Indexed %d files (%d parsed, %d from cache)", len(files), len(pending), len(files) - len(pending))
+        if pending or touched or len(files) != len(cache):
+            self._save_cache()
+
+    def _parse_files(self, paths: list[str]):
+        """Yield (path, cache entry or None) for every path, in order.
+
+        Large batches are parsed in worker processes, which only send back the
+        compact cache entries.
+        """
+        workers = settings.index_workers or max(1, (os.cpu_count() or 1) - 1)
+        parsed = 0
+        if workers > 1 and len(paths) >= POOL_MIN_FILES:
+            # Only needed for a cold index, so not imported at startup
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            from concurrent.futures.process import BrokenProcessPool
+            chunksize = max(1, min(32, len(paths) // (workers * 4)))
+            try:
+                # Not forked: this runs in the indexing thread of a process with other threads
+                with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+                    for entry in pool.map(_index_entry, paths, chunksize=chunksize):
+                        yield paths[parsed], entry
+                        parsed += 1
+            except (BrokenProcessPool, OSError):
+                logger.warning("Index worker processes failed, indexing in-process", exc_info=True)
+        for path in paths[parsed:]:
+            yield path, _index_entry(path)
+
+    @telemetry.timed("workspace_index.update")
+    def _update(self, changed: list[str], deleted: list[str]):
+        files = dict(self.files)
+        for path in deleted:
+            files.pop(path, None)
+        for path in changed:
+            try:
+                files[path] = index_file(path)
+            except OSError:
+                files.pop(path, None)
+        self._publish(files)
+        self._save_cache()
+
+    def _publish(self, files: dict[str, FileSymbols]):
+        units = {}
+        for file_symbols in files.values():
+            for unit in file_symbols.units:
+                units.setdefault(unit.name, unit)
+        global_units = {name: unit for name, unit in units.items() if unit.kind == "DATA_BLOCK"}
+        replaced = [file_symbols for path, file_symbols in self.files.items() if files.get(path) is not file_symbols]
+        self.files = files
+        self.units = units
+        self.global_units = global_units
+        self.global_names = frozenset(global_units)
+        self._users = None
+        self.generation += 1
+        # The node trees of the units of changed and deleted files
+        for file_symbols in replaced:
+            for unit in file_symbols.units:
+                memory.forget(unit)
+
+    def files_using(self, word: str) -> list[str]:
+        """Paths of the indexed files in which the identifier `word` occurs."""
+        users = self._users
+        if users is None:
+            users = {}
+            for path, file_symbols in self.files.items():
+                for name in file_symbols.words:
+                    users.setdefault(name, []).append(path)
+            self._users = users
+        return users.get(word, [])
+
+    @property
+    def cache_path(self) -> str | None:
+        if not self._roots:
+            return None
+        directory = settings.index_cache_dir or os.path.join(
+            os.environ.get("LOCALAPPDATA") or os.environ.get("XDG_CACHE_HOME")
+            or os.path.join(os.path.expanduser("~"), ".cache"),
+            "scl-language-server",
+        )
+        key = hashlib.sha1("\n".join(self._roots).encode("utf-8")).hexdigest()[:16]
+        return os.path.join(directory, f"index-{key}.json.gz")
+
+    def _load_cache(self) -> dict:
+        path = self.cache_path
+        if path is None or not os.path.exists(path):
+            return {}
+        try:
+            with open(path, "rb") as f:
+                data = json.loads(gzip.decompress(f.read()))
+        except (OSError, EOFError, ValueError):
+            logger.warning("Ignoring unreadable index cache %s", path)
+            return {}
+        if not isinstance(data, dict) or data.get("version") != CACHE_VERSION:
+            return {}
+        return data.get("files", {})
+
+    def _save_cache(self):
+        path = self.cache_path
+        if path is None:
+            return
+        data = {
+            "version": CACHE_VERSION,
+            "files": {path: file_symbols.to_cache() for path, file_symbols in self.files.items()},
+        }
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temporary = f"{path}.{os.getpid()}.tmp"
+            with open(temporary, "wb") as f:
+                f.write(gzip.compress(json.dumps(data, separators=(",", ":")).encode("utf-8"), compresslevel=6))
+            os.replace(temporary, path)
+        except OSError:
+            logger.warning("Failed to write index cache %s", path, exc_info=True)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+def _index_entry(path: str) -> list | None:
+    # Runs in the worker processes of WorkspaceIndex._parse_files
+    try:
+        return index_file(path).to_cache()
+    except (OSError, ValueError):
+        return None
+
+
+def _digest(data: bytes) -> str:
+    return hashlib.sha1(data).hexdigest()
+
+
+workspace_index = WorkspaceIndex()